@@ -1,10 +1,15 @@
-import requests
-import json
-import base64
-from fastapi import APIRouter, Request
-from core.config import OR_MANAGER_URL, DEFAULT_REALM
-from core.auth import get_valid_token, get_admin_token
-from core.utils import load_preferences, save_preferences
+from fastapi import APIRouter, Request, Response
+from core import upstream
+from core.config import OR_MANAGER_URL, DEFAULT_REALM, FRIENDLY_NAMES_MAX_AGE, BULK_CONTROL_MAX_COMMANDS
+from core.auth import get_valid_token, admin_request, current_user_id
+from core.cache import UpstreamError
+from core.snapshots import flatten_asset, to_user_asset, get_user_assets_snapshot, get_asset_snapshot, invalidate_asset, invalidate_user
+from core import preferences
+from core.links import record_link, record_unlink
+from core.registry import config_registry
+from core.timers import update_timer
+from core.asset_patch import patch_asset, PatchConflict
+from core.relays import set_relays
 
 router = APIRouter(prefix="/api", tags=["assets"])
 
@@ -12,20 +17,19 @@ router = APIRouter(prefix="/api", tags=["assets"])
 async def get_preferences(request: Request):
     user_id = request.session.get("user_id")
     if not user_id: return {}
-    prefs = load_preferences()
-    return prefs.get(user_id, {})
+    return await preferences.get_user_preferences(user_id)
 
 @router.get("/friendly-names")
-async def get_friendly_names_api():
-    try:
-        from core.config import FRIENDLY_NAMES_FILE
-        import os
-        if os.path.exists(FRIENDLY_NAMES_FILE):
-            with open(FRIENDLY_NAMES_FILE, "r") as f:
-                return json.load(f)
-    except Exception as e:
-        print(f"[API] Error loading friendly names: {e}")
-    return {"attributes": {}, "keys": {}}
+async def get_friendly_names_api(request: Request):
+    entry = config_registry.entry("friendly_names")
+    headers = {
+        "ETag": entry.etag,
+        "Cache-Control": f"public, max-age={FRIENDLY_NAMES_MAX_AGE}, must-revalidate",
+    }
+    if_none_match = request.headers.get("if-none-match", "")
+    if entry.etag in [t.strip() for t in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
 
 @router.post("/user/preferences/pin")
 async def pin_attribute(request: Request, payload: dict):
@@ -39,26 +43,8 @@ async def pin_attribute(request: Request, payload: dict):
     
     if not asset_id or not attr_name: return {"status": "error"}
     
-    prefs = load_preferences()
-    if user_id not in prefs: prefs[user_id] = {"pinned": []}
-    if "pinned" not in prefs[user_id]: prefs[user_id]["pinned"] = []
-    
-    exists = False
-    for item in prefs[user_id]["pinned"]:
-        if item["assetId"] == asset_id and item["attributeName"] == attr_name:
-            if item.get("key") == key:
-                exists = True
-                prefs[user_id]["pinned"].remove(item)
-                break
-    
-    if not exists:
-        new_pin = {"assetId": asset_id, "attributeName": attr_name}
-        if key: new_pin["key"] = key
-        if display_name: new_pin["displayName"] = display_name
-        prefs[user_id]["pinned"].append(new_pin)
-        
-    save_preferences(prefs)
-    return {"status": "success", "pinned": not exists}
+    pinned = await preferences.toggle_pin(user_id, asset_id, attr_name, key, display_name)
+    return {"status": "success", "pinned": pinned}
 
 @router.post("/user/preferences/pin/rename")
 async def rename_pin(request: Request, payload: dict):
@@ -72,81 +58,53 @@ async def rename_pin(request: Request, payload: dict):
     
     if not asset_id or not attr_name: return {"status": "error"}
     
-    prefs = load_preferences()
-    if user_id not in prefs or "pinned" not in prefs[user_id]:
-        return {"status": "error", "message": "No pins found"}
-    
-    for item in prefs[user_id]["pinned"]:
-        if item["assetId"] == asset_id and item["attributeName"] == attr_name and item.get("key") == key:
-            if display_name.strip():
-                item["displayName"] = display_name.strip()
-            elif "displayName" in item:
-                del item["displayName"]
-            save_preferences(prefs)
-            return {"status": "success"}
+    if await preferences.rename_pin(user_id, asset_id, attr_name, key, display_name):
+        return {"status": "success"}
     return {"status": "error", "message": "Pin not found"}
 
 @router.get("/user/dashboard/widgets")
 async def get_dashboard_widgets(request: Request):
     realm = request.session.get("realm", DEFAULT_REALM)
     user_id = request.session.get("user_id")
-    access_token = get_valid_token(request)
+    access_token = await get_valid_token(request)
     if not user_id or not access_token: return []
     
-    prefs = load_preferences()
-    user_prefs = prefs.get(user_id, {})
-    pinned = user_prefs.get("pinned", [])
+    pinned = await preferences.get_pins(user_id)
     if not pinned: return []
     
-    headers = {"Authorization": f"Bearer {access_token}"}
     widgets = []
     try:
-        # Get the list of assets actually linked to this user
-        linked_assets_url = f"{OR_MANAGER_URL}/api/{realm}/asset/user/current"
-        linked_res = requests.get(linked_assets_url, headers=headers)
-        linked_asset_ids = set()
-        if linked_res.status_code == 200:
-            linked_assets = linked_res.json()
-            linked_asset_ids = set(a["id"] for a in linked_assets)
-        
-        # Filter pinned items to only include assets that are linked to user
-        valid_pinned = [p for p in pinned if p["assetId"] in linked_asset_ids]
-        
-        # Clean up orphaned pins
-        if len(valid_pinned) < len(pinned):
-            prefs[user_id]["pinned"] = valid_pinned
-            save_preferences(prefs)
-            pinned = valid_pinned
+        # One bulk query: the user's linked assets already carry every attribute,
+        # so pins resolve against it without a per-asset GET
+        linked_assets = await get_user_assets_snapshot(realm, user_id, access_token)
+        assets_by_id = {a["id"]: a for a in linked_assets}
         
-        if not pinned: return []
-        
-        unique_asset_ids = list(set([p["assetId"] for p in pinned]))
-        assets_cache = {}
-        for aid in unique_asset_ids:
-            res = requests.get(f"{OR_MANAGER_URL}/api/{realm}/asset/{aid}", headers=headers)
-            if res.status_code == 200:
-                assets_cache[aid] = res.json()
+        # Only show pins for assets linked to the user. The snapshot may be
+        # stale, so pins are never deleted here; unlinking removes them.
+        pinned = [p for p in pinned if p["assetId"] in assets_by_id]
         
         for p in pinned:
             aid = p["assetId"]
             aname = p["attributeName"]
-            if aid in assets_cache:
-                asset = assets_cache[aid]
-                val = "N/A"
-                if "attributes" in asset and aname in asset["attributes"]:
-                    attr_obj = asset["attributes"][aname]
-                    raw_val = attr_obj.get("value", "N/A")
-                    target_key = p.get("key")
-                    val = raw_val.get(target_key, "N/A") if target_key and isinstance(raw_val, dict) else raw_val
-                
-                widgets.append({
-                    "assetId": aid,
-                    "assetName": asset.get("name", "Unknown"),
-                    "attributeName": aname,
-                    "key": p.get("key"),
-                    "displayName": p.get("displayName"),
-                    "value": val
-                })
+            asset = assets_by_id[aid]
+            val = "N/A"
+            attr_obj = asset.get("attributes", {}).get(aname)
+            if attr_obj is not None:
+                raw_val = attr_obj.get("value", "N/A")
+                target_key = p.get("key")
+                val = raw_val.get(target_key, "N/A") if target_key and isinstance(raw_val, dict) else raw_val
+            
+            widgets.append({
+                "assetId": aid,
+                "assetName": asset.get("name", "Unknown"),
+                "attributeName": aname,
+                "key": p.get("key"),
+                "displayName": p.get("displayName"),
+                "value": val
+            })
+    except UpstreamError:
+        # Leave pins untouched when the manager is unavailable
+        pass
     except Exception as e:
         print(f"[WIDGETS] Error: {e}")
     return widgets
@@ -154,72 +112,19 @@ async def get_dashboard_widgets(request: Request):
 @router.get("/user/assets")
 async def get_user_assets(request: Request):
     realm = request.session.get("realm", DEFAULT_REALM)
-    access_token = get_valid_token(request)
+    access_token = await get_valid_token(request)
     if not access_token: return []
 
-    headers = {"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"}
     try:
-        user_uuid = None
-        parts = access_token.split(".")
-        if len(parts) > 1:
-            payload_b64 = parts[1]
-            payload_b64 += "=" * ((4 - len(payload_b64) % 4) % 4)
-            payload_json = base64.urlsafe_b64decode(payload_b64).decode()
-            user_uuid = json.loads(payload_json).get("sub")
-
+        user_uuid = request.state.claims.get("sub")
         if not user_uuid: return {"assets": [], "error": "Could not extract User ID"}
 
-        url = f"{OR_MANAGER_URL}/api/{realm}/asset/user/current"
-        res = requests.get(url, headers=headers)
-        if res.status_code != 200: return {"assets": [], "error": f"Error: {res.status_code}"}
-            
-        all_assets = res.json()
-        final_assets = []
-        for a in all_assets:
-            flat_attrs = {}
-            last_activity_ts = None
-            if "attributes" in a:
-                for k, v in a["attributes"].items():
-                    if isinstance(v, dict) and "value" in v:
-                        val = v["value"]
-                        ts = v.get("timestamp")
-                        
-                        # Inject timestamp for Rules and Timers
-                        if k == "RuleTargets" or k.startswith("Timer"):
-                            if isinstance(val, str):
-                                try:
-                                    parsed = json.loads(val)
-                                    if isinstance(parsed, dict):
-                                        val = parsed
-                                except:
-                                    pass
-                            
-                            if isinstance(val, dict) and ts:
-                                val["_timestamp"] = ts
+        try:
+            all_assets = await get_user_assets_snapshot(realm, user_uuid, access_token)
+        except UpstreamError as e:
+            return {"assets": [], "error": f"Error: {e.status_code}"}
 
-                        flat_attrs[k] = val
-                        
-                        # MoistureData for Activity Detection
-                        if ts and k == "MoistureData":
-                            if last_activity_ts is None or ts > last_activity_ts:
-                                last_activity_ts = ts
-                    else:
-                        flat_attrs[k] = v
-            
-            loc = None
-            if "location" in flat_attrs and isinstance(flat_attrs["location"], dict):
-                 coords = flat_attrs["location"].get("coordinates")
-                 if coords: loc = [coords[1], coords[0]]
-            
-            final_assets.append({
-                "id": a["id"],
-                "name": a.get("name", "Unnamed"),
-                "type": a.get("type", "Asset"),
-                "attributes": flat_attrs,
-                "location": loc,
-                "lastActivityTimestamp": last_activity_ts
-            })
-        return {"assets": final_assets}
+        return {"assets": [to_user_asset(a) for a in all_assets]}
     except Exception as e:
         print(f"[API] Error: {e}")
         return {"assets": [], "error": str(e)}
@@ -227,66 +132,61 @@ async def get_user_assets(request: Request):
 @router.get("/asset/{id}")
 async def get_single_asset(request: Request, id: str):
     realm = request.session.get("realm", DEFAULT_REALM)
-    access_token = get_valid_token(request)
+    access_token = await get_valid_token(request)
     if not access_token: return {}
-    headers = {"Authorization": f"Bearer {access_token}"}
-    url = f"{OR_MANAGER_URL}/api/{realm}/asset/{id}"
-    res = requests.get(url, headers=headers)
-    if res.status_code == 200:
-        a = res.json()
-        flat_attrs = {}
-        last_activity_ts = None
-        if "attributes" in a:
-            for k, v in a["attributes"].items():
-                if isinstance(v, dict) and "value" in v:
-                    val = v["value"]
-                    ts = v.get("timestamp")
-
-                    # Inject timestamp for Rules and Timers
-                    if k == "RuleTargets" or k.startswith("Timer"):
-                        if isinstance(val, str):
-                            try:
-                                parsed = json.loads(val)
-                                if isinstance(parsed, dict):
-                                    val = parsed
-                            except:
-                                pass
-                        
-                        if isinstance(val, dict) and ts:
-                            val["_timestamp"] = ts
-
-                    flat_attrs[k] = val
-
-                    # MoistureData for Activity Detection per user request
-                    if ts and k == "MoistureData":
-                        if last_activity_ts is None or ts > last_activity_ts:
-                            last_activity_ts = ts
-                else:
-                    flat_attrs[k] = v
-        return {
-            "id": a["id"],
-            "name": a.get("name", "Unnamed"),
-            "type": a.get("type", "Asset"),
-            "attributes": flat_attrs,
-            "lastActivityTimestamp": last_activity_ts
-        }
-    return {}
+    user_id = current_user_id(request)
+    try:
+        a = await get_asset_snapshot(realm, id, user_id, access_token)
+    except UpstreamError:
+        return {}
+    flat_attrs, last_activity_ts = flatten_asset(a)
+    return {
+        "id": a["id"],
+        "name": a.get("name", "Unnamed"),
+        "type": a.get("type", "Asset"),
+        "attributes": flat_attrs,
+        "lastActivityTimestamp": last_activity_ts
+    }
 
 @router.post("/asset/{asset_id}/attribute/{attr_name}")
 async def update_asset_attribute_api(request: Request, asset_id: str, attr_name: str, payload: dict):
     realm = request.session.get("realm", DEFAULT_REALM)
-    access_token = get_valid_token(request)
+    access_token = await get_valid_token(request)
     if not access_token: return {"status": "error", "message": "Not authenticated"}
     
     value = payload.get("value")
     headers = {"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"}
     url = f"{OR_MANAGER_URL}/api/{realm}/asset/{asset_id}/attribute/{attr_name}"
     try:
-        res = requests.put(url, json=value, headers=headers, verify=False)
-        return {"status": "success"} if res.status_code in [200, 204] else {"status": "error", "message": res.text}
+        res = await upstream.put(url, json=value, headers=headers)
+        invalidate_asset(realm, asset_id)
+        if res.status_code in [200, 204]:
+            update_timer(realm, asset_id, attr_name, value)
+            return {"status": "success"}
+        return {"status": "error", "message": res.text}
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
+@router.post("/relays/bulk")
+async def bulk_relays_api(request: Request, payload: dict):
+    """
+    Switches many relays in one call. Body: {"commands": [{"assetId", "key", "state"}],
+    "force": bool}. Changes are merged into one RelayData write per asset; a command
+    without "state" keeps the relay's current value.
+    """
+    realm = request.session.get("realm", DEFAULT_REALM)
+    access_token = await get_valid_token(request)
+    if not access_token: return {"status": "error", "message": "Not authenticated"}
+    user_id = current_user_id(request)
+    commands = payload.get("commands") or []
+    if not isinstance(commands, list): return {"status": "error", "message": "commands must be a list"}
+    if len(commands) > BULK_CONTROL_MAX_COMMANDS:
+        return {"status": "error", "message": f"At most {BULK_CONTROL_MAX_COMMANDS} commands per request"}
+    results = await set_relays(realm, user_id, access_token, commands, force=bool(payload.get("force")))
+    failed = sum(1 for r in results if r["status"] != "success")
+    status = "success" if not failed else ("error" if failed == len(results) else "partial")
+    return {"status": status, "results": results}
+
 @router.post("/user/assets")
 async def link_user_asset_api(request: Request, payload: dict):
     realm = request.session.get("realm", DEFAULT_REALM)
@@ -294,12 +194,13 @@ async def link_user_asset_api(request: Request, payload: dict):
     asset_id = payload.get("assetId")
     if not user_id or not asset_id: return {"status": "error", "message": "Missing data"}
     
-    admin_token = get_admin_token(realm)
     link_url = f"{OR_MANAGER_URL}/api/master/asset/user/link"
-    headers = {"Authorization": f"Bearer {admin_token}", "Content-Type": "application/json"}
     body = [{"id": {"realm": realm, "userId": user_id, "assetId": asset_id}}]
     try:
-        res = requests.post(link_url, json=body, headers=headers)
+        res = await admin_request(realm, "POST", link_url, json=body)
+        if res is None: return {"status": "error", "message": "Admin token failed"}
+        invalidate_user(realm, user_id)
+        if res.status_code in [200, 204]: record_link(realm, user_id, asset_id)
         return {"status": "success"} if res.status_code in [200, 204] else {"status": "error", "message": f"OR API Error: {res.status_code}"}
     except Exception as e:
         return {"status": "error", "message": str(e)}
@@ -307,17 +208,47 @@ async def link_user_asset_api(request: Request, payload: dict):
 @router.put("/user/assets/{asset_id}")
 async def update_user_asset_api(request: Request, asset_id: str, payload: dict):
     realm = request.session.get("realm", DEFAULT_REALM)
-    access_token = get_valid_token(request)
+    access_token = await get_valid_token(request)
     if not access_token: return {"status": "error", "message": "Unauthorized"}
-    headers = {"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"}
+    if not payload.get("name"): return {"status": "success"}
+    user_id = current_user_id(request)
+    try:
+        await patch_asset(realm, asset_id, user_id, access_token, name=payload.get("name"), version=payload.get("version"))
+        return {"status": "success"}
+    except PatchConflict as e:
+        return {"status": "conflict", "message": str(e)}
+    except UpstreamError:
+        return {"status": "error", "message": "Update failed"}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+@router.patch("/asset/{asset_id}")
+async def patch_asset_api(request: Request, asset_id: str, payload: dict):
+    """
+    Partial asset update. Body:
+    {"attributes": {name: {"value": v} | {"set": {key: v}, "unset": [key]}},
+     "expect": {name: timestamp}, "name": str, "version": int}
+    """
+    realm = request.session.get("realm", DEFAULT_REALM)
+    access_token = await get_valid_token(request)
+    if not access_token: return {"status": "error", "message": "Not authenticated"}
+    user_id = current_user_id(request)
+    attributes = payload.get("attributes") or {}
+    if not isinstance(attributes, dict) or not all(isinstance(c, dict) for c in attributes.values()):
+        return {"status": "error", "message": "Invalid attributes"}
     try:
-        get_res = requests.get(f"{OR_MANAGER_URL}/api/{realm}/asset/{asset_id}", headers=headers)
-        if get_res.status_code != 200: return {"status": "error", "message": "Fetch failed"}
-        asset_data = get_res.json()
-        if payload.get("name"): asset_data["name"] = payload.get("name")
-        put_res = requests.put(f"{OR_MANAGER_URL}/api/{realm}/asset/{asset_id}", json=asset_data, headers=headers, verify=False)
-        return {"status": "success"} if put_res.status_code in [200, 204] else {"status": "error", "message": "Update failed"}
+        changed = await patch_asset(
+            realm, asset_id, user_id, access_token,
+            name=payload.get("name"), attributes=attributes,
+            expect=payload.get("expect"), version=payload.get("version")
+        )
+        return {"status": "success", "changed": changed}
+    except PatchConflict as e:
+        return {"status": "conflict", "message": str(e), "current": e.current}
+    except UpstreamError as e:
+        return {"status": "error", "message": str(e)}
     except Exception as e:
+        print(f"[API] Patch error for {asset_id}: {e}")
         return {"status": "error", "message": str(e)}
 
 @router.delete("/user/assets/{asset_id}")
@@ -325,19 +256,15 @@ async def unlink_user_asset_api(request: Request, asset_id: str):
     realm = request.session.get("realm", DEFAULT_REALM)
     user_id = request.session.get("user_id")
     if not user_id or not asset_id: return {"status": "error"}
-    admin_token = get_admin_token(realm)
-    headers = {"Authorization": f"Bearer {admin_token}"}
     url = f"{OR_MANAGER_URL}/api/master/asset/user/link/{realm}/{user_id}/{asset_id}"
     try:
-        res = requests.delete(url, headers=headers)
+        res = await admin_request(realm, "DELETE", url)
+        if res is None: return {"status": "error", "message": "Admin token failed"}
+        invalidate_user(realm, user_id)
+        if res.status_code in [200, 204]: record_unlink(realm, user_id, asset_id)
         
         # Cleanup local preferences
-        prefs = load_preferences()
-        if user_id in prefs and "pinned" in prefs[user_id]:
-            original_count = len(prefs[user_id]["pinned"])
-            prefs[user_id]["pinned"] = [p for p in prefs[user_id]["pinned"] if p.get("assetId") != asset_id]
-            if len(prefs[user_id]["pinned"]) < original_count:
-                save_preferences(prefs)
+        await preferences.remove_asset_pins(user_id, [asset_id])
                 
         return {"status": "success"} if res.status_code in [200, 204] else {"status": "error", "message": f"OR API Error: {res.status_code}"}
     except Exception as e:
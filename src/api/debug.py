@@ -1,14 +1,30 @@
-import requests
 from fastapi import APIRouter, Request
+from core import upstream
 from core.config import OR_MANAGER_URL, DEFAULT_REALM, OR_HOSTNAME
-from core.auth import get_valid_token
+from core.auth import get_valid_token, admin_token_stats, user_refresh_stats, login_stats
+from core.snapshots import cache_stats as snapshot_cache_stats
+from core.live import live_stats
+from core.preferences import io_stats as preferences_io_stats
+from core.history_cache import history_cache_stats
+from core.directory import directory_cache
+from core.links import link_index_cache
+from core.registry import config_registry
+from core.rules_index import rules_index_cache
+from core.rule_compiler import compiler_stats
+from core.rule_engine import rule_engine
+from core.timers import timer_scheduler
+from core.asset_patch import patch_stats
+from core.relays import bulk_stats
+from core.tokens import token_stats
+from core.sessions import session_stats
+from core.keycloak_catalog import catalog_cache
 
 router = APIRouter(prefix="/api/debug", tags=["debug"])
 
 @router.post("/proxy")
 async def debug_proxy(request: Request, payload: dict):
     realm = request.session.get("realm", DEFAULT_REALM)
-    access_token = get_valid_token(request)
+    access_token = await get_valid_token(request)
     
     if not access_token:
         return {"status": 401, "data": "No access token found in session"}
@@ -29,13 +45,13 @@ async def debug_proxy(request: Request, payload: dict):
     try:
         if method == "GET":
             # Pass query params if any
-            res = requests.get(url, headers=headers)
+            res = await upstream.get(url, headers=headers)
         elif method == "POST":
-            res = requests.post(url, json=body, headers=headers)
+            res = await upstream.post(url, json=body, headers=headers)
         elif method == "PUT":
-            res = requests.put(url, json=body, headers=headers)
+            res = await upstream.put(url, json=body, headers=headers)
         elif method == "DELETE":
-            res = requests.delete(url, headers=headers)
+            res = await upstream.delete(url, headers=headers)
         else:
             return {"status": 400, "data": "Method not supported"}
             
@@ -70,3 +86,9 @@ async def debug_proxy(request: Request, payload: dict):
         return {"status": res.status_code, "data": data}
     except Exception as e:
         return {"status": 500, "data": str(e)}
+
+@router.get("/stats")
+async def debug_stats(request: Request):
+    if not await get_valid_token(request):
+        return {"status": 401, "data": "No access token found in session"}
+    return {"admin_token": admin_token_stats, "snapshots": snapshot_cache_stats(), "live": live_stats, "preferences": preferences_io_stats, "history_cache": history_cache_stats, "user_directory": directory_cache.stats, "link_index": link_index_cache.stats, "config": config_registry.stats(), "rules_index": rules_index_cache.stats, "rule_compiler": compiler_stats, "rule_engine": rule_engine.stats, "timers": timer_scheduler.stats, "asset_patch": patch_stats, "bulk_relays": bulk_stats, "tokens": token_stats, "user_token_refresh": user_refresh_stats(), "sessions": session_stats, "login": login_stats, "keycloak_catalog": catalog_cache.stats}
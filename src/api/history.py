@@ -0,0 +1,151 @@
+import json
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from core import upstream
+from core.cache import UpstreamError
+from core.config import OR_MANAGER_URL, DEFAULT_REALM, OR_HOSTNAME
+from core.auth import get_valid_token, current_user_id
+from core.snapshots import get_user_assets_snapshot
+from core import history_cache
+from core.downsample import METHODS
+
+router = APIRouter(prefix="/api/history", tags=["history"])
+
+def _to_number(value, key=None):
+    """Converts a datapoint value (optionally a key of a JSON object value) to a float, or None."""
+    if key:
+        if isinstance(value, str):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                return None
+        value = value.get(key) if isinstance(value, dict) else None
+    if isinstance(value, bool):
+        return 1.0 if value else 0.0
+    if value in ("true", "false"):
+        return 1.0 if value == "true" else 0.0
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+async def fetch_datapoints(realm, access_token, asset_id, attribute_name, from_ts, to_ts):
+    """Raw datapoints from the manager as a list of {"x": timestamp, "y": value}."""
+    url = f"{OR_MANAGER_URL}/api/{realm}/asset/datapoint/{asset_id}/{attribute_name}"
+    headers = {
+        "Authorization": f"Bearer {access_token}",
+        "Content-Type": "application/json",
+        "Host": OR_HOSTNAME
+    }
+    body = {"fromTimestamp": from_ts, "toTimestamp": to_ts, "type": "json"}
+    res = await upstream.post(url, json=body, headers=headers)
+    if res.status_code != 200:
+        raise UpstreamError(res.status_code, res.text)
+    return res.json()
+
+@router.get("")
+async def get_history(request: Request, assetId: str, attributeName: str, fromTimestamp: int, toTimestamp: int,
+                      key: str = None, width: int = 1000, method: str = "lttb"):
+    """
+    Numeric history of one attribute (or one key of a JSON attribute), downsampled
+    server-side to about `width` points and returned as columnar arrays:
+    {"t": [timestamps], "v": [values], "rawCount": n, "method": ...}.
+    `method` is one of lttb, minmax, avg or raw.
+    """
+    realm = request.session.get("realm", DEFAULT_REALM)
+    access_token = await get_valid_token(request)
+    if not access_token:
+        return JSONResponse({"error": "Not authenticated"}, status_code=401)
+    if method != "raw" and method not in METHODS:
+        return JSONResponse({"error": f"Unknown method: {method}"}, status_code=400)
+    width = max(3, min(width, 10000))
+
+    try:
+        # The datapoint cache is shared between users, so check access before serving from it
+        user_id = current_user_id(request)
+        linked = await get_user_assets_snapshot(realm, user_id, access_token)
+        if not any(a.get("id") == assetId for a in linked):
+            return JSONResponse({"error": "Asset not linked to user"}, status_code=403)
+
+        async def fetch(from_ts, to_ts):
+            return await fetch_datapoints(realm, access_token, assetId, attributeName, from_ts, to_ts)
+        points = await history_cache.get_datapoints(realm, assetId, attributeName, fromTimestamp, toTimestamp, fetch)
+    except UpstreamError as e:
+        return JSONResponse({"error": f"Failed to fetch datapoints: {e.status_code}"}, status_code=e.status_code)
+    except Exception as e:
+        print(f"[HISTORY] Upstream error: {e}")
+        return JSONResponse({"error": str(e)}, status_code=502)
+
+    series = []
+    for pt in points if isinstance(points, list) else []:
+        value = _to_number(pt.get("y"), key)
+        if value is not None and pt.get("x") is not None:
+            series.append((pt["x"], value))
+    series.sort()
+    ts = [t for t, _ in series]
+    vs = [v for _, v in series]
+
+    if method != "raw":
+        ts, vs = METHODS[method](ts, vs, width)
+    return {"t": ts, "v": vs, "rawCount": len(series), "method": method}
+
+# Response headers relayed from the manager's export response
+_EXPORT_HEADERS = ("Content-Length", "Content-Encoding", "Content-Range", "Accept-Ranges", "ETag", "Last-Modified", "Content-Disposition")
+
+@router.get("/export")
+async def export_datapoints(request: Request, assetId: str, attributeName: str, fromTimestamp: int, toTimestamp: int):
+    """
+    Streams the manager's datapoint export (ZIP) to the browser chunk by chunk,
+    so memory use stays constant regardless of export size. Range/If-Range are
+    forwarded, so a download can resume wherever the manager supports it.
+    """
+    realm = request.session.get("realm", DEFAULT_REALM)
+    access_token = await get_valid_token(request)
+    if not access_token:
+        return JSONResponse({"error": "Not authenticated"}, status_code=401)
+
+    params = {
+        "attributeRefs": json.dumps([{"id": assetId, "name": attributeName}]),
+        "fromTimestamp": fromTimestamp,
+        "toTimestamp": toTimestamp
+    }
+    headers = {
+        "Authorization": f"Bearer {access_token}",
+        "Accept": "application/zip",
+        "Host": OR_HOSTNAME
+    }
+    for name in ("Range", "If-Range"):
+        if name in request.headers:
+            headers[name] = request.headers[name]
+
+    url = f"{OR_MANAGER_URL}/api/{realm}/asset/datapoint/export"
+    try:
+        res = await upstream.open_stream("GET", url, params=params, headers=headers)
+    except Exception as e:
+        print(f"[EXPORT] Upstream error: {e}")
+        return JSONResponse({"error": str(e)}, status_code=502)
+
+    if res.status_code not in (200, 206):
+        body = (await res.aread()).decode(errors="replace")
+        await res.aclose()
+        return JSONResponse({"error": f"Export failed: {res.status_code}", "details": body}, status_code=res.status_code)
+
+    out_headers = {k: res.headers[k] for k in _EXPORT_HEADERS if k in res.headers}
+    if "Content-Disposition" not in out_headers:
+        out_headers["Content-Disposition"] = f'attachment; filename="{attributeName}_export.zip"'
+
+    async def body():
+        # On client disconnect StreamingResponse cancels this generator; the
+        # finally block still closes the upstream connection
+        try:
+            async for chunk in res.aiter_raw():
+                yield chunk
+        finally:
+            await res.aclose()
+
+    return StreamingResponse(
+        body(),
+        status_code=res.status_code,
+        media_type=res.headers.get("Content-Type", "application/zip"),
+        headers=out_headers
+    )
@@ -1,7 +1,10 @@
-import requests
 from fastapi import APIRouter, Request
 from core.config import OR_MANAGER_URL, DEFAULT_REALM
-from core.auth import get_valid_token, get_admin_token
+from core.auth import get_valid_token, admin_request, with_admin_token
+from core.cache import UpstreamError
+from core.snapshots import invalidate_asset
+from core import rules_index
+from core.rule_compiler import RuleDefinitionError, validate_rule, ruleset_source, submit_edits, target_name
 
 router = APIRouter(prefix="/api/user/rules", tags=["rules"])
 
@@ -11,27 +14,10 @@ async def get_user_rules(request: Request):
     user_id = request.session.get("user_id")
     if not user_id: return []
     
-    admin_token = get_admin_token(realm)
-    headers = {"Authorization": f"Bearer {admin_token}"}
-    
     try:
-        url = f"{OR_MANAGER_URL}/api/{realm}/rules"
-        res = requests.get(url, headers=headers)
-        if res.status_code == 200:
-            all_rules = res.json()
-            prefix = f"u:{user_id}:"
-            my_rules = []
-            for r in all_rules:
-                if r["name"].startswith(prefix):
-                    my_rules.append({
-                        "id": r["id"],
-                        "name": r["name"].replace(prefix, ""),
-                        "desc": r.get("description", "User Rule"),
-                        "active": r.get("status") == "ACTIVE"
-                    })
-            return my_rules
-    except:
-        pass
+        return await with_admin_token(realm, lambda admin_token: rules_index.get_user_rules(realm, user_id, admin_token))
+    except Exception as e:
+        print(f"[RULES] Error loading rules index: {e}")
     return []
 
 @router.post("")
@@ -40,9 +26,6 @@ async def create_rule(request: Request, rule: dict):
     user_id = request.session.get("user_id")
     if not user_id: return {"error": "Not logged in"}
 
-    admin_token = get_admin_token(realm)
-    headers = {"Authorization": f"Bearer {admin_token}", "Content-Type": "application/json"}
-    
     clean_name = rule.get("name", "Rule")
     full_name = f"u:{user_id}:{clean_name}"
     
@@ -50,24 +33,19 @@ async def create_rule(request: Request, rule: dict):
         "name": full_name,
         "description": "Custom User Rule",
         "status": "ACTIVE",
-        "content": f"""
-package rules
-import org.openremote.model.asset.*
-import org.openremote.model.rules.*
-
-rule "{full_name}"
-when
-    Icon(assets: assets)
-then
-    System.out.println("User Rule Triggered");
-end
-""" 
+        "content": ruleset_source(full_name)
     }
     
     try:
         url = f"{OR_MANAGER_URL}/api/{realm}/rules"
-        res = requests.post(url, json=or_rule, headers=headers)
-        if res.status_code in [200, 201]:
+        res = await admin_request(realm, "POST", url, json=or_rule)
+        if res is not None and res.status_code in [200, 201]:
+            # The manager answers with the new rule's id
+            try:
+                rule_id = res.json()
+            except ValueError:
+                rule_id = None
+            rules_index.record_rule(realm, dict(or_rule, id=rule_id if isinstance(rule_id, (int, str)) else None))
             return {"status": "success"}
     except:
         pass
@@ -76,12 +54,52 @@ end
 @router.delete("/{id}")
 async def delete_rule(request: Request, id: str):
     realm = request.session.get("realm", DEFAULT_REALM)
-    admin_token = get_admin_token(realm)
-    if not admin_token: return {"status": "error", "message": "Admin token failed"}
-    headers = {"Authorization": f"Bearer {admin_token}"}
     try:
         url = f"{OR_MANAGER_URL}/api/{realm}/rules/{id}"
-        res = requests.delete(url, headers=headers)
-        return {"status": "success"} if res.status_code in [200, 204] else {"status": "error"}
+        res = await admin_request(realm, "DELETE", url)
+        if res is None: return {"status": "error", "message": "Admin token failed"}
+        if res.status_code in [200, 204]:
+            rules_index.record_rule_deleted(realm, id)
+            return {"status": "success"}
+        return {"status": "error"}
     except:
         return {"status": "error"}
+
+
+@router.post("/targets/{asset_id}")
+async def update_rule_targets(request: Request, asset_id: str, payload: dict):
+    """
+    Compiles rule definitions from the rules page into the asset's RuleTargets.
+    Body: {"rules": [rule, ...], "remove": [rule id, ...]}.
+    """
+    realm = request.session.get("realm", DEFAULT_REALM)
+    access_token = await get_valid_token(request)
+    if not access_token: return {"status": "error", "message": "Not authenticated"}
+    user_id = request.session.get("user_id")
+
+    try:
+        edits = [(str(rule_id), None) for rule_id in payload.get("remove", [])]
+        edits += [(rule["id"], rule) for rule in map(validate_rule, payload.get("rules", []))]
+    except RuleDefinitionError as e:
+        return {"status": "error", "message": str(e)}
+    if not edits: return {"status": "success"}
+
+    try:
+        targets, rejected = await submit_edits(realm, asset_id, user_id, access_token, edits)
+    except UpstreamError as e:
+        return {"status": "error", "message": str(e)}
+    except Exception as e:
+        print(f"[RULES] Error writing RuleTargets for {asset_id}: {e}")
+        return {"status": "error", "message": str(e)}
+    finally:
+        invalidate_asset(realm, asset_id)
+    if rejected:
+        rule_id, existing = next(iter(rejected.items()))
+        name = target_name(targets.get(existing, "")) or existing
+        return {
+            "status": "conflict",
+            "message": f"Rule {rule_id} does the same as the existing rule '{name}'",
+            "rejected": rejected,
+            "targets": targets
+        }
+    return {"status": "success", "targets": targets}
@@ -0,0 +1,46 @@
+import asyncio
+import time
+from fastapi import APIRouter, Request
+from fastapi.responses import Response, StreamingResponse
+from core.config import DEFAULT_REALM, LIVE_KEEPALIVE_INTERVAL
+from core.auth import get_valid_token, current_user_id
+from core.live import get_feed
+
+router = APIRouter(prefix="/api/stream", tags=["stream"])
+
+@router.get("/assets")
+async def stream_assets(request: Request):
+    """
+    Server-Sent Events feed of the user's assets: one `snapshot` event with the
+    full `/api/user/assets` payload, then `delta` events with only what changed.
+    The stream ends shortly before the access token expires; EventSource then
+    reconnects through get_valid_token, which refreshes the session.
+    """
+    realm = request.session.get("realm", DEFAULT_REALM)
+    access_token = await get_valid_token(request)
+    if not access_token: return Response(status_code=401)
+    claims = request.state.claims
+    user_id = current_user_id(request)
+    if not user_id: return Response(status_code=401)
+    expires_at = claims.get("exp") or time.time() + 300
+
+    feed = get_feed(realm, user_id)
+    queue = feed.subscribe(access_token)
+
+    async def events():
+        # StreamingResponse cancels this generator when the client goes away;
+        # the finally block then drops the subscription
+        try:
+            yield "retry: 1000\n\n"
+            while time.time() < expires_at - 60:
+                try:
+                    yield await asyncio.wait_for(queue.get(), timeout=LIVE_KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+        finally:
+            feed.unsubscribe(queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
@@ -1,21 +1,25 @@
-import requests
 from fastapi import APIRouter, Request
+from core import upstream
 from core.config import OR_MANAGER_URL, KEYCLOAK_URL, DEFAULT_REALM
 from core.auth import get_valid_token
+from core.directory import resolve_users
+from core.filters import get_ignore_matcher
+from core.links import get_link_index
+from core.snapshots import get_user_assets_snapshot
 
 router = APIRouter(prefix="/api/user", tags=["user"])
 
 @router.get("/profile")
 async def get_user_profile(request: Request):
     realm = request.session.get("realm", DEFAULT_REALM)
-    access_token = get_valid_token(request)
+    access_token = await get_valid_token(request)
     if not access_token:
         return {"error": "Not authenticated"}
     
     try:
         url = f"{OR_MANAGER_URL}/api/{realm}/user/user"
         headers = {"Authorization": f"Bearer {access_token}"}
-        res = requests.get(url, headers=headers, verify=False)
+        res = await upstream.get(url, headers=headers)
         if res.status_code == 200:
             return res.json()
         return {"error": f"Failed to fetch profile: {res.status_code}"}
@@ -26,7 +30,7 @@ async def get_user_profile(request: Request):
 @router.put("/profile")
 async def update_user_profile(request: Request):
     realm = request.session.get("realm", DEFAULT_REALM)
-    access_token = get_valid_token(request)
+    access_token = await get_valid_token(request)
     if not access_token:
         return {"error": "Not authenticated"}
     
@@ -37,7 +41,7 @@ async def update_user_profile(request: Request):
             "Authorization": f"Bearer {access_token}",
             "Content-Type": "application/json"
         }
-        res = requests.put(url, json=body, headers=headers, verify=False)
+        res = await upstream.put(url, json=body, headers=headers)
         if res.status_code in [200, 204]:
             return {"status": "success"}
         return {"error": f"Update failed: {res.status_code}", "details": res.text}
@@ -49,7 +53,7 @@ async def update_user_profile(request: Request):
 async def change_user_password(request: Request):
     realm = request.session.get("realm", DEFAULT_REALM)
     username = request.session.get("username")
-    access_token = get_valid_token(request)
+    access_token = await get_valid_token(request)
     if not access_token or not username:
         return {"error": "Not authenticated"}
     
@@ -68,7 +72,7 @@ async def change_user_password(request: Request):
             "username": username,
             "password": current_password
         }
-        verify_res = requests.post(token_url, data=verify_data, verify=False)
+        verify_res = await upstream.post(token_url, data=verify_data)
         if verify_res.status_code != 200:
             return {"error": "Current password is incorrect"}
         
@@ -77,7 +81,7 @@ async def change_user_password(request: Request):
             "Authorization": f"Bearer {access_token}",
             "Content-Type": "application/json"
         }
-        res = requests.put(url, json={"password": new_password}, headers=headers, verify=False)
+        res = await upstream.put(url, json={"password": new_password}, headers=headers)
         if res.status_code in [200, 204]:
             return {"status": "success"}
         return {"error": f"Password change failed: {res.status_code}", "details": res.text}
@@ -87,49 +91,30 @@ async def change_user_password(request: Request):
 
 @router.get("/asset-partners")
 async def get_asset_partners(request: Request):
-    from core.auth import get_admin_token
-    from core.config import IGNORED_USERS_FILE
-    import json
-    import os
+    from core.auth import get_admin_token, with_admin_token
     realm = request.session.get("realm", DEFAULT_REALM)
     user_id = request.session.get("user_id")
-    access_token = get_valid_token(request)
+    access_token = await get_valid_token(request)
     if not user_id or not access_token: return []
     
     try:
         # 1. Get My Assets
-        headers = {"Authorization": f"Bearer {access_token}"}
-        assets_res = requests.get(f"{OR_MANAGER_URL}/api/{realm}/asset/user/current", headers=headers, verify=False)
-        if assets_res.status_code != 200: return []
-        my_assets = {a["id"]: a.get("name", "Unknown") for a in assets_res.json()}
+        linked_assets = await get_user_assets_snapshot(realm, user_id, access_token)
+        my_assets = {a["id"]: a.get("name", "Unknown") for a in linked_assets}
         
         if not my_assets: return []
 
-        # 2. Get All Links (Admin)
-        admin_token = get_admin_token(realm)
-        admin_headers = {"Authorization": f"Bearer {admin_token}"}
-        
-        # Try fetching all links.
-        links_res = requests.get(f"{OR_MANAGER_URL}/api/master/asset/user/link", params={"realm": realm}, headers=admin_headers, verify=False)
-        all_links = links_res.json() if links_res.status_code == 200 else []
-        
-        # 3. Filter relevant links and cache names
-        partners_map = {} # asset_id -> set(user_id)
+        # 2. Partners per asset from the realm link index (O(my assets))
+        index = await with_admin_token(realm, lambda admin_token: get_link_index(realm, admin_token))
+        admin_token = await get_admin_token(realm)
+        partners_map = index.partners(my_assets, user_id) # asset_id -> set(user_id)
+
+        # 3. Use names from the link table where available
         user_name_cache = {} # user_id -> full name
-        
-        for link in all_links:
-            lid = link.get("id", {})
-            l_asset = lid.get("assetId")
-            l_user = lid.get("userId")
-            l_realm = lid.get("realm")
-            
-            if l_realm == realm and l_asset in my_assets and l_user != user_id:
-                if l_asset not in partners_map: partners_map[l_asset] = set()
-                partners_map[l_asset].add(l_user)
-                
-                # Use name from link if available, fallback to cache or Unknown
-                if "userFullName" in link:
-                    user_name_cache[l_user] = link["userFullName"]
+        for uids in partners_map.values():
+            for uid in uids:
+                if uid in index.user_names:
+                    user_name_cache[uid] = index.user_names[uid]
 
         if not partners_map: return []
         
@@ -139,31 +124,14 @@ async def get_asset_partners(request: Request):
         for uids in partners_map.values():
             all_partner_ids.update(uids)
             
-        for pid in all_partner_ids:
-            if pid not in user_name_cache:
-                try:
-                    u_res = requests.get(f"{OR_MANAGER_URL}/api/{realm}/user/user/{pid}", headers=admin_headers, verify=False)
-                    if u_res.status_code == 200:
-                        u_data = u_res.json()
-                        name = u_data.get("firstName") or u_data.get("username", "Unknown")
-                        if u_data.get("lastName"): name += f" {u_data.get('lastName')}"
-                        user_name_cache[pid] = name
-                    else:
-                        user_name_cache[pid] = "Unknown"
-                except:
-                    user_name_cache[pid] = "Unknown"
+        unresolved = [pid for pid in all_partner_ids if pid not in user_name_cache]
+        if unresolved:
+            users = await resolve_users(realm, unresolved, admin_token)
+            for pid in unresolved:
+                user_name_cache[pid] = users[pid]["name"] if pid in users else "Unknown"
 
         # 5. Build Response
-        # Load ignored patterns
-        ignored_prefixes = []
-        ignored_usernames = []
-        if os.path.exists(IGNORED_USERS_FILE):
-            try:
-                with open(IGNORED_USERS_FILE, 'r') as f:
-                    data = json.load(f)
-                    ignored_prefixes = data.get("ignored_prefixes", [])
-                    ignored_usernames = data.get("ignored_usernames", [])
-            except: pass
+        ignore = get_ignore_matcher()
 
         result = []
         for aid, user_ids in partners_map.items():
@@ -172,18 +140,7 @@ async def get_asset_partners(request: Request):
                 name = user_name_cache.get(uid, "Unknown")
                 
                 # Check Ignore Filters
-                is_ignored = False
-                if name != "Unknown":
-                    # Check exact username match
-                    if name in ignored_usernames: is_ignored = True
-                    
-                    # Check prefixes
-                    for prefix in ignored_prefixes:
-                        if name.startswith(prefix):
-                            is_ignored = True
-                            break
-                            
-                if not is_ignored:
+                if name == "Unknown" or not ignore.is_ignored(name):
                     valid_names.append(name)
             
             if valid_names:
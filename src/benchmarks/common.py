@@ -0,0 +1,218 @@
+"""
+Shared helpers for the benchmark scripts.
+
+Import this module before anything from `core`/`api`: it points the app config
+at a local fake OpenRemote manager / Keycloak so benchmarks run without a stack.
+Run benchmarks from `src/`, e.g. `python -m benchmarks.dashboard_polling`.
+"""
+import asyncio
+import base64
+import json
+import os
+import statistics
+import tempfile
+import time
+from urllib.parse import parse_qs
+
+FAKE_PORT = int(os.getenv("BENCH_FAKE_PORT", "18080"))
+FAKE_BASE = f"http://127.0.0.1:{FAKE_PORT}"
+os.environ.setdefault("OR_MANAGER_URL", FAKE_BASE)
+os.environ.setdefault("KEYCLOAK_URL", f"{FAKE_BASE}/auth")
+os.environ.setdefault("PREFS_DB_FILE", os.path.join(tempfile.gettempdir(), "dibl-bench-prefs.db"))
+# Fake tokens are unsigned; claims are still parsed and cached as in production
+os.environ.setdefault("JWT_VERIFY", "false")
+os.environ.setdefault("HISTORY_CACHE_FILE", os.path.join(tempfile.gettempdir(), "dibl-bench-history.db"))
+
+REALM = "dibl-iot"
+
+def make_token(sub, ttl=3600):
+    """Builds an unsigned JWT-shaped token carrying `sub` and `exp`."""
+    def enc(obj):
+        return base64.urlsafe_b64encode(json.dumps(obj).encode()).decode().rstrip("=")
+    claims = {"sub": sub, "exp": int(time.time()) + ttl, "preferred_username": sub}
+    return f"{enc({'alg': 'none'})}.{enc(claims)}.sig"
+
+class FakeState:
+    pass
+
+class FakeRequest:
+    """Just enough of a Starlette request for calling route handlers directly."""
+    def __init__(self, session, headers=None):
+        self.session = session
+        self.headers = headers or {}
+        self.state = FakeState()
+
+def user_session(user_id):
+    return {
+        "realm": REALM,
+        "username": user_id,
+        "user_id": user_id,
+        "access_token": make_token(user_id),
+        "refresh_token": "refresh",
+    }
+
+def make_asset(aid, idx=0):
+    now = int(time.time() * 1000)
+    return {
+        "id": aid,
+        "name": f"Device {idx}",
+        "type": "ThingAsset",
+        "attributes": {
+            "MoistureData": {"name": "MoistureData", "value": {"M1": 40 + idx % 10}, "timestamp": now},
+            "NPKData": {"name": "NPKData", "value": {"N": 10, "P": 20, "K": 30}, "timestamp": now},
+            "RelayData": {"name": "RelayData", "value": {"R1": False, "R2": True}, "timestamp": now},
+            "location": {"name": "location", "value": {"type": "Point", "coordinates": [90.4, 23.8]}},
+        },
+    }
+
+class FakeUpstream:
+    """
+    A tiny OpenRemote manager + Keycloak stand-in with a fixed per-request latency.
+    `calls` counts requests per route name so benchmarks can report upstream load.
+    """
+    def __init__(self, latency=0.05, assets=10):
+        self.latency = latency
+        self.assets = {f"asset{i}": make_asset(f"asset{i}", i) for i in range(assets)}
+        self.calls = {}
+        self._server = None
+        self._task = None
+
+    def _count(self, name):
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def build_app(self):
+        from starlette.applications import Starlette
+        from starlette.responses import JSONResponse, Response
+        from starlette.routing import Route
+
+        async def token(request):
+            self._count("token")
+            await asyncio.sleep(self.latency)
+            form = parse_qs((await request.body()).decode())
+            return JSONResponse({
+                "access_token": make_token(form.get("username", ["admin"])[0], 60),
+                "refresh_token": "refresh",
+                "expires_in": 60,
+            })
+
+        async def current_assets(request):
+            self._count("assets_current")
+            await asyncio.sleep(self.latency)
+            return JSONResponse(list(self.assets.values()))
+
+        async def single_asset(request):
+            self._count("asset")
+            await asyncio.sleep(self.latency)
+            asset = self.assets.get(request.path_params["aid"])
+            return JSONResponse(asset) if asset else Response(status_code=404)
+
+        async def write_attribute(request):
+            self._count("attribute_write")
+            await asyncio.sleep(self.latency)
+            asset = self.assets.get(request.path_params["aid"])
+            if not asset:
+                return Response(status_code=404)
+            name = request.path_params["name"]
+            attr = asset["attributes"].setdefault(name, {"name": name})
+            attr["value"] = json.loads(await request.body() or b"null")
+            attr["timestamp"] = int(time.time() * 1000)
+            return Response(status_code=204)
+
+        async def datapoints(request):
+            # One point per minute across the requested range
+            self._count("datapoints")
+            await asyncio.sleep(self.latency)
+            body = await request.json()
+            start = body["fromTimestamp"] - body["fromTimestamp"] % 60000
+            if start < body["fromTimestamp"]:
+                start += 60000
+            points = [
+                {"x": ts, "y": json.dumps({"M1": (ts // 60000) % 100, "T1": 20 + (ts // 3600000) % 10})}
+                for ts in range(start, body["toTimestamp"] + 1, 60000)
+            ]
+            self.calls["datapoints_points"] = self.calls.get("datapoints_points", 0) + len(points)
+            return JSONResponse(points)
+
+        async def login_page(request):
+            self._count("login_page")
+            await asyncio.sleep(self.latency)
+            action = f"{FAKE_BASE}/auth/realms/{request.path_params['realm']}/login-actions/authenticate?session_code=abc&amp;tab_id=xyz"
+            return Response(f'<form id="kc-form-login" action="{action}" method="post"></form>', media_type="text/html")
+
+        async def login_action(request):
+            self._count("login_action")
+            await asyncio.sleep(self.latency)
+            return Response(status_code=302, headers={
+                "Location": "https://manager/manager/?code=abc",
+                "Set-Cookie": "KEYCLOAK_IDENTITY=fake; Path=/auth/realms/",
+            })
+
+        async def user_lookup(request):
+            self._count("user_lookup")
+            await asyncio.sleep(self.latency)
+            return JSONResponse([{"id": request.query_params.get("username")}])
+
+        async def create_user(request):
+            self._count("user_create")
+            await asyncio.sleep(self.latency)
+            user = await request.json()
+            return Response(status_code=201, headers={
+                "Location": f"{FAKE_BASE}/auth/admin/realms/{request.path_params['realm']}/users/{user['username']}"
+            })
+
+        async def clients(request):
+            self._count("clients")
+            await asyncio.sleep(self.latency)
+            return JSONResponse([{"id": "openremote-uuid", "clientId": request.query_params.get("clientId")}])
+
+        async def roles(request):
+            self._count("roles")
+            await asyncio.sleep(self.latency)
+            names = [f"{action}:{scope}" for action in ("read", "write") for scope in (
+                "alarms", "assets", "insights", "logs", "rules", "services", "users", "attributes", "user"
+            )]
+            return JSONResponse([{"id": f"role-{name}", "name": name, "composite": False} for name in names])
+
+        async def role_mapping(request):
+            self._count("role_mapping")
+            await asyncio.sleep(self.latency)
+            return Response(status_code=204)
+
+        return Starlette(routes=[
+            Route("/auth/realms/{realm}/protocol/openid-connect/token", token, methods=["POST"]),
+            Route("/auth/realms/{realm}/protocol/openid-connect/auth", login_page),
+            Route("/auth/realms/{realm}/login-actions/authenticate", login_action, methods=["POST"]),
+            Route("/auth/admin/realms/{realm}/users", user_lookup),
+            Route("/auth/admin/realms/{realm}/users", create_user, methods=["POST"]),
+            Route("/auth/admin/realms/{realm}/clients", clients),
+            Route("/auth/admin/realms/{realm}/clients/{uuid}/roles", roles),
+            Route("/auth/admin/realms/{realm}/roles", roles),
+            Route("/auth/admin/realms/{realm}/users/{uid}/role-mappings/{kind:path}", role_mapping, methods=["POST"]),
+            Route("/api/{realm}/asset/user/current", current_assets),
+            Route("/api/{realm}/asset/{aid}", single_asset),
+            Route("/api/{realm}/asset/{aid}/attribute/{name}", write_attribute, methods=["PUT"]),
+            Route("/api/{realm}/asset/datapoint/{aid}/{name}", datapoints, methods=["POST"]),
+        ])
+
+    async def __aenter__(self):
+        import uvicorn
+        config = uvicorn.Config(self.build_app(), host="127.0.0.1", port=FAKE_PORT, log_level="warning", lifespan="off")
+        self._server = uvicorn.Server(config)
+        self._task = asyncio.create_task(self._server.serve())
+        while not self._server.started:
+            await asyncio.sleep(0.01)
+        return self
+
+    async def __aexit__(self, *exc):
+        from core import upstream
+        await upstream.close_clients()
+        self._server.should_exit = True
+        await self._task
+
+def summarize(label, latencies):
+    if not latencies:
+        print(f"{label:<32} no samples")
+        return
+    ordered = sorted(latencies)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    print(f"{label:<32} n={len(ordered):<6} p50={statistics.median(ordered) * 1000:8.1f}ms  p95={p95 * 1000:8.1f}ms")
@@ -0,0 +1,78 @@
+"""
+Simulates open dashboard tabs polling `/api/user/assets` and
+`/api/user/dashboard/widgets` once per second against a fake manager with a
+fixed latency, and reports per-poll latency as the session and pin counts grow.
+
+Each configuration runs twice: once the way the handlers used to work (blocking
+`requests` calls on the event loop, one extra GET per pinned asset) and once
+through the current handlers (pooled async client, snapshot cache).
+
+Usage (from src/): python -m benchmarks.dashboard_polling [--duration 5] [--latency 0.05] [--sessions 1 10 50] [--pins 1 10 100]
+"""
+import argparse
+import asyncio
+import time
+import requests
+from benchmarks.common import FakeUpstream, FakeRequest, REALM, user_session, summarize
+
+from api import assets as assets_api
+from core import preferences
+from core.config import OR_MANAGER_URL
+
+def pin_assets(count, assets):
+    return [f"asset{i % assets}" for i in range(count)]
+
+async def seed_pins(user_id, asset_ids):
+    await preferences.remove_asset_pins(user_id, {p["assetId"] for p in await preferences.get_pins(user_id)})
+    for i, aid in enumerate(asset_ids):
+        await preferences.toggle_pin(user_id, aid, "MoistureData", f"M{i}")
+
+async def legacy_poll(request, asset_ids):
+    """The old handlers' upstream calls: blocking, sequential, on the event loop."""
+    headers = {"Authorization": f"Bearer {request.session['access_token']}"}
+    current_url = f"{OR_MANAGER_URL}/api/{REALM}/asset/user/current"
+    requests.get(current_url, headers=headers)  # /api/user/assets
+    requests.get(current_url, headers=headers)  # widgets: linked assets
+    for aid in sorted(set(asset_ids)):          # widgets: one GET per pinned asset
+        requests.get(f"{OR_MANAGER_URL}/api/{REALM}/asset/{aid}", headers=headers)
+
+async def current_poll(request, asset_ids):
+    await asyncio.gather(
+        assets_api.get_user_assets(request),
+        assets_api.get_dashboard_widgets(request),
+    )
+
+async def run_session(poll, request, asset_ids, duration, latencies):
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        await poll(request, asset_ids)
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(max(0, 1.0 - (time.perf_counter() - started)))
+
+async def main(args):
+    assets = max(args.pins)
+    async with FakeUpstream(latency=args.latency, assets=assets) as fake:
+        for pins in args.pins:
+            asset_ids = pin_assets(pins, assets)
+            for sessions in args.sessions:
+                requests_ = [FakeRequest(user_session(f"user{i}")) for i in range(sessions)]
+                for r in requests_:
+                    await seed_pins(r.session["user_id"], asset_ids)
+                for label, poll in (("blocking (old)", legacy_poll), ("async pooled", current_poll)):
+                    latencies = []
+                    fake.calls.clear()
+                    started = time.perf_counter()
+                    await asyncio.gather(*(run_session(poll, r, asset_ids, args.duration, latencies) for r in requests_))
+                    elapsed = time.perf_counter() - started
+                    summarize(f"{label} {sessions}s/{pins}p", latencies)
+                    print(f"{'':<32} polls/s={len(latencies) / elapsed:7.1f}  "
+                          f"upstream calls/poll={sum(fake.calls.values()) / max(len(latencies), 1):6.2f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--pins", type=int, nargs="+", default=[1, 10, 100])
+    asyncio.run(main(parser.parse_args()))
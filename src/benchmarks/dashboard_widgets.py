@@ -0,0 +1,44 @@
+"""
+Measures `/api/user/dashboard/widgets` latency and upstream calls per request
+at 1, 10 and 100 pinned attributes (each on a distinct asset), with the
+snapshot cache cleared before every request so each one reaches the manager.
+
+Usage (from src/): python -m benchmarks.dashboard_widgets [--latency 0.05] [--repeat 20]
+"""
+import argparse
+import asyncio
+import time
+from benchmarks.common import FakeUpstream, FakeRequest, user_session, summarize
+
+from api import assets as assets_api
+from core import preferences, snapshots
+
+USER = "bench-user"
+
+async def set_pins(count, total):
+    await preferences.remove_asset_pins(USER, [f"asset{i}" for i in range(total)])
+    for i in range(count):
+        await preferences.toggle_pin(USER, f"asset{i}", "MoistureData", "M1")
+
+async def main(args):
+    async with FakeUpstream(latency=args.latency, assets=max(args.pins)) as fake:
+        request = FakeRequest(user_session(USER))
+        for count in args.pins:
+            await set_pins(count, max(args.pins))
+            latencies = []
+            fake.calls.clear()
+            for _ in range(args.repeat):
+                snapshots.user_assets_cache.clear()
+                started = time.perf_counter()
+                widgets = await assets_api.get_dashboard_widgets(request)
+                latencies.append(time.perf_counter() - started)
+                assert len(widgets) == count, f"expected {count} widgets, got {len(widgets)}"
+            summarize(f"{count} pins", latencies)
+            print(f"{'':<32} upstream calls/request={sum(fake.calls.values()) / args.repeat:.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--pins", type=int, nargs="+", default=[1, 10, 100])
+    asyncio.run(main(parser.parse_args()))
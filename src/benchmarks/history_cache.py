@@ -0,0 +1,72 @@
+"""
+Compares history queries with and without the local datapoint cache, for the
+access patterns the history page produces (1-minute data):
+
+- slide:  a 24h window moved forward one hour at a time (each step has one new hour)
+- repeat: the same settled 24h window requested again (reloads, several tabs)
+- zoom:   narrower windows inside an already loaded 24h range
+- live:   a 24h window ending now; the HISTORY_CACHE_SETTLE tail is always refetched
+
+Reports upstream requests (and how many the cache avoided), points transferred
+and wall time for each pattern.
+
+Usage (from src/): python -m benchmarks.history_cache [--steps 24] [--latency 0.05]
+"""
+import argparse
+import asyncio
+import os
+import time
+from benchmarks.common import FakeUpstream, REALM, make_token
+
+from api.history import fetch_datapoints
+from core import history_cache
+
+HOUR = 3600 * 1000
+
+def windows(pattern, steps, now):
+    # Settled windows end well in the past, outside the always-refetched tail
+    base = now - 3 * 24 * HOUR
+    if pattern == "slide":
+        return [(base + i * HOUR, base + i * HOUR + 24 * HOUR) for i in range(steps)]
+    if pattern == "repeat":
+        return [(base, base + 24 * HOUR)] * steps
+    if pattern == "zoom":
+        spans = [24 * HOUR * (steps - i) // steps for i in range(steps)]
+        return [(base, base + 24 * HOUR)] + [(base + (24 * HOUR - span) // 2, base + (24 * HOUR + span) // 2) for span in spans[1:]]
+    if pattern == "live":
+        return [(now - 24 * HOUR, now)] * steps
+    raise ValueError(pattern)
+
+async def run(fake, pattern, ranges, cached):
+    token = make_token("bench-user")
+    fake.calls.clear()
+    started = time.perf_counter()
+    for from_ts, to_ts in ranges:
+        async def fetch(f, t):
+            return await fetch_datapoints(REALM, token, "asset0", "MoistureData", f, t)
+        if cached:
+            # A cached series per pattern, so each starts cold
+            await history_cache.get_datapoints(REALM, f"asset0-{pattern}", "MoistureData", from_ts, to_ts, fetch)
+        else:
+            await fetch(from_ts, to_ts)
+    return time.perf_counter() - started, fake.calls.get("datapoints", 0), fake.calls.get("datapoints_points", 0)
+
+async def main(args):
+    if os.path.exists(history_cache.HISTORY_CACHE_FILE):
+        os.remove(history_cache.HISTORY_CACHE_FILE)
+    now = int(time.time() * 1000)
+    async with FakeUpstream(latency=args.latency) as fake:
+        print(f"{'pattern':<8} {'mode':<14} {'time':>9}  {'requests':>8}  {'avoided':>7}  {'points':>8}")
+        for pattern in ("slide", "repeat", "zoom", "live"):
+            ranges = windows(pattern, args.steps, now)
+            base_time, base_requests, base_points = await run(fake, pattern, ranges, cached=False)
+            cached_time, cached_requests, cached_points = await run(fake, pattern, ranges, cached=True)
+            print(f"{pattern:<8} {'without cache':<14} {base_time * 1000:7.1f}ms  {base_requests:>8}  {'':>7}  {base_points:>8}")
+            print(f"{'':<8} {'with cache':<14} {cached_time * 1000:7.1f}ms  {cached_requests:>8}  "
+                  f"{base_requests - cached_requests:>7}  {cached_points:>8}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--steps", type=int, default=24)
+    parser.add_argument("--latency", type=float, default=0.05)
+    asyncio.run(main(parser.parse_args()))
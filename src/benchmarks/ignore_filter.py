@@ -0,0 +1,53 @@
+"""
+Microbenchmark for the ignored-users filter: the old per-name linear scan over
+prefixes (plus list membership for exact names) versus the compiled IgnoreMatcher.
+
+Usage (from src/): python -m benchmarks.ignore_filter [--names 5000] [--patterns 10 100 1000 5000]
+"""
+import argparse
+import random
+import string
+import time
+
+from core.filters import IgnoreMatcher
+
+def random_word(rng, length):
+    return "".join(rng.choice(string.ascii_lowercase + "-") for _ in range(length))
+
+def linear_filter(names, usernames, prefixes):
+    result = []
+    for name in names:
+        is_ignored = name in usernames
+        if not is_ignored:
+            for prefix in prefixes:
+                if name.startswith(prefix):
+                    is_ignored = True
+                    break
+        if not is_ignored:
+            result.append(name)
+    return result
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - started, result
+
+def main(args):
+    rng = random.Random(42)
+    names = [random_word(rng, rng.randint(6, 24)) for _ in range(args.names)]
+    for count in args.patterns:
+        usernames = [random_word(rng, 10) for _ in range(count)] + names[:count // 10]
+        prefixes = [random_word(rng, rng.randint(4, 12)) for _ in range(count)] + [n[:5] for n in names[:count // 10]]
+
+        linear_time, expected = timed(lambda: linear_filter(names, usernames, prefixes))
+        compile_time, matcher = timed(lambda: IgnoreMatcher(usernames, prefixes))
+        match_time, actual = timed(lambda: matcher.filter(names))
+        assert actual == expected
+        print(f"{count:>5} patterns x {len(names)} names: linear={linear_time * 1000:9.2f}ms  "
+              f"compiled={match_time * 1000:7.2f}ms (+{compile_time * 1000:.2f}ms compile)  kept={len(actual)}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--names", type=int, default=5000)
+    parser.add_argument("--patterns", type=int, nargs="+", default=[10, 100, 1000, 5000])
+    main(parser.parse_args())
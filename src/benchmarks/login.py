@@ -0,0 +1,71 @@
+"""
+Simulates a morning login storm: many users logging in at once against a fake
+Keycloak with a fixed latency. Compares the old form-scrape flow (login page,
+form POST, password grant, admin token, user lookup) with the single-grant
+fast path, reporting per-login latency and Keycloak calls per login.
+
+Usage (from src/): python -m benchmarks.login [--users 1 20 100] [--latency 0.05]
+"""
+import argparse
+import asyncio
+import re
+import time
+from benchmarks.common import FakeUpstream, FakeRequest, REALM, summarize
+
+from core import upstream, auth
+from core.config import KEYCLOAK_URL, OR_HOSTNAME
+
+async def legacy_login(request, realm, username, password):
+    """The login flow as it was before the fast path, kept here for comparison."""
+    async with upstream.session() as session:
+        auth_url = f"{KEYCLOAK_URL}/realms/{realm}/protocol/openid-connect/auth"
+        params = {"client_id": "openremote", "redirect_uri": f"https://{OR_HOSTNAME}/manager/", "response_type": "code", "scope": "openid"}
+        headers = {"Host": OR_HOSTNAME}
+        resp = await session.get(auth_url, params=params, headers=headers)
+        resp.raise_for_status()
+        action_url = re.search(r'action="([^"]+)"', resp.text).group(1).replace("&amp;", "&")
+        payload = {"username": username, "password": password, "credentialId": ""}
+        post_resp = await session.post(action_url, data=payload, headers=headers, follow_redirects=False)
+    if post_resp.status_code != 302:
+        return False, "Invalid username or password"
+    request.session["realm"] = realm
+    request.session["username"] = username
+    token_data = await auth.get_user_token(realm, username, password)
+    if token_data:
+        request.session["access_token"] = token_data.get("access_token")
+        request.session["refresh_token"] = token_data.get("refresh_token")
+    admin_token = await auth.get_admin_token(realm)
+    if admin_token:
+        request.session["user_id"] = await auth.get_user_id_by_username(realm, username, admin_token)
+    return True, None
+
+async def storm(login, users, offset):
+    latencies = []
+
+    async def one(i):
+        request = FakeRequest({})
+        started = time.perf_counter()
+        success, _ = await login(request, REALM, f"user{offset + i}", "secret")
+        latencies.append(time.perf_counter() - started)
+        assert success and request.session.get("user_id") == f"user{offset + i}", request.session
+
+    await asyncio.gather(*(one(i) for i in range(users)))
+    return latencies
+
+async def main(args):
+    async with FakeUpstream(latency=args.latency) as fake:
+        offset = 0
+        for users in args.users:
+            for label, login in (("legacy", legacy_login), ("fast path", auth.perform_auto_login_logic)):
+                fake.calls.clear()
+                auth.invalidate_admin_token()
+                latencies = await storm(login, users, offset)
+                offset += users
+                summarize(f"{label} {users} users", latencies)
+                print(f"{'':<32} keycloak calls/login={sum(fake.calls.values()) / users:5.2f}  {fake.calls}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 20, 100])
+    parser.add_argument("--latency", type=float, default=0.05)
+    asyncio.run(main(parser.parse_args()))
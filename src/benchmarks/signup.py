@@ -0,0 +1,73 @@
+"""
+Times the signup flow (`routes.auth.signup_post`) against a fake Keycloak with
+a fixed latency. Compares the old sequence (create, look the user up, fetch the
+client UUID and the full client-role list, assign) with the current one, which
+takes the user id from the Location header and the roles from the cached catalog.
+
+Usage (from src/): python -m benchmarks.signup [--users 1 20 100] [--latency 0.05]
+"""
+import argparse
+import asyncio
+import time
+from benchmarks.common import FakeUpstream, FakeRequest, REALM, summarize
+
+from core import upstream, auth
+from core.config import KEYCLOAK_URL
+from core.keycloak_catalog import invalidate_catalog
+from routes import auth as auth_routes
+
+class SignupRequest(FakeRequest):
+    """Also answers the template's url_for('static', ...) calls."""
+    def url_for(self, name, **params):
+        return f"/{name}/{params.get('path', '')}"
+
+async def legacy_signup(request, username, email, password, terms):
+    """The signup calls as they were before the catalog cache, kept for comparison."""
+    admin_token = await auth.get_admin_token(REALM)
+    headers = {"Authorization": f"Bearer {admin_token}", "Content-Type": "application/json"}
+    user_data = {"username": username, "email": email, "enabled": True,
+                 "credentials": [{"type": "password", "value": password, "temporary": False}]}
+    res = await upstream.post(f"{KEYCLOAK_URL}/admin/realms/{REALM}/users", json=user_data, headers=headers)
+    assert res.status_code == 201
+    user_id = await auth.get_user_id_by_username(REALM, username, admin_token)
+    res = await upstream.get(f"{KEYCLOAK_URL}/admin/realms/{REALM}/clients?clientId=openremote", headers=headers)
+    client_uuid = res.json()[0]["id"]
+    res = await upstream.get(f"{KEYCLOAK_URL}/admin/realms/{REALM}/clients/{client_uuid}/roles", headers=headers)
+    roles = [r for r in res.json() if r["name"] in auth._SIGNUP_ROLES]
+    await upstream.post(f"{KEYCLOAK_URL}/admin/realms/{REALM}/users/{user_id}/role-mappings/clients/{client_uuid}", json=roles, headers=headers)
+
+async def current_signup(request, username, email, password, terms):
+    response = await auth_routes.signup_post(request, username=username, email=email, password=password, terms=terms)
+    assert "error" not in response.context, response.context.get("error")
+
+async def storm(signup, users, offset):
+    latencies = []
+
+    async def one(i):
+        name = f"new-user{offset + i}"
+        started = time.perf_counter()
+        await signup(SignupRequest({}), name, f"{name}@example.com", "secret", "on")
+        latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(one(i) for i in range(users)))
+    return latencies
+
+async def main(args):
+    async with FakeUpstream(latency=args.latency) as fake:
+        offset = 0
+        for users in args.users:
+            for label, signup in (("legacy", legacy_signup), ("cached catalog", current_signup)):
+                # Start every run cold; the admin token is fetched once up front by both
+                invalidate_catalog()
+                await auth.get_admin_token(REALM)
+                fake.calls.clear()
+                latencies = await storm(signup, users, offset)
+                offset += users
+                summarize(f"{label} {users} users", latencies)
+                print(f"{'':<32} keycloak calls/signup={sum(fake.calls.values()) / users:5.2f}  {fake.calls}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 20, 100])
+    parser.add_argument("--latency", type=float, default=0.05)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,173 @@
+import asyncio
+import json
+import weakref
+from core import upstream
+from core.cache import UpstreamError
+from core.config import OR_MANAGER_URL
+from core.snapshots import invalidate_asset
+from core.timers import update_timer
+
+# One writer per asset at a time, so two merges in this process never interleave.
+# Other workers have their own locks: this does not serialise across processes.
+_locks = weakref.WeakValueDictionary()
+patch_stats = {"patches": 0, "attribute_writes": 0, "asset_writes": 0, "unchanged": 0, "conflicts": 0}
+
+class PatchConflict(Exception):
+    """The asset changed since the client read it; `current` holds the attributes that differ."""
+    def __init__(self, message, current=None):
+        super().__init__(message)
+        self.current = current or {}
+
+def _lock(realm, asset_id):
+    lock = _locks.get((realm, asset_id))
+    if lock is None:
+        lock = asyncio.Lock()
+        _locks[(realm, asset_id)] = lock
+    return lock
+
+def _parsed(value):
+    if isinstance(value, str):
+        try:
+            parsed = json.loads(value)
+            if isinstance(parsed, dict):
+                return parsed
+        except ValueError:
+            pass
+    return value
+
+def merge_attribute(current, change):
+    """
+    New value for one attribute. `change` is {"value": v} to replace it, or
+    {"set": {key: v}, "unset": [key]} to edit keys of an object value.
+    """
+    if "value" in change:
+        return change["value"]
+    base = _parsed(current)
+    base = dict(base) if isinstance(base, dict) else {}
+    base.pop("_timestamp", None)
+    base.update(change.get("set") or {})
+    for key in change.get("unset") or []:
+        base.pop(key, None)
+    return base
+
+def _check_expectations(asset, expect, version):
+    if version is not None and asset.get("version") != version:
+        raise PatchConflict("Asset was modified", {"version": asset.get("version")})
+    stale = {}
+    for name, timestamp in (expect or {}).items():
+        attr = asset.get("attributes", {}).get(name) or {}
+        if attr.get("timestamp") != timestamp:
+            stale[name] = {"value": attr.get("value"), "timestamp": attr.get("timestamp")}
+    if stale:
+        raise PatchConflict("Attributes were modified", stale)
+
+async def _read(realm, asset_id, headers):
+    res = await upstream.get(f"{OR_MANAGER_URL}/api/{realm}/asset/{asset_id}", headers=headers)
+    if res.status_code != 200:
+        raise UpstreamError(res.status_code)
+    return res.json()
+
+async def _rename(realm, asset_id, headers, name, version):
+    # The manager only takes whole assets, so the PUT must carry current attribute
+    # values: value updates do not bump `version`, so a cached snapshot could
+    # write old sensor and relay values back. A 409 is retried once.
+    asset = await _read(realm, asset_id, headers)
+    for attempt in range(2):
+        _check_expectations(asset, None, version)
+        if asset.get("name") == name:
+            patch_stats["unchanged"] += 1
+            return False
+        res = await upstream.put(
+            f"{OR_MANAGER_URL}/api/{realm}/asset/{asset_id}",
+            json=dict(asset, name=name), headers=headers
+        )
+        invalidate_asset(realm, asset_id)
+        if res.status_code in [200, 204]:
+            patch_stats["asset_writes"] += 1
+            return True
+        if res.status_code != 409:
+            raise UpstreamError(res.status_code, res.text)
+        if attempt:
+            raise PatchConflict("Asset was modified")
+        asset = await _read(realm, asset_id, headers)
+    return False
+
+async def patch_asset(realm, asset_id, user_id, access_token, name=None, attributes=None, expect=None, version=None, force=False):
+    """
+    Applies a partial update and writes only what actually changed.
+
+    `attributes` maps attribute names to changes (see merge_attribute); `expect`
+    maps attribute names to the timestamps the client read, and `version` is the
+    asset version it read. Raises PatchConflict when either no longer matches.
+    With `force`, attributes are written even if their value is unchanged (devices
+    treat a fresh write as a keep-alive); forced {"value": v} changes without
+    checks are written without reading the asset. Returns {attribute: new value} written.
+
+    Every other patch reads the asset uncached first: key-level merges and the
+    checks need the manager's current values, so this costs a GET per write
+    rather than saving one. The checks are check-then-write and the lock is per
+    process, so they only rule out conflicts between requests in this worker;
+    a write from another worker or client can still land between the read and
+    the attribute PUTs, which carry no version. Whole-asset writes (renames)
+    send the version read and surface the manager's 409 as PatchConflict.
+    """
+    patch_stats["patches"] += 1
+    headers = {"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"}
+    async with _lock(realm, asset_id):
+        try:
+            if name is not None and not attributes and not expect:
+                await _rename(realm, asset_id, headers, name, version)
+                return {}
+
+            if force and name is None and not expect and version is None and attributes \
+                    and all("value" in change for change in attributes.values()):
+                # Forced whole-value writes (keep-alives) neither merge nor compare,
+                # so there is nothing to read first
+                asset = None
+                changed = {attr: change["value"] for attr, change in attributes.items()}
+            else:
+                # Key-level merges must start from the manager's current values
+                asset = await _read(realm, asset_id, headers)
+                _check_expectations(asset, expect, version)
+
+                current = {k: (v or {}).get("value") for k, v in asset.get("attributes", {}).items()}
+                changed = {}
+                for attr, change in (attributes or {}).items():
+                    value = merge_attribute(current.get(attr), change)
+                    if force or value != _parsed(current.get(attr)):
+                        changed[attr] = value
+
+            if asset is not None and name is not None and name != asset.get("name"):
+                # A rename needs the whole asset anyway: send the merged attributes with it
+                body = dict(asset, name=name, attributes={
+                    k: dict(v, value=changed[k]) if k in changed else v
+                    for k, v in asset.get("attributes", {}).items()
+                })
+                for attr in changed.keys() - body["attributes"].keys():
+                    body["attributes"][attr] = {"name": attr, "value": changed[attr]}
+                res = await upstream.put(f"{OR_MANAGER_URL}/api/{realm}/asset/{asset_id}", json=body, headers=headers)
+                if res.status_code == 409:
+                    raise PatchConflict("Asset was modified")
+                if res.status_code not in [200, 204]:
+                    raise UpstreamError(res.status_code, res.text)
+                patch_stats["asset_writes"] += 1
+            elif changed:
+                results = await asyncio.gather(*[
+                    upstream.put(f"{OR_MANAGER_URL}/api/{realm}/asset/{asset_id}/attribute/{attr}", json=value, headers=headers)
+                    for attr, value in changed.items()
+                ])
+                patch_stats["attribute_writes"] += len(results)
+                failed = [res for res in results if res.status_code not in [200, 204]]
+                if failed:
+                    raise UpstreamError(failed[0].status_code, failed[0].text)
+            else:
+                patch_stats["unchanged"] += 1
+        except PatchConflict:
+            patch_stats["conflicts"] += 1
+            raise
+        finally:
+            invalidate_asset(realm, asset_id)
+
+    for attr, value in changed.items():
+        update_timer(realm, asset_id, attr, value)
+    return changed
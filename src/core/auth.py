@@ -1,10 +1,15 @@
-import requests
-import json
-import base64
+import asyncio
+import hashlib
 import re
 import time
+from collections import deque
 from fastapi import Request
 from fastapi.responses import RedirectResponse
+from core import upstream
+from core.tokens import verify_token, InvalidToken
+from core.cache import UpstreamError
+from core.sessions import rotate_session
+from core.keycloak_catalog import get_client_uuid, get_client_roles, get_realm_roles, invalidate_catalog
 from core.config import (
     KEYCLOAK_URL, OR_HOSTNAME, OR_ADMIN_PASSWORD, OR_MANAGER_URL,
     DEFAULT_REALM, ASSIGN_ROLE_READ_ALARMS, ASSIGN_ROLE_READ_ASSETS,
@@ -12,111 +17,202 @@ from core.config import (
     ASSIGN_ROLE_READ_SERVICES, ASSIGN_ROLE_READ_USERS, ASSIGN_ROLE_WRITE_ALARMS,
     ASSIGN_ROLE_WRITE_ASSETS, ASSIGN_ROLE_WRITE_ATTRIBUTES, ASSIGN_ROLE_WRITE_INSIGHTS,
     ASSIGN_ROLE_WRITE_LOGS, ASSIGN_ROLE_WRITE_RULES, ASSIGN_ROLE_WRITE_SERVICES,
-    ASSIGN_ROLE_WRITE_USER
+    ASSIGN_ROLE_WRITE_USER, ADMIN_TOKEN_REFRESH_MARGIN,
+    USER_TOKEN_REFRESH_MARGIN, USER_TOKEN_REFRESH_JITTER, USER_TOKEN_MIN_VALIDITY,
+    LOGIN_MANAGER_SSO
 )
 
-def get_admin_token(realm):
-    """Fetches the admin token from the Master realm."""
+# Process-wide cache for the master-realm admin token. Every admin-backed
+# endpoint shares it; `_admin_lock` makes concurrent misses wait for a single
+# Keycloak grant instead of each issuing their own.
+_admin_token = {"access_token": None, "refresh_token": None, "expires_at": 0, "refresh_expires_at": 0}
+_admin_lock = None
+admin_token_stats = {"hits": 0, "misses": 0, "refreshes": 0, "grants": 0, "errors": 0, "rejected": 0}
+
+def _admin_token_fresh(now):
+    return _admin_token["access_token"] and _admin_token["expires_at"] - ADMIN_TOKEN_REFRESH_MARGIN > now
+
+async def _request_admin_token(data):
     url = f"{KEYCLOAK_URL}/realms/master/protocol/openid-connect/token"
-    data = {
-        "grant_type": "password",
-        "client_id": "openremote",
-        "username": "admin",
-        "password": OR_ADMIN_PASSWORD
-    }
     headers = {"Host": OR_HOSTNAME}
-    try:
-        resp = requests.post(url, data=data, headers=headers)
-        resp.raise_for_status()
-        return resp.json().get("access_token")
-    except Exception as e:
-        print(f"[TOKEN] Admin token error: {e}")
-        return None
+    resp = await upstream.post(url, data=data, headers=headers)
+    resp.raise_for_status()
+    tokens = resp.json()
+    now = time.time()
+    _admin_token["access_token"] = tokens.get("access_token")
+    _admin_token["refresh_token"] = tokens.get("refresh_token")
+    _admin_token["expires_at"] = now + tokens.get("expires_in", 60)
+    _admin_token["refresh_expires_at"] = now + tokens.get("refresh_expires_in", 0)
+    return _admin_token["access_token"]
+
+async def get_admin_token(realm):
+    """Returns a cached admin token from the Master realm, renewing it shortly before it expires."""
+    if _admin_token_fresh(time.time()):
+        admin_token_stats["hits"] += 1
+        return _admin_token["access_token"]
+
+    global _admin_lock
+    if _admin_lock is None:
+        # Created lazily so it binds to the server's event loop, not the import-time one
+        _admin_lock = asyncio.Lock()
+    async with _admin_lock:
+        now = time.time()
+        # Another request may have renewed the token while we waited for the lock
+        if _admin_token_fresh(now):
+            admin_token_stats["hits"] += 1
+            return _admin_token["access_token"]
+
+        admin_token_stats["misses"] += 1
+        if _admin_token["refresh_token"] and _admin_token["refresh_expires_at"] - ADMIN_TOKEN_REFRESH_MARGIN > now:
+            try:
+                token = await _request_admin_token({
+                    "grant_type": "refresh_token",
+                    "client_id": "openremote",
+                    "refresh_token": _admin_token["refresh_token"]
+                })
+                admin_token_stats["refreshes"] += 1
+                return token
+            except Exception as e:
+                print(f"[TOKEN] Admin token refresh failed, falling back to password grant: {e}")
+
+        try:
+            token = await _request_admin_token({
+                "grant_type": "password",
+                "client_id": "openremote",
+                "username": "admin",
+                "password": OR_ADMIN_PASSWORD
+            })
+            admin_token_stats["grants"] += 1
+            return token
+        except Exception as e:
+            admin_token_stats["errors"] += 1
+            print(f"[TOKEN] Admin token error: {e}")
+            return None
+
+def invalidate_admin_token(rejected=None):
+    """
+    Drops the cached admin token after Keycloak or the manager rejected it (e.g.
+    revoked before expiry). With `rejected`, only that token is dropped, so a
+    burst of 401s for the same token does not discard its replacement.
+    """
+    if rejected is not None and _admin_token["access_token"] != rejected:
+        return
+    admin_token_stats["rejected"] += 1
+    _admin_token.update({"access_token": None, "refresh_token": None, "expires_at": 0, "refresh_expires_at": 0})
+
+async def admin_request(realm, method, url, headers=None, **kwargs):
+    """
+    Sends an admin-API request with the cached admin token. On a 401 the token is
+    dropped and the request retried once with a new one. Returns the response,
+    or None when no admin token could be obtained.
+    """
+    for attempt in range(2):
+        admin_token = await get_admin_token(realm)
+        if not admin_token:
+            return None
+        res = await upstream.request(method, url, headers=dict(headers or {}, Authorization=f"Bearer {admin_token}"), **kwargs)
+        if res.status_code != 401 or attempt:
+            return res
+        invalidate_admin_token(admin_token)
 
-def assign_roles_to_user(realm, user_id, admin_token):
-    """Assigns roles using the Keycloak Admin API directly."""
+async def with_admin_token(realm, fn):
+    """
+    Awaits `fn(admin_token)`, e.g. a cached admin-backed loader. If it raises
+    UpstreamError 401 the token is dropped and `fn` retried once with a new one.
+    """
+    admin_token = await get_admin_token(realm)
     try:
-        headers = {
-            "Authorization": f"Bearer {admin_token}",
-            "Content-Type": "application/json"
-        }
-        clients_url = f"{KEYCLOAK_URL}/admin/realms/{realm}/clients?clientId=openremote"
-        res = requests.get(clients_url, headers=headers)
-        if res.status_code != 200 or not res.json():
-            return False
-            
-        client_uuid = res.json()[0]['id']
-        roles_url = f"{KEYCLOAK_URL}/admin/realms/{realm}/clients/{client_uuid}/roles"
-        res = requests.get(roles_url, headers=headers)
-        if res.status_code != 200:
-            return False
-            
-        all_roles = res.json()
-        role_map = [
-            (ASSIGN_ROLE_READ_ALARMS, "read:alarms"),
-            (ASSIGN_ROLE_READ_ASSETS, "read:assets"),
-            (ASSIGN_ROLE_READ_INSIGHTS, "read:insights"),
-            (ASSIGN_ROLE_READ_LOGS, "read:logs"),
-            (ASSIGN_ROLE_READ_RULES, "read:rules"),
-            (ASSIGN_ROLE_READ_SERVICES, "read:services"),
-            (ASSIGN_ROLE_READ_USERS, "read:users"),
-            (ASSIGN_ROLE_WRITE_ALARMS, "write:alarms"),
-            (ASSIGN_ROLE_WRITE_ASSETS, "write:assets"),
-            (ASSIGN_ROLE_WRITE_ATTRIBUTES, "write:attributes"),
-            (ASSIGN_ROLE_WRITE_INSIGHTS, "write:insights"),
-            (ASSIGN_ROLE_WRITE_LOGS, "write:logs"),
-            (ASSIGN_ROLE_WRITE_RULES, "write:rules"),
-            (ASSIGN_ROLE_WRITE_SERVICES, "write:services"),
-            (ASSIGN_ROLE_WRITE_USER, "write:user"),
-        ]
-        
-        wanted_roles = {name for enabled, name in role_map if enabled}
-        roles_to_assign = [r for r in all_roles if r['name'] in wanted_roles]
-
-        if not roles_to_assign:
-            return True
-
-        assign_url = f"{KEYCLOAK_URL}/admin/realms/{realm}/users/{user_id}/role-mappings/clients/{client_uuid}"
-        res = requests.post(assign_url, json=roles_to_assign, headers=headers)
-        return res.status_code in [200, 204]
-    except Exception as e:
-        print(f"[ROLE] Assignment error: {e}")
-        return False
+        return await fn(admin_token)
+    except UpstreamError as e:
+        if e.status_code != 401:
+            raise
+        invalidate_admin_token(admin_token)
+    return await fn(await get_admin_token(realm))
+
+# Client roles granted to every new account, per the ASSIGN_ROLE_* switches
+_SIGNUP_ROLES = frozenset(name for enabled, name in [
+    (ASSIGN_ROLE_READ_ALARMS, "read:alarms"),
+    (ASSIGN_ROLE_READ_ASSETS, "read:assets"),
+    (ASSIGN_ROLE_READ_INSIGHTS, "read:insights"),
+    (ASSIGN_ROLE_READ_LOGS, "read:logs"),
+    (ASSIGN_ROLE_READ_RULES, "read:rules"),
+    (ASSIGN_ROLE_READ_SERVICES, "read:services"),
+    (ASSIGN_ROLE_READ_USERS, "read:users"),
+    (ASSIGN_ROLE_WRITE_ALARMS, "write:alarms"),
+    (ASSIGN_ROLE_WRITE_ASSETS, "write:assets"),
+    (ASSIGN_ROLE_WRITE_ATTRIBUTES, "write:attributes"),
+    (ASSIGN_ROLE_WRITE_INSIGHTS, "write:insights"),
+    (ASSIGN_ROLE_WRITE_LOGS, "write:logs"),
+    (ASSIGN_ROLE_WRITE_RULES, "write:rules"),
+    (ASSIGN_ROLE_WRITE_SERVICES, "write:services"),
+    (ASSIGN_ROLE_WRITE_USER, "write:user"),
+] if enabled)
+
+async def _post_role_mapping(assign_url, roles, admin_token):
+    headers = {
+        "Authorization": f"Bearer {admin_token}",
+        "Content-Type": "application/json"
+    }
+    res = await upstream.post(assign_url, json=roles, headers=headers)
+    return res.status_code
+
+async def assign_roles_to_user(realm, user_id, admin_token):
+    """Assigns the signup client roles using the Keycloak Admin API and the cached role catalog."""
+    for attempt in range(2):
+        try:
+            client_uuid = await get_client_uuid(realm, "openremote", admin_token)
+            all_roles = await get_client_roles(realm, client_uuid, admin_token)
+            roles_to_assign = [role for name, role in all_roles.items() if name in _SIGNUP_ROLES]
+            if not roles_to_assign:
+                return True
+
+            assign_url = f"{KEYCLOAK_URL}/admin/realms/{realm}/users/{user_id}/role-mappings/clients/{client_uuid}"
+            status = await _post_role_mapping(assign_url, roles_to_assign, admin_token)
+            if status in [200, 204]:
+                return True
+            if status not in [400, 404] or attempt:
+                return False
+        except Exception as e:
+            print(f"[ROLE] Assignment error: {e}")
+            if attempt:
+                return False
+        # The client or a role may have been recreated under a new id: reload the catalog once
+        invalidate_catalog(realm)
+    return False
 
-def get_user_id_by_username(realm, username, admin_token):
+async def get_user_id_by_username(realm, username, admin_token):
     url = f"{KEYCLOAK_URL}/admin/realms/{realm}/users"
     params = {"username": username, "exact": True}
     headers = {"Authorization": f"Bearer {admin_token}"}
     try:
-        res = requests.get(url, params=params, headers=headers)
+        res = await upstream.get(url, params=params, headers=headers)
         if res.status_code == 200 and res.json():
             return res.json()[0]['id']
     except Exception as e:
         print(f"[USER] Lookup error: {e}")
     return None
 
-def assign_realm_roles(realm, user_id, role_names, admin_token):
-    try:
-        headers = {
-            "Authorization": f"Bearer {admin_token}",
-            "Content-Type": "application/json"
-        }
-        roles_url = f"{KEYCLOAK_URL}/admin/realms/{realm}/roles"
-        res = requests.get(roles_url, headers=headers)
-        if res.status_code != 200:
-            return False
-        all_roles = res.json()
-        roles_to_assign = [r for r in all_roles if r['name'] in role_names]
-        if not roles_to_assign:
-            return False
-        assign_url = f"{KEYCLOAK_URL}/admin/realms/{realm}/users/{user_id}/role-mappings/realm"
-        res = requests.post(assign_url, json=roles_to_assign, headers=headers)
-        return res.status_code in [200, 204]
-    except Exception as e:
-        print(f"[ROLE] Realm role assignment error: {e}")
-        return False
+async def assign_realm_roles(realm, user_id, role_names, admin_token):
+    for attempt in range(2):
+        try:
+            all_roles = await get_realm_roles(realm, admin_token)
+            roles_to_assign = [role for name, role in all_roles.items() if name in role_names]
+            if not roles_to_assign:
+                return False
+            assign_url = f"{KEYCLOAK_URL}/admin/realms/{realm}/users/{user_id}/role-mappings/realm"
+            status = await _post_role_mapping(assign_url, roles_to_assign, admin_token)
+            if status in [200, 204]:
+                return True
+            if status not in [400, 404] or attempt:
+                return False
+        except Exception as e:
+            print(f"[ROLE] Realm role assignment error: {e}")
+            if attempt:
+                return False
+        invalidate_catalog(realm)
+    return False
 
-def get_user_token(realm, username, password):
+async def get_user_token(realm, username, password):
     url = f"{KEYCLOAK_URL}/realms/{realm}/protocol/openid-connect/token"
     payload = {
         "client_id": "openremote",
@@ -126,14 +222,14 @@ def get_user_token(realm, username, password):
     }
     headers = {"Host": OR_HOSTNAME}
     try:
-        res = requests.post(url, data=payload, headers=headers, verify=False)
+        res = await upstream.post(url, data=payload, headers=headers)
         if res.status_code == 200:
             return res.json()
     except Exception as e:
         print(f"[AUTH] Token error: {e}")
     return None
 
-def refresh_user_token(realm, refresh_token):
+async def refresh_user_token(realm, refresh_token):
     url = f"{KEYCLOAK_URL}/realms/{realm}/protocol/openid-connect/token"
     payload = {
         "client_id": "openremote",
@@ -142,14 +238,98 @@ def refresh_user_token(realm, refresh_token):
     }
     headers = {"Host": OR_HOSTNAME}
     try:
-        res = requests.post(url, data=payload, headers=headers, verify=False)
+        res = await upstream.post(url, data=payload, headers=headers)
         if res.status_code == 200:
             return res.json()
     except Exception as e:
         print(f"[AUTH] Refresh error: {e}")
     return None
 
-def get_valid_token(request: Request):
+def _attach_claims(request, claims):
+    request.state.claims = claims
+    request.state.user_id = request.session.get("user_id") or claims.get("sub")
+
+def current_user_id(request: Request):
+    """The caller's user id as set by get_valid_token (call that first)."""
+    return getattr(request.state, "user_id", None) or request.session.get("user_id")
+
+# Per-session single-flight refresh. Keyed by the refresh token, which identifies
+# the session: every request of a session awaits the same Keycloak call, and the
+# result is kept so requests still carrying the old tokens pick it up instead of
+# refreshing again with an already rotated refresh token.
+_refreshing = {}  # refresh_token -> asyncio.Task
+_refreshed = {}   # old refresh_token -> (new tokens, stored_at)
+_REFRESHED_TTL = 120
+_failed_at = {}  # refresh_token -> monotonic time of the last failed refresh
+_RETRY_AFTER_FAILURE = 10
+_refresh_times = deque()
+refresh_stats = {"refreshes": 0, "background": 0, "waited": 0, "coalesced": 0, "reused": 0, "failures": 0}
+
+def _refresh_due(access_token, exp):
+    """Expiry minus the margin and a stable per-token jitter."""
+    jitter = int.from_bytes(hashlib.sha256(access_token.encode()).digest()[:2], "big") % (USER_TOKEN_REFRESH_JITTER + 1)
+    return exp - USER_TOKEN_REFRESH_MARGIN - jitter
+
+def _prune_refresh_times(now):
+    while _refresh_times and now - _refresh_times[0] > 60:
+        _refresh_times.popleft()
+
+def _count_refresh():
+    now = time.monotonic()
+    _refresh_times.append(now)
+    _prune_refresh_times(now)
+    refresh_stats["refreshes"] += 1
+
+def user_refresh_stats():
+    """refresh_stats plus the number of refreshes in the last minute, counted now."""
+    _prune_refresh_times(time.monotonic())
+    return dict(refresh_stats, per_minute=len(_refresh_times))
+
+def _prune_refreshed():
+    now = time.monotonic()
+    for key in [k for k, (_, at) in _refreshed.items() if now - at > _REFRESHED_TTL]:
+        del _refreshed[key]
+    for key in [k for k, at in _failed_at.items() if now - at > _RETRY_AFTER_FAILURE]:
+        del _failed_at[key]
+
+async def _do_refresh(realm, refresh_token):
+    try:
+        tokens = await refresh_user_token(realm, refresh_token)
+        _count_refresh()
+        if tokens:
+            _prune_refreshed()
+            _refreshed[refresh_token] = (tokens, time.monotonic())
+        else:
+            refresh_stats["failures"] += 1
+            _failed_at[refresh_token] = time.monotonic()
+        return tokens
+    finally:
+        _refreshing.pop(refresh_token, None)
+
+def _start_refresh(realm, refresh_token):
+    task = _refreshing.get(refresh_token)
+    if task is None:
+        task = asyncio.ensure_future(_do_refresh(realm, refresh_token))
+        _refreshing[refresh_token] = task
+    else:
+        refresh_stats["coalesced"] += 1
+    return task
+
+def _apply_tokens(request, tokens):
+    request.session["access_token"] = tokens.get("access_token")
+    if "refresh_token" in tokens:
+        request.session["refresh_token"] = tokens.get("refresh_token")
+
+async def get_valid_token(request: Request):
+    """
+    The session's access token, or None. The token is verified locally against
+    the realm keys; its claims are attached to `request.state.claims` and the
+    user id to `request.state.user_id`.
+
+    Renewal starts in the background shortly before expiry (with jitter) and is
+    shared by all requests of the session; a request only waits for it when the
+    current token is about to expire.
+    """
     access_token = request.session.get("access_token")
     refresh_token = request.session.get("refresh_token")
     realm = request.session.get("realm", DEFAULT_REALM)
@@ -158,37 +338,54 @@ def get_valid_token(request: Request):
         return None
 
     try:
-        parts = access_token.split(".")
-        if len(parts) > 1:
-            payload_b64 = parts[1]
-            payload_b64 += "=" * ((4 - len(payload_b64) % 4) % 4)
-            payload_json = base64.urlsafe_b64decode(payload_b64).decode()
-            exp = json.loads(payload_json).get("exp")
-            
-            current_time = time.time()
-            if exp and (exp - current_time < 60):
-                if refresh_token:
-                    new_tokens = refresh_user_token(realm, refresh_token)
-                    if new_tokens:
-                        request.session["access_token"] = new_tokens.get("access_token")
-                        if "refresh_token" in new_tokens:
-                            request.session["refresh_token"] = new_tokens.get("refresh_token")
-                        return new_tokens.get("access_token") 
-                if exp < current_time:
-                    request.session.clear()
-                    return None
+        # A refresh finished for this session since the client's tokens were issued
+        done = _refreshed.get(refresh_token) if refresh_token else None
+        if done is not None:
+            refresh_stats["reused"] += 1
+            _apply_tokens(request, done[0])
+            access_token = request.session.get("access_token")
+            refresh_token = request.session.get("refresh_token")
+
+        claims = await verify_token(realm, access_token)
+        exp = claims.get("exp")
+        current_time = time.time()
+        if exp and refresh_token and current_time >= _refresh_due(access_token, exp):
+            remaining = exp - current_time
+            recently_failed = time.monotonic() - _failed_at.get(refresh_token, -_RETRY_AFTER_FAILURE) < _RETRY_AFTER_FAILURE
+            if remaining > USER_TOKEN_MIN_VALIDITY:
+                # Renew off the request path; this request still uses the current token
+                if not recently_failed:
+                    refresh_stats["background"] += 1
+                    _start_refresh(realm, refresh_token)
+            else:
+                task = _start_refresh(realm, refresh_token)
+                refresh_stats["waited"] += 1
+                new_tokens = await asyncio.shield(task)
+                if new_tokens:
+                    new_claims = await verify_token(realm, new_tokens.get("access_token"))
+                    _apply_tokens(request, new_tokens)
+                    _attach_claims(request, new_claims)
+                    return new_tokens.get("access_token")
+        if exp and exp < current_time:
+            request.session.clear()
+            return None
+        _attach_claims(request, claims)
+    except InvalidToken as e:
+        print(f"[AUTH] Rejected session token: {e}")
+        request.session.clear()
+        return None
     except Exception as e:
         print(f"[AUTH] Token validation error: {e}")
         return None
     return access_token
 
-def perform_auto_login_logic(request: Request, realm: str, username: str, password: str):
+async def establish_manager_sso(realm: str, username: str, password: str):
     """
-    Helper function to perform the auto-login dance.
-    Returns (success, response_or_error_msg)
+    Logs in through the Keycloak login form so the returned cookie jar carries
+    the manager's SSO session (KEYCLOAK_IDENTITY etc.). Only needed when the
+    browser is handed over to the OpenRemote manager UI; returns None on failure.
     """
-    try:
-        session = requests.Session()
+    async with upstream.session() as session:
         auth_url = f"{KEYCLOAK_URL}/realms/{realm}/protocol/openid-connect/auth"
         params = {
             "client_id": "openremote",
@@ -197,39 +394,76 @@ def perform_auto_login_logic(request: Request, realm: str, username: str, passwo
             "scope": "openid"
         }
         headers = {"Host": OR_HOSTNAME}
-        resp = session.get(auth_url, params=params, headers=headers, verify=False)
+        resp = await session.get(auth_url, params=params, headers=headers)
         resp.raise_for_status()
-        
+
         match = re.search(r'action="([^"]+)"', resp.text)
         if not match:
-            return False, "Could not find login form action"
-            
+            print("[LOGIN] Could not find login form action")
+            return None
+
         action_url = match.group(1).replace("&amp;", "&")
         target_url = action_url
         if f"https://{OR_HOSTNAME}/auth" in action_url:
             target_url = action_url.replace(f"https://{OR_HOSTNAME}/auth", KEYCLOAK_URL)
         elif f"http://{OR_HOSTNAME}/auth" in action_url:
             target_url = action_url.replace(f"http://{OR_HOSTNAME}/auth", KEYCLOAK_URL)
-            
+
         payload = {"username": username, "password": password, "credentialId": ""}
-        post_resp = session.post(target_url, data=payload, headers=headers, allow_redirects=False, verify=False)
-        
-        if post_resp.status_code == 302:
-            request.session["realm"] = realm
-            request.session["username"] = username
-            token_data = get_user_token(realm, username, password)
-            if token_data:
-                request.session["access_token"] = token_data.get("access_token")
-                request.session["refresh_token"] = token_data.get("refresh_token")
-            
-            admin_token = get_admin_token(realm)
-            if admin_token:
-                user_id = get_user_id_by_username(realm, username, admin_token)
-                request.session["user_id"] = user_id
-            
-            return True, session.cookies
+        post_resp = await session.post(target_url, data=payload, headers=headers, follow_redirects=False)
+        return session.cookies if post_resp.status_code == 302 else None
+
+login_stats = {"logins": 0, "rejected": 0, "errors": 0, "user_id_lookups": 0}
+
+async def perform_auto_login_logic(request: Request, realm: str, username: str, password: str):
+    """
+    Logs the user in with a single password grant and fills the session.
+    The user id comes from the token's `sub` claim (the admin lookup is only a
+    fallback) and the manager SSO cookie is fetched only with LOGIN_MANAGER_SSO.
+    Returns (success, sso_cookies_or_error_msg)
+    """
+    url = f"{KEYCLOAK_URL}/realms/{realm}/protocol/openid-connect/token"
+    payload = {
+        "client_id": "openremote",
+        "username": username,
+        "password": password,
+        "grant_type": "password"
+    }
+    try:
+        grant = upstream.post(url, data=payload, headers={"Host": OR_HOSTNAME})
+        if LOGIN_MANAGER_SSO:
+            res, cookies = await asyncio.gather(grant, establish_manager_sso(realm, username, password))
         else:
+            res, cookies = await grant, None
+
+        if res.status_code in (400, 401):
+            login_stats["rejected"] += 1
             return False, "Invalid username or password"
+        res.raise_for_status()
+        token_data = res.json()
+        access_token = token_data.get("access_token")
+
+        user_id = None
+        try:
+            # Also warms the claims cache for the dashboard's first requests
+            user_id = (await verify_token(realm, access_token)).get("sub")
+        except (InvalidToken, UpstreamError) as e:
+            print(f"[LOGIN] Could not read token claims: {e}")
+        if not user_id:
+            login_stats["user_id_lookups"] += 1
+            admin_token = await get_admin_token(realm)
+            if admin_token:
+                user_id = await get_user_id_by_username(realm, username, admin_token)
+
+        rotate_session(request)
+        request.session["realm"] = realm
+        request.session["username"] = username
+        request.session["access_token"] = access_token
+        request.session["refresh_token"] = token_data.get("refresh_token")
+        request.session["user_id"] = user_id
+        login_stats["logins"] += 1
+        return True, cookies
     except Exception as e:
+        login_stats["errors"] += 1
         print(f"[LOGIN] Auto-login logic error: {e}")
         return False, str(e)
@@ -0,0 +1,117 @@
+import asyncio
+import time
+
+class UpstreamError(Exception):
+    """Raised by cache fetchers when the upstream answered with a non-success status."""
+    def __init__(self, status_code, message=""):
+        super().__init__(message or f"Upstream error: {status_code}")
+        self.status_code = status_code
+
+class TTLCache:
+    """
+    Small async cache for upstream snapshots.
+
+    - Entries are fresh for `ttl` seconds.
+    - Concurrent misses for the same key share one in-flight fetch (request coalescing).
+    - With `stale_ttl`, an expired entry younger than `ttl + stale_ttl` is served
+      immediately while a single background fetch refreshes it (stale-while-revalidate).
+    - Failed fetches are never cached; the exception is raised to every waiter.
+    """
+    def __init__(self, name, ttl, stale_ttl=0, max_entries=10000):
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self._entries = {}   # key -> (stored_at, value)
+        self._inflight = {}  # key -> asyncio.Future
+        self._background = set()
+        self.stats = {"hits": 0, "stale_hits": 0, "misses": 0, "coalesced": 0, "errors": 0, "invalidations": 0}
+
+    def peek(self, key):
+        """Returns the cached value (fresh or stale) without fetching, or None."""
+        entry = self._entries.get(key)
+        return entry[1] if entry else None
+
+    def set(self, key, value):
+        if len(self._entries) >= self.max_entries and key not in self._entries:
+            self._evict()
+        self._entries[key] = (time.monotonic(), value)
+
+    def invalidate(self, key):
+        # Forget any in-flight fetch too, so a response that started before the
+        # invalidating write is not stored over it
+        self._inflight.pop(key, None)
+        if self._entries.pop(key, None) is not None:
+            self.stats["invalidations"] += 1
+
+    def invalidate_where(self, predicate):
+        for key in [k for k in self._entries if predicate(k, self._entries[k][1])]:
+            self.invalidate(key)
+        for key in [k for k in self._inflight if predicate(k, None)]:
+            self._inflight.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def _evict(self):
+        # Drop expired entries first; if still full, drop the oldest one
+        now = time.monotonic()
+        horizon = self.ttl + self.stale_ttl
+        for key in [k for k, (at, _) in self._entries.items() if now - at > horizon]:
+            del self._entries[key]
+        if len(self._entries) >= self.max_entries:
+            oldest = min(self._entries, key=lambda k: self._entries[k][0])
+            del self._entries[oldest]
+
+    async def get(self, key, fetch):
+        """Returns the value for `key`, calling the coroutine function `fetch()` on a miss."""
+        entry = self._entries.get(key)
+        if entry:
+            age = time.monotonic() - entry[0]
+            if age <= self.ttl:
+                self.stats["hits"] += 1
+                return entry[1]
+            if age <= self.ttl + self.stale_ttl:
+                self.stats["stale_hits"] += 1
+                if key not in self._inflight:
+                    task = asyncio.ensure_future(self._background_refresh(key, fetch))
+                    self._background.add(task)
+                    task.add_done_callback(self._background.discard)
+                return entry[1]
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(pending)
+
+        self.stats["misses"] += 1
+        return await self._refresh(key, fetch)
+
+    async def _background_refresh(self, key, fetch):
+        try:
+            await self._refresh(key, fetch)
+        except Exception as e:
+            print(f"[CACHE] {self.name} background refresh failed for {key}: {e}")
+
+    async def _refresh(self, key, fetch):
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await fetch()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            self.stats["errors"] += 1
+            future.set_exception(e)
+            # Mark retrieved so an un-awaited future does not log "exception never retrieved"
+            future.exception()
+            raise
+        else:
+            if self._inflight.get(key) is future:
+                self.set(key, value)
+            future.set_result(value)
+            return value
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
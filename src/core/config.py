@@ -17,9 +17,15 @@ DATA_DIR = os.path.join(BASE_DIR, "data")
 
 # Hardcoded Realm
 DEFAULT_REALM = "dibl-iot"
-PREFS_FILE = os.path.join(DATA_DIR, "user_preferences.json")
+PREFS_FILE = os.path.join(DATA_DIR, "user_preferences.json")  # legacy, migrated into PREFS_DB_FILE
+PREFS_DB_FILE = os.getenv("PREFS_DB_FILE", os.path.join(DATA_DIR, "user_preferences.db"))
+# Extra seconds a preference edit waits for others to join its commit (edits made
+# while a commit is running always share the next one). Requests answer only after
+# their edit is committed, so keep this small.
+PREFS_FLUSH_DELAY = float(os.getenv("PREFS_FLUSH_DELAY", "0"))
 FRIENDLY_NAMES_FILE = os.path.join(CONFIG_DIR, "friendly_names.json")
 IGNORED_USERS_FILE = os.path.join(CONFIG_DIR, "ignored_users.json")
+ASSET_TEMPLATE_FILE = os.path.join(CONFIG_DIR, "asset_template.json")
 
 # -------------------------
 # ROLE CONFIGURATION
@@ -40,3 +46,161 @@ ASSIGN_ROLE_WRITE_LOGS = True
 ASSIGN_ROLE_WRITE_RULES = True
 ASSIGN_ROLE_WRITE_SERVICES = True
 ASSIGN_ROLE_WRITE_USER = True
+
+# -------------------------
+# UPSTREAM HTTP CLIENT
+# -------------------------
+UPSTREAM_TIMEOUT = float(os.getenv("UPSTREAM_TIMEOUT", "15"))
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "5"))
+UPSTREAM_MAX_CONNECTIONS_PER_HOST = int(os.getenv("UPSTREAM_MAX_CONNECTIONS_PER_HOST", "50"))
+UPSTREAM_MAX_KEEPALIVE_PER_HOST = int(os.getenv("UPSTREAM_MAX_KEEPALIVE_PER_HOST", "20"))
+UPSTREAM_KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", "30"))
+
+# -------------------------
+# TOKEN CACHING
+# -------------------------
+# Seconds before expiry at which the cached admin token is renewed
+ADMIN_TOKEN_REFRESH_MARGIN = int(os.getenv("ADMIN_TOKEN_REFRESH_MARGIN", "30"))
+# Seconds before expiry at which a user token is renewed in the background, plus
+# up to USER_TOKEN_REFRESH_JITTER seconds (per token) so sessions do not renew in lockstep
+USER_TOKEN_REFRESH_MARGIN = int(os.getenv("USER_TOKEN_REFRESH_MARGIN", "60"))
+USER_TOKEN_REFRESH_JITTER = int(os.getenv("USER_TOKEN_REFRESH_JITTER", "30"))
+# Below this many seconds of validity a request waits for the refresh instead of using the old token
+USER_TOKEN_MIN_VALIDITY = int(os.getenv("USER_TOKEN_MIN_VALIDITY", "10"))
+
+# -------------------------
+# ASSET SNAPSHOT CACHE
+# -------------------------
+# Seconds a cached asset snapshot is served without asking the manager
+ASSET_CACHE_TTL = float(os.getenv("ASSET_CACHE_TTL", "2"))
+# Extra seconds an expired snapshot may still be served while it is refreshed
+# in the background (stale-while-revalidate). 0 disables.
+ASSET_CACHE_STALE_TTL = float(os.getenv("ASSET_CACHE_STALE_TTL", "10"))
+
+# -------------------------
+# LIVE UPDATES (SSE)
+# -------------------------
+# Seconds between upstream polls of a live feed (one poller per user, shared by all tabs)
+LIVE_POLL_INTERVAL = float(os.getenv("LIVE_POLL_INTERVAL", "1"))
+# Seconds of silence after which a comment line is sent to keep proxies from closing the stream
+LIVE_KEEPALIVE_INTERVAL = float(os.getenv("LIVE_KEEPALIVE_INTERVAL", "15"))
+
+# -------------------------
+# DATAPOINT HISTORY CACHE
+# -------------------------
+HISTORY_CACHE_FILE = os.getenv("HISTORY_CACHE_FILE", os.path.join(DATA_DIR, "history_cache.db"))
+# Datapoints newer than this many seconds are always refetched (they may still arrive late)
+HISTORY_CACHE_SETTLE = int(os.getenv("HISTORY_CACHE_SETTLE", "300"))
+# Series not used for this many seconds are evicted
+HISTORY_CACHE_MAX_AGE = int(os.getenv("HISTORY_CACHE_MAX_AGE", str(7 * 24 * 3600)))
+# Upper bound on cached datapoints; least recently used series are evicted first
+HISTORY_CACHE_MAX_POINTS = int(os.getenv("HISTORY_CACHE_MAX_POINTS", "5000000"))
+
+# -------------------------
+# USER DIRECTORY
+# -------------------------
+# Seconds a realm's cached user list (id -> name) is reused before a bulk reload
+USER_DIRECTORY_TTL = float(os.getenv("USER_DIRECTORY_TTL", "300"))
+USER_DIRECTORY_PAGE_SIZE = int(os.getenv("USER_DIRECTORY_PAGE_SIZE", "500"))
+# Parallel single-user lookups for ids missing from the directory
+USER_LOOKUP_CONCURRENCY = int(os.getenv("USER_LOOKUP_CONCURRENCY", "10"))
+
+# -------------------------
+# KEYCLOAK ROLE CATALOG
+# -------------------------
+# Seconds client UUIDs and role representations are reused before reloading
+# (a rejected role assignment reloads the realm's catalog at once)
+KEYCLOAK_CATALOG_TTL = float(os.getenv("KEYCLOAK_CATALOG_TTL", "3600"))
+
+# -------------------------
+# ASSET-USER LINK INDEX
+# -------------------------
+# Seconds between full reloads of a realm's link table (links made through this
+# app are applied to the index immediately)
+LINK_INDEX_REFRESH = float(os.getenv("LINK_INDEX_REFRESH", "300"))
+
+# -------------------------
+# CONFIG FILES
+# -------------------------
+# Seconds between checks of the files in config/ for changes (hot reload)
+CONFIG_WATCH_INTERVAL = float(os.getenv("CONFIG_WATCH_INTERVAL", "5"))
+# Seconds browsers may reuse /api/friendly-names before revalidating with its ETag
+FRIENDLY_NAMES_MAX_AGE = int(os.getenv("FRIENDLY_NAMES_MAX_AGE", "60"))
+
+# -------------------------
+# USER RULES INDEX
+# -------------------------
+# Seconds between full reloads of a realm's rule list (rules created/deleted
+# through this app are applied to the index immediately)
+RULES_INDEX_REFRESH = float(os.getenv("RULES_INDEX_REFRESH", "60"))
+
+# -------------------------
+# RULE COMPILATION
+# -------------------------
+# Seconds RuleTargets edits for the same asset are collected so they reach the
+# manager as one attribute write. 0 writes each edit on its own.
+RULES_WRITE_DELAY = float(os.getenv("RULES_WRITE_DELAY", "0.2"))
+
+# -------------------------
+# LOCAL RULE EVALUATION
+# -------------------------
+# Evaluate RuleTargets in this process and write RelayData when a threshold is
+# crossed. Off by default: enable only where the manager does not already run them.
+RULES_LOCAL_EVAL = os.getenv("RULES_LOCAL_EVAL", "false").lower() in ("1", "true", "yes")
+# Seconds between evaluation passes over all known assets
+RULES_EVAL_INTERVAL = float(os.getenv("RULES_EVAL_INTERVAL", "1"))
+# Seconds between full reloads of every asset carrying RuleTargets in a realm
+RULES_EVAL_POLL_INTERVAL = float(os.getenv("RULES_EVAL_POLL_INTERVAL", "5"))
+# Seconds a relay write is assumed in flight before the same command may be sent again
+RULES_EVAL_RETRY = float(os.getenv("RULES_EVAL_RETRY", "30"))
+
+# -------------------------
+# TIMER SCHEDULER
+# -------------------------
+# Fire Timer* schedules from this process (RelayData writes at each ON/OFF time).
+# Off by default: enable only where the devices do not run their timers themselves.
+TIMER_SCHEDULER = os.getenv("TIMER_SCHEDULER", "false").lower() in ("1", "true", "yes")
+# Time zone the OnHour/OffHour fields are expressed in
+TIMER_TIMEZONE = os.getenv("TIMER_TIMEZONE", "UTC")
+# Seconds between full reloads of every asset carrying Timer attributes in a realm
+TIMER_POLL_INTERVAL = float(os.getenv("TIMER_POLL_INTERVAL", "60"))
+
+# -------------------------
+# BULK RELAY CONTROL
+# -------------------------
+# Assets written in parallel by one /api/relays/bulk call
+BULK_CONTROL_CONCURRENCY = int(os.getenv("BULK_CONTROL_CONCURRENCY", "10"))
+BULK_CONTROL_MAX_COMMANDS = int(os.getenv("BULK_CONTROL_MAX_COMMANDS", "2000"))
+
+# -------------------------
+# TOKEN VALIDATION
+# -------------------------
+# Verify access-token signatures locally against the realm's JWKS
+JWT_VERIFY = os.getenv("JWT_VERIFY", "true").lower() in ("1", "true", "yes")
+# Seconds the realm signing keys are reused before reloading (unknown key ids reload at once)
+JWKS_TTL = float(os.getenv("JWKS_TTL", "3600"))
+# Parsed, verified token claims kept in memory, keyed by token hash
+TOKEN_CLAIMS_CACHE_SIZE = int(os.getenv("TOKEN_CLAIMS_CACHE_SIZE", "10000"))
+
+# -------------------------
+# SESSIONS
+# -------------------------
+# "sqlite" (shared by several workers through SESSION_DB_FILE) or "memory" (one
+# process only: startup fails if WEB_CONCURRENCY asks uvicorn for more workers)
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "sqlite")
+SESSION_DB_FILE = os.getenv("SESSION_DB_FILE", os.path.join(DATA_DIR, "sessions.db"))
+SESSION_COOKIE = os.getenv("SESSION_COOKIE", "session")
+# Seconds a session lives without being used
+SESSION_MAX_AGE = int(os.getenv("SESSION_MAX_AGE", str(14 * 24 * 3600)))
+SESSION_HTTPS_ONLY = os.getenv("SESSION_HTTPS_ONLY", "false").lower() in ("1", "true", "yes")
+# Most sessions kept by the memory backend; the least recently used are dropped first
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "50000"))
+# Seconds between sweeps of expired sessions
+SESSION_GC_INTERVAL = float(os.getenv("SESSION_GC_INTERVAL", "600"))
+
+# -------------------------
+# LOGIN
+# -------------------------
+# Also log in through the Keycloak form to obtain the manager SSO cookies.
+# Nothing in this app hands the browser to the manager, so it is off by default.
+LOGIN_MANAGER_SSO = os.getenv("LOGIN_MANAGER_SSO", "false").lower() in ("1", "true", "yes")
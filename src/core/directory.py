@@ -0,0 +1,74 @@
+import asyncio
+from core import upstream
+from core.cache import TTLCache, UpstreamError
+from core.config import (
+    KEYCLOAK_URL, OR_MANAGER_URL, USER_DIRECTORY_TTL, USER_DIRECTORY_PAGE_SIZE, USER_LOOKUP_CONCURRENCY
+)
+
+# realm -> {user_id: {"name": display name, "username": username}}, loaded in bulk
+# from Keycloak's paged user listing and shared by every request.
+directory_cache = TTLCache("user_directory", USER_DIRECTORY_TTL, max_entries=100)
+
+def display_name(user):
+    name = user.get("firstName") or user.get("username", "Unknown")
+    if user.get("lastName"): name += f" {user.get('lastName')}"
+    return name
+
+def _entry(user):
+    return {"name": display_name(user), "username": user.get("username")}
+
+async def _load_directory(realm, admin_token):
+    users = {}
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    first = 0
+    while True:
+        res = await upstream.get(
+            f"{KEYCLOAK_URL}/admin/realms/{realm}/users",
+            params={"first": first, "max": USER_DIRECTORY_PAGE_SIZE, "briefRepresentation": "true"},
+            headers=headers
+        )
+        if res.status_code != 200:
+            raise UpstreamError(res.status_code)
+        page = res.json()
+        for user in page:
+            users[user["id"]] = _entry(user)
+        if len(page) < USER_DIRECTORY_PAGE_SIZE:
+            return users
+        first += len(page)
+
+async def get_user_directory(realm, admin_token):
+    return await directory_cache.get(realm, lambda: _load_directory(realm, admin_token))
+
+async def _lookup_user(realm, user_id, admin_token, semaphore):
+    async with semaphore:
+        try:
+            res = await upstream.get(
+                f"{OR_MANAGER_URL}/api/{realm}/user/user/{user_id}",
+                headers={"Authorization": f"Bearer {admin_token}"}
+            )
+            if res.status_code == 200:
+                return user_id, _entry(res.json())
+        except Exception as e:
+            print(f"[USER] Lookup error for {user_id}: {e}")
+        return user_id, None
+
+async def resolve_users(realm, user_ids, admin_token):
+    """
+    Returns {user_id: {"name", "username"}} for `user_ids`. Served from the realm
+    directory; ids it does not know yet (e.g. users created since the last reload)
+    are looked up concurrently and added to it.
+    """
+    try:
+        directory = await get_user_directory(realm, admin_token)
+    except Exception as e:
+        print(f"[USER] Directory load failed: {e}")
+        directory = {}
+
+    missing = [uid for uid in user_ids if uid not in directory]
+    if missing:
+        semaphore = asyncio.Semaphore(USER_LOOKUP_CONCURRENCY)
+        found = await asyncio.gather(*(_lookup_user(realm, uid, admin_token, semaphore) for uid in missing))
+        for uid, entry in found:
+            if entry:
+                directory[uid] = entry
+    return {uid: directory[uid] for uid in user_ids if uid in directory}
@@ -0,0 +1,76 @@
+# Downsampling of (timestamp, value) series for charts. Inputs are two parallel
+# lists sorted by timestamp; outputs are the same shape, at most ~`n` points.
+
+def lttb(ts, vs, n):
+    """Largest-Triangle-Three-Buckets: keeps the points that best preserve the visual shape."""
+    size = len(ts)
+    if n >= size or n < 3:
+        return ts, vs
+    out_t = [ts[0]]
+    out_v = [vs[0]]
+    every = (size - 2) / (n - 2)
+    a = 0
+    for i in range(n - 2):
+        # Average of the next bucket is the third triangle vertex
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, size)
+        span = next_end - next_start
+        avg_t = sum(ts[next_start:next_end]) / span
+        avg_v = sum(vs[next_start:next_end]) / span
+
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        at, av = ts[a], vs[a]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((at - avg_t) * (vs[j] - av) - (at - ts[j]) * (avg_v - av))
+            if area > best_area:
+                best, best_area = j, area
+        out_t.append(ts[best])
+        out_v.append(vs[best])
+        a = best
+    out_t.append(ts[-1])
+    out_v.append(vs[-1])
+    return out_t, out_v
+
+def _buckets(ts, n):
+    """Yields (start, end) index ranges splitting the time span into `n` equal buckets."""
+    t0, t1 = ts[0], ts[-1]
+    width = (t1 - t0) / n or 1
+    start = 0
+    size = len(ts)
+    for b in range(1, n + 1):
+        limit = t0 + b * width
+        end = start
+        while end < size and (ts[end] < limit or b == n):
+            end += 1
+        if end > start:
+            yield start, end
+        start = end
+
+def minmax(ts, vs, n):
+    """Keeps each bucket's minimum and maximum (in time order), so spikes are never lost."""
+    if len(ts) <= n:
+        return ts, vs
+    out_t, out_v = [], []
+    for start, end in _buckets(ts, max(1, n // 2)):
+        window = vs[start:end]
+        lo = start + window.index(min(window))
+        hi = start + window.index(max(window))
+        for j in sorted({lo, hi}):
+            out_t.append(ts[j])
+            out_v.append(vs[j])
+    return out_t, out_v
+
+def average(ts, vs, n):
+    """One point per bucket: mean timestamp and mean value."""
+    if len(ts) <= n:
+        return ts, vs
+    out_t, out_v = [], []
+    for start, end in _buckets(ts, n):
+        count = end - start
+        out_t.append(int(sum(ts[start:end]) / count))
+        out_v.append(sum(vs[start:end]) / count)
+    return out_t, out_v
+
+METHODS = {"lttb": lttb, "minmax": minmax, "avg": average}
@@ -0,0 +1,51 @@
+from core.registry import config_registry
+
+class IgnoreMatcher:
+    """
+    Compiled form of ignored_users.json: a set for exact names and a character
+    trie for prefixes, so a check costs O(len(name)) however many patterns exist.
+    """
+    _END = object()
+
+    def __init__(self, usernames=(), prefixes=()):
+        self.usernames = frozenset(usernames)
+        self._trie = {}
+        for prefix in prefixes:
+            node = self._trie
+            for ch in prefix:
+                node = node.setdefault(ch, {})
+            node[self._END] = True
+
+    @classmethod
+    def from_config(cls, data):
+        return cls(data.get("ignored_usernames", []), data.get("ignored_prefixes", []))
+
+    def is_ignored(self, name):
+        if name in self.usernames:
+            return True
+        node = self._trie
+        if self._END in node:
+            return True
+        for ch in name:
+            node = node.get(ch)
+            if node is None:
+                return False
+            if self._END in node:
+                return True
+        return False
+
+    def filter(self, names):
+        """Returns `names` without the ignored ones, keeping order."""
+        return [n for n in names if not self.is_ignored(n)]
+
+_matcher = IgnoreMatcher.from_config(config_registry.get("ignored_users"))
+
+def _recompile(data):
+    global _matcher
+    _matcher = IgnoreMatcher.from_config(data)
+
+config_registry.on_change("ignored_users", _recompile)
+
+def get_ignore_matcher():
+    """The matcher for ignored_users.json; recompiled by the config registry when the file changes."""
+    return _matcher
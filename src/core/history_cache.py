@@ -0,0 +1,186 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from core.config import HISTORY_CACHE_FILE, HISTORY_CACHE_SETTLE, HISTORY_CACHE_MAX_AGE, HISTORY_CACHE_MAX_POINTS
+
+# Local cache of raw datapoints per (realm, asset, attribute). Points are stored
+# clustered by series and timestamp; `coverage` records which time ranges were
+# already fetched, so a query only asks the manager for the gaps. Every key of a
+# JSON attribute is served from the same cached series.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS points (
+    series INTEGER NOT NULL,
+    ts INTEGER NOT NULL,
+    value TEXT,
+    PRIMARY KEY (series, ts)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS series (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    realm TEXT NOT NULL,
+    asset_id TEXT NOT NULL,
+    attribute TEXT NOT NULL,
+    last_used REAL NOT NULL,
+    point_count INTEGER NOT NULL DEFAULT 0,
+    UNIQUE (realm, asset_id, attribute)
+);
+CREATE TABLE IF NOT EXISTS coverage (
+    series INTEGER NOT NULL,
+    from_ts INTEGER NOT NULL,
+    to_ts INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS coverage_series ON coverage (series, from_ts);
+"""
+
+_conn = None
+_conn_lock = threading.Lock()
+# All database work runs on this one thread: lock waits and eviction never block
+# the event loop, and transactions on the shared connection never interleave.
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-cache")
+history_cache_stats = {"queries": 0, "full_hits": 0, "segments_fetched": 0, "points_fetched": 0, "points_served": 0, "evicted_series": 0}
+
+def _connect():
+    global _conn
+    if _conn is None:
+        with _conn_lock:
+            if _conn is None:
+                os.makedirs(os.path.dirname(HISTORY_CACHE_FILE), exist_ok=True)
+                conn = sqlite3.connect(HISTORY_CACHE_FILE, isolation_level=None, check_same_thread=False, timeout=10)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.executescript(_SCHEMA)
+                _conn = conn
+    return _conn
+
+def _series_id(conn, realm, asset_id, attribute):
+    conn.execute(
+        "INSERT OR IGNORE INTO series (realm, asset_id, attribute, last_used) VALUES (?, ?, ?, ?)",
+        (realm, asset_id, attribute, time.time())
+    )
+    return conn.execute(
+        "SELECT id FROM series WHERE realm = ? AND asset_id = ? AND attribute = ?",
+        (realm, asset_id, attribute)
+    ).fetchone()[0]
+
+def missing_ranges(covered, from_ts, to_ts):
+    """Parts of [from_ts, to_ts] not inside any of the sorted `covered` (from, to) ranges."""
+    gaps = []
+    cursor = from_ts
+    for c_from, c_to in covered:
+        if c_to < cursor:
+            continue
+        if c_from > to_ts:
+            break
+        if c_from > cursor:
+            gaps.append((cursor, c_from - 1))
+        cursor = max(cursor, c_to + 1)
+        if cursor > to_ts:
+            break
+    if cursor <= to_ts:
+        gaps.append((cursor, to_ts))
+    return gaps
+
+def _add_coverage(conn, series, from_ts, to_ts):
+    """Records [from_ts, to_ts] as fetched, merging it with overlapping/adjacent ranges."""
+    rows = conn.execute(
+        "SELECT rowid, from_ts, to_ts FROM coverage WHERE series = ? AND to_ts >= ? AND from_ts <= ?",
+        (series, from_ts - 1, to_ts + 1)
+    ).fetchall()
+    for rowid, c_from, c_to in rows:
+        from_ts = min(from_ts, c_from)
+        to_ts = max(to_ts, c_to)
+        conn.execute("DELETE FROM coverage WHERE rowid = ?", (rowid,))
+    conn.execute("INSERT INTO coverage (series, from_ts, to_ts) VALUES (?, ?, ?)", (series, from_ts, to_ts))
+
+def _lookup(realm, asset_id, attribute, from_ts, to_ts):
+    conn = _connect()
+    series = _series_id(conn, realm, asset_id, attribute)
+    covered = conn.execute(
+        "SELECT from_ts, to_ts FROM coverage WHERE series = ? AND to_ts >= ? AND from_ts <= ? ORDER BY from_ts",
+        (series, from_ts, to_ts)
+    ).fetchall()
+    return series, missing_ranges(covered, from_ts, to_ts)
+
+def _store(series, rows, gap_from, gap_to, settled):
+    conn = _connect()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.executemany("INSERT OR REPLACE INTO points (series, ts, value) VALUES (?, ?, ?)", rows)
+        if gap_from <= settled:
+            _add_coverage(conn, series, gap_from, min(gap_to, settled))
+        conn.execute(
+            "UPDATE series SET point_count = (SELECT COUNT(*) FROM points WHERE series = ?) WHERE id = ?",
+            (series, series)
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+def _read(series, from_ts, to_ts, evict_after):
+    conn = _connect()
+    conn.execute("UPDATE series SET last_used = ? WHERE id = ?", (time.time(), series))
+    rows = conn.execute(
+        "SELECT ts, value FROM points WHERE series = ? AND ts BETWEEN ? AND ? ORDER BY ts",
+        (series, from_ts, to_ts)
+    ).fetchall()
+    if evict_after:
+        evict()
+    return rows
+
+async def _run(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(_executor, fn, *args)
+
+async def get_datapoints(realm, asset_id, attribute, from_ts, to_ts, fetch):
+    """
+    Returns raw datapoints [{"x": ts, "y": value}] for the range, sorted by time.
+    Only ranges not cached yet are requested through `await fetch(from_ts, to_ts)`,
+    which must return the manager's datapoint list for that range.
+    """
+    history_cache_stats["queries"] += 1
+    series, gaps = await _run(_lookup, realm, asset_id, attribute, from_ts, to_ts)
+    if not gaps:
+        history_cache_stats["full_hits"] += 1
+
+    # Recent points may still be arriving, so that tail is never marked as covered
+    settled = int((time.time() - HISTORY_CACHE_SETTLE) * 1000)
+    for gap_from, gap_to in gaps:
+        points = await fetch(gap_from, gap_to)
+        history_cache_stats["segments_fetched"] += 1
+        rows = [(series, pt["x"], json.dumps(pt.get("y"))) for pt in points or [] if pt.get("x") is not None]
+        history_cache_stats["points_fetched"] += len(rows)
+        await _run(_store, series, rows, gap_from, gap_to, settled)
+
+    rows = await _run(_read, series, from_ts, to_ts, bool(gaps))
+    history_cache_stats["points_served"] += len(rows)
+    return [{"x": ts, "y": json.loads(value)} for ts, value in rows]
+
+def _drop_series(conn, series):
+    conn.execute("DELETE FROM points WHERE series = ?", (series,))
+    conn.execute("DELETE FROM coverage WHERE series = ?", (series,))
+    conn.execute("DELETE FROM series WHERE id = ?", (series,))
+    history_cache_stats["evicted_series"] += 1
+
+def evict():
+    """Drops series unused for HISTORY_CACHE_MAX_AGE, then least recently used ones until under HISTORY_CACHE_MAX_POINTS."""
+    conn = _connect()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for (series,) in conn.execute(
+            "SELECT id FROM series WHERE last_used < ?", (time.time() - HISTORY_CACHE_MAX_AGE,)
+        ).fetchall():
+            _drop_series(conn, series)
+        total = conn.execute("SELECT COALESCE(SUM(point_count), 0) FROM series").fetchone()[0]
+        if total > HISTORY_CACHE_MAX_POINTS:
+            for series, count in conn.execute("SELECT id, point_count FROM series ORDER BY last_used").fetchall():
+                _drop_series(conn, series)
+                total -= count
+                if total <= HISTORY_CACHE_MAX_POINTS:
+                    break
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
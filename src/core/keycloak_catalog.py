@@ -0,0 +1,40 @@
+from core import upstream
+from core.cache import TTLCache, UpstreamError
+from core.config import KEYCLOAK_URL, KEYCLOAK_CATALOG_TTL
+
+# Keycloak's client and role definitions change only when an admin edits the
+# realm, yet signup used to download them for every new user. Keys:
+#   ("client", realm, client_id)        -> client UUID
+#   ("client_roles", realm, client_uuid) -> {role name: role representation}
+#   ("realm_roles", realm)              -> {role name: role representation}
+catalog_cache = TTLCache("keycloak_catalog", KEYCLOAK_CATALOG_TTL, max_entries=1000)
+
+async def _admin_get(url, admin_token, params=None):
+    res = await upstream.get(url, params=params, headers={"Authorization": f"Bearer {admin_token}"})
+    if res.status_code != 200:
+        raise UpstreamError(res.status_code)
+    return res.json()
+
+async def _load_client_uuid(realm, client_id, admin_token):
+    clients = await _admin_get(f"{KEYCLOAK_URL}/admin/realms/{realm}/clients", admin_token, {"clientId": client_id})
+    if not clients:
+        raise UpstreamError(404, f"Client {client_id} not found in realm {realm}")
+    return clients[0]["id"]
+
+async def _load_roles(url, admin_token):
+    return {role["name"]: role for role in await _admin_get(url, admin_token)}
+
+async def get_client_uuid(realm, client_id, admin_token):
+    return await catalog_cache.get(("client", realm, client_id), lambda: _load_client_uuid(realm, client_id, admin_token))
+
+async def get_client_roles(realm, client_uuid, admin_token):
+    url = f"{KEYCLOAK_URL}/admin/realms/{realm}/clients/{client_uuid}/roles"
+    return await catalog_cache.get(("client_roles", realm, client_uuid), lambda: _load_roles(url, admin_token))
+
+async def get_realm_roles(realm, admin_token):
+    url = f"{KEYCLOAK_URL}/admin/realms/{realm}/roles"
+    return await catalog_cache.get(("realm_roles", realm), lambda: _load_roles(url, admin_token))
+
+def invalidate_catalog(realm=None):
+    """Forgets cached clients and roles of `realm` (every realm when None)."""
+    catalog_cache.invalidate_where(lambda key, _: realm is None or key[1] == realm)
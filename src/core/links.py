@@ -0,0 +1,94 @@
+from core import upstream
+from core.cache import TTLCache, UpstreamError
+from core.config import OR_MANAGER_URL, LINK_INDEX_REFRESH
+
+class LinkIndex:
+    """In-process view of a realm's asset-user links, indexed both ways."""
+    def __init__(self):
+        self.users_by_asset = {}  # asset_id -> set(user_id)
+        self.assets_by_user = {}  # user_id -> set(asset_id)
+        self.user_names = {}      # user_id -> userFullName reported by the link table
+
+    def add(self, user_id, asset_id, full_name=None):
+        self.users_by_asset.setdefault(asset_id, set()).add(user_id)
+        self.assets_by_user.setdefault(user_id, set()).add(asset_id)
+        if full_name:
+            self.user_names[user_id] = full_name
+
+    def remove(self, user_id, asset_id):
+        self.users_by_asset.get(asset_id, set()).discard(user_id)
+        self.assets_by_user.get(user_id, set()).discard(asset_id)
+
+    def partners(self, asset_ids, user_id):
+        """{asset_id: set(other user ids)} for the given assets, skipping assets nobody else has."""
+        result = {}
+        for asset_id in asset_ids:
+            others = self.users_by_asset.get(asset_id, set()) - {user_id}
+            if others:
+                result[asset_id] = others
+        return result
+
+# realm -> LinkIndex. Reloaded in full every LINK_INDEX_REFRESH seconds (served
+# stale while the reload runs); link/unlink calls update it in place meanwhile.
+link_index_cache = TTLCache("link_index", LINK_INDEX_REFRESH, stale_ttl=LINK_INDEX_REFRESH * 10, max_entries=100)
+
+# A reload that started before a link/unlink may have read the table before the
+# change landed, and would then replace the edited index with an older one. Every
+# edit is journalled with a generation number; a reload replays the edits made
+# since it started onto its result. Replaying an edit the table already has is a
+# no-op, so the journal only has to outlive the reloads that were running.
+_generation = 0
+_edits = {}    # realm -> [(generation, op, user_id, asset_id)]
+_loading = {}  # realm -> [generation at start of each running reload]
+
+def _journal(realm, op, user_id, asset_id):
+    global _generation
+    if not _loading.get(realm):
+        return
+    _generation += 1
+    _edits.setdefault(realm, []).append((_generation, op, user_id, asset_id))
+
+async def _load_index(realm, admin_token):
+    start = _generation
+    _loading.setdefault(realm, []).append(start)
+    try:
+        res = await upstream.get(
+            f"{OR_MANAGER_URL}/api/master/asset/user/link",
+            params={"realm": realm},
+            headers={"Authorization": f"Bearer {admin_token}"}
+        )
+        if res.status_code != 200:
+            raise UpstreamError(res.status_code)
+        index = LinkIndex()
+        for link in res.json():
+            lid = link.get("id", {})
+            if lid.get("realm") == realm and lid.get("assetId") and lid.get("userId"):
+                index.add(lid["userId"], lid["assetId"], link.get("userFullName"))
+        for generation, op, user_id, asset_id in _edits.get(realm, ()):
+            if generation > start:
+                getattr(index, op)(user_id, asset_id)
+        return index
+    finally:
+        running = _loading[realm]
+        running.remove(start)
+        if running:
+            oldest = min(running)
+            _edits[realm] = [e for e in _edits.get(realm, ()) if e[0] > oldest]
+        else:
+            _loading.pop(realm, None)
+            _edits.pop(realm, None)
+
+async def get_link_index(realm, admin_token):
+    return await link_index_cache.get(realm, lambda: _load_index(realm, admin_token))
+
+def record_link(realm, user_id, asset_id):
+    index = link_index_cache.peek(realm)
+    if index is not None:
+        index.add(user_id, asset_id)
+    _journal(realm, "add", user_id, asset_id)
+
+def record_unlink(realm, user_id, asset_id):
+    index = link_index_cache.peek(realm)
+    if index is not None:
+        index.remove(user_id, asset_id)
+    _journal(realm, "remove", user_id, asset_id)
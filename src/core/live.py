@@ -0,0 +1,112 @@
+import asyncio
+import json
+from core.config import LIVE_POLL_INTERVAL
+from core.snapshots import get_user_assets_snapshot, to_user_asset
+
+# Live asset feeds, one per (realm, user_id). Each feed runs a single poller over
+# the shared snapshot cache and fans the resulting deltas out to every open tab
+# of that user as pre-serialised Server-Sent Events.
+_feeds = {}
+live_stats = {"feeds": 0, "subscribers": 0, "polls": 0, "deltas": 0, "resyncs": 0}
+
+_MISSING = object()
+
+def format_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+def diff_assets(old, new):
+    """Returns the delta between two {asset_id: asset} maps, or None if nothing changed."""
+    added = [asset for aid, asset in new.items() if aid not in old]
+    removed = [aid for aid in old if aid not in new]
+    changed = {}
+    for aid, asset in new.items():
+        prev = old.get(aid)
+        if prev is None:
+            continue
+        change = {}
+        attrs = {k: v for k, v in asset["attributes"].items() if prev["attributes"].get(k, _MISSING) != v}
+        if attrs:
+            change["attributes"] = attrs
+        gone = [k for k in prev["attributes"] if k not in asset["attributes"]]
+        if gone:
+            change["removedAttributes"] = gone
+        for field in ("name", "type", "location", "lastActivityTimestamp"):
+            if prev.get(field) != asset.get(field):
+                change[field] = asset.get(field)
+        if change:
+            changed[aid] = change
+    if not (added or removed or changed):
+        return None
+    return {"added": added, "removed": removed, "changed": changed}
+
+class AssetFeed:
+    def __init__(self, realm, user_id):
+        self.realm = realm
+        self.user_id = user_id
+        self.access_token = None
+        self.assets = None
+        self.subscribers = set()
+        self._task = None
+
+    def subscribe(self, access_token):
+        # The newest token wins; each stream reconnects before its own token expires
+        self.access_token = access_token
+        queue = asyncio.Queue(maxsize=50)
+        self.subscribers.add(queue)
+        live_stats["subscribers"] += 1
+        if self.assets is not None:
+            queue.put_nowait(self.snapshot_event())
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+        return queue
+
+    def unsubscribe(self, queue):
+        if queue in self.subscribers:
+            self.subscribers.discard(queue)
+            live_stats["subscribers"] -= 1
+
+    def snapshot_event(self):
+        return format_event("snapshot", {"assets": list(self.assets.values())})
+
+    def _broadcast(self, message):
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # Slow client: drop its backlog and resync it with a full snapshot
+                live_stats["resyncs"] += 1
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(self.snapshot_event())
+
+    async def _run(self):
+        try:
+            while self.subscribers:
+                try:
+                    raw = await get_user_assets_snapshot(self.realm, self.user_id, self.access_token)
+                    live_stats["polls"] += 1
+                    current = {a["id"]: to_user_asset(a) for a in raw}
+                    if self.assets is None:
+                        self.assets = current
+                        self._broadcast(self.snapshot_event())
+                    else:
+                        delta = diff_assets(self.assets, current)
+                        self.assets = current
+                        if delta:
+                            live_stats["deltas"] += 1
+                            self._broadcast(format_event("delta", delta))
+                except Exception as e:
+                    print(f"[LIVE] Poll error for {self.user_id}: {e}")
+                await asyncio.sleep(LIVE_POLL_INTERVAL)
+        finally:
+            if not self.subscribers and _feeds.get((self.realm, self.user_id)) is self:
+                del _feeds[(self.realm, self.user_id)]
+                live_stats["feeds"] -= 1
+
+def get_feed(realm, user_id):
+    feed = _feeds.get((realm, user_id))
+    if feed is None:
+        feed = AssetFeed(realm, user_id)
+        _feeds[(realm, user_id)] = feed
+        live_stats["feeds"] += 1
+    return feed
@@ -0,0 +1,234 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from core.config import PREFS_FILE, PREFS_DB_FILE, PREFS_FLUSH_DELAY
+
+# User preferences (dashboard pins) in SQLite/WAL. Every pin is its own row keyed
+# by (user, asset, attribute, key), so toggles and renames touch one row and stay
+# atomic when several uvicorn workers share the file.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pins (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    asset_id TEXT NOT NULL,
+    attribute_name TEXT NOT NULL,
+    pin_key TEXT NOT NULL DEFAULT '',
+    display_name TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS pins_user_pin ON pins (user_id, asset_id, attribute_name, pin_key);
+CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT);
+"""
+
+_conn = None
+_conn_lock = threading.Lock()
+
+def _connect():
+    global _conn
+    if _conn is None:
+        with _conn_lock:
+            if _conn is None:
+                os.makedirs(os.path.dirname(PREFS_DB_FILE), exist_ok=True)
+                conn = sqlite3.connect(PREFS_DB_FILE, isolation_level=None, check_same_thread=False, timeout=10)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.executescript(_SCHEMA)
+                _migrate_json(conn)
+                _conn = conn
+    return _conn
+
+def _migrate_json(conn):
+    """One-time import of the legacy user_preferences.json file."""
+    if not os.path.exists(PREFS_FILE):
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        done = conn.execute("SELECT value FROM meta WHERE name = 'json_migrated'").fetchone()
+        if not done:
+            try:
+                with open(PREFS_FILE, "r") as f:
+                    data = json.load(f)
+            except Exception as e:
+                print(f"[PREFS] Could not read {PREFS_FILE} for migration: {e}")
+                data = {}
+            count = 0
+            for user_id, user_prefs in data.items():
+                for pin in (user_prefs or {}).get("pinned", []):
+                    if not pin.get("assetId") or not pin.get("attributeName"):
+                        continue
+                    conn.execute(
+                        "INSERT OR IGNORE INTO pins (user_id, asset_id, attribute_name, pin_key, display_name) VALUES (?, ?, ?, ?, ?)",
+                        (user_id, pin["assetId"], pin["attributeName"], pin.get("key") or "", pin.get("displayName"))
+                    )
+                    count += 1
+            conn.execute("INSERT INTO meta (name, value) VALUES ('json_migrated', '1')")
+            print(f"[PREFS] Migrated {count} pins from {PREFS_FILE}")
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+def _row_to_pin(row):
+    asset_id, attribute_name, pin_key, display_name = row
+    pin = {"assetId": asset_id, "attributeName": attribute_name}
+    if pin_key: pin["key"] = pin_key
+    if display_name: pin["displayName"] = display_name
+    return pin
+
+# In-memory pins per user. Each read checks SQLite's data_version (one cheap
+# PRAGMA) and the cache is dropped whenever another worker has committed.
+_cache = {}  # user_id -> [pin]
+_data_version = None
+# Group commit: edits apply to `_cache` at once and join the next transaction;
+# each edit's request waits for that commit, so a response is only sent once the
+# change is visible to every worker. Edits arriving while a commit is running
+# (or within PREFS_FLUSH_DELAY) share the following one.
+_pending = []  # [(sql, params)]
+_pending_done = None  # future resolved when `_pending` is committed
+_flusher = None
+io_stats = {"cache_hits": 0, "db_reads": 0, "queued_writes": 0, "flushes": 0, "flushed_writes": 0, "invalidations": 0}
+# All database work runs on this one thread, off the event loop; a lock held by
+# another worker (busy timeout 10 s) then only delays preference requests.
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="preferences")
+
+async def _run(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(_executor, fn, *args)
+
+def _read_version():
+    return _connect().execute("PRAGMA data_version").fetchone()[0]
+
+def _read_pins(user_id):
+    return _connect().execute(
+        "SELECT asset_id, attribute_name, pin_key, display_name FROM pins WHERE user_id = ? ORDER BY id",
+        (user_id,)
+    ).fetchall()
+
+def _commit(batch):
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        for sql, params in batch:
+            conn.execute(sql, params)
+        conn.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+
+async def _user_pins(user_id):
+    global _data_version
+    version = await _run(_read_version)
+    if version != _data_version:
+        # Our own commits never change data_version, so this means another process wrote
+        if _pending:
+            await flush()
+        if _cache:
+            io_stats["invalidations"] += 1
+        _cache.clear()
+        _data_version = version
+    pins = _cache.get(user_id)
+    if pins is not None:
+        io_stats["cache_hits"] += 1
+        return pins
+    io_stats["db_reads"] += 1
+    rows = await _run(_read_pins, user_id)
+    # A concurrent request may have loaded (and edited) the list meanwhile
+    return _cache.setdefault(user_id, [_row_to_pin(r) for r in rows])
+
+def _queue_write(sql, params):
+    """Queues one statement; returns a future resolved once it is committed."""
+    global _pending_done, _flusher
+    _pending.append((sql, params))
+    io_stats["queued_writes"] += 1
+    if _pending_done is None:
+        _pending_done = asyncio.get_running_loop().create_future()
+    done = _pending_done
+    if _flusher is None or _flusher.done():
+        _flusher = asyncio.ensure_future(_flush_loop())
+    return done
+
+async def _flush_loop():
+    if PREFS_FLUSH_DELAY > 0:
+        await asyncio.sleep(PREFS_FLUSH_DELAY)
+    while _pending:
+        await flush()
+
+async def flush():
+    """Commits all queued preference edits in one transaction."""
+    global _pending_done
+    if not _pending:
+        return
+    batch = _pending[:]
+    del _pending[:]
+    done, _pending_done = _pending_done, None
+    try:
+        await _run(_commit, batch)
+        io_stats["flushes"] += 1
+        io_stats["flushed_writes"] += len(batch)
+    except Exception as e:
+        # Reload from the database on next read rather than serve edits that were not saved
+        _cache.clear()
+        print(f"[PREFS] Flush failed, {len(batch)} edits lost: {e}")
+    if done is not None and not done.done():
+        done.set_result(None)
+
+def _same_pin(pin, asset_id, attribute_name, key):
+    return pin["assetId"] == asset_id and pin["attributeName"] == attribute_name and pin.get("key", "") == (key or "")
+
+async def get_pins(user_id):
+    return list(await _user_pins(user_id))
+
+async def get_user_preferences(user_id):
+    """Returns the user's preferences in the shape `/api/user/preferences` has always returned."""
+    pins = await get_pins(user_id)
+    return {"pinned": pins} if pins else {}
+
+async def toggle_pin(user_id, asset_id, attribute_name, key=None, display_name=None):
+    """Removes the pin if it exists, otherwise adds it. Returns True if the attribute is now pinned."""
+    pins = await _user_pins(user_id)
+    for pin in pins:
+        if _same_pin(pin, asset_id, attribute_name, key):
+            pins.remove(pin)
+            await _queue_write(
+                "DELETE FROM pins WHERE user_id = ? AND asset_id = ? AND attribute_name = ? AND pin_key = ?",
+                (user_id, asset_id, attribute_name, key or "")
+            )
+            return False
+    pins.append(_row_to_pin((asset_id, attribute_name, key or "", display_name or None)))
+    await _queue_write(
+        "INSERT OR IGNORE INTO pins (user_id, asset_id, attribute_name, pin_key, display_name) VALUES (?, ?, ?, ?, ?)",
+        (user_id, asset_id, attribute_name, key or "", display_name or None)
+    )
+    return True
+
+async def rename_pin(user_id, asset_id, attribute_name, key=None, display_name=""):
+    """Sets (or clears, if blank) a pin's display name. Returns False if the pin does not exist."""
+    display_name = display_name.strip()
+    for pin in await _user_pins(user_id):
+        if _same_pin(pin, asset_id, attribute_name, key):
+            if display_name:
+                pin["displayName"] = display_name
+            else:
+                pin.pop("displayName", None)
+            await _queue_write(
+                "UPDATE pins SET display_name = ? WHERE user_id = ? AND asset_id = ? AND attribute_name = ? AND pin_key = ?",
+                (display_name or None, user_id, asset_id, attribute_name, key or "")
+            )
+            return True
+    return False
+
+async def remove_asset_pins(user_id, asset_ids):
+    """Removes the user's pins on any of `asset_ids`. Returns the number removed."""
+    asset_ids = set(asset_ids)
+    pins = await _user_pins(user_id)
+    kept = [p for p in pins if p["assetId"] not in asset_ids]
+    removed = len(pins) - len(kept)
+    if removed:
+        pins[:] = kept
+        done = None
+        for asset_id in asset_ids:
+            done = _queue_write("DELETE FROM pins WHERE user_id = ? AND asset_id = ?", (user_id, asset_id))
+        await done
+    return removed
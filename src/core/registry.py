@@ -0,0 +1,123 @@
+import asyncio
+import hashlib
+import json
+import os
+from core.config import FRIENDLY_NAMES_FILE, IGNORED_USERS_FILE, ASSET_TEMPLATE_FILE, CONFIG_WATCH_INTERVAL
+
+class ConfigFile:
+    """
+    One JSON file from config/, parsed once and kept in memory together with its
+    serialised body and a strong ETag. reload() re-reads it only if the file changed.
+    """
+    def __init__(self, path, default):
+        self.path = path
+        self.default = default
+        self.value = default
+        self.body = json.dumps(default).encode()
+        self.etag = self._etag(self.body)
+        self._mtime = None
+        self.loads = 0
+
+    @staticmethod
+    def _etag(body):
+        return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def reload(self, force=False):
+        """Returns True if the in-memory value changed."""
+        mtime = self._stat()
+        if not force and mtime == self._mtime:
+            return False
+        value = self.default
+        if mtime is not None:
+            try:
+                with open(self.path, "r") as f:
+                    value = json.load(f)
+            except Exception as e:
+                # Keep serving the last good version while the file is being edited
+                print(f"[CONFIG] Error loading {os.path.basename(self.path)}: {e}")
+                return False
+        self._mtime = mtime
+        body = json.dumps(value, separators=(",", ":"), sort_keys=True).encode()
+        if body == self.body:
+            return False
+        self.value = value
+        self.body = body
+        self.etag = self._etag(body)
+        self.loads += 1
+        print(f"[CONFIG] Loaded {os.path.basename(self.path)} ({self.etag})")
+        return True
+
+class ConfigRegistry:
+    def __init__(self):
+        self.files = {}
+        self._listeners = {}
+        self._watcher = None
+
+    def register(self, name, path, default):
+        self.files[name] = ConfigFile(path, default)
+        self._listeners[name] = []
+
+    def on_change(self, name, callback):
+        """callback(value) runs after `name` is (re)loaded with new contents."""
+        self._listeners[name].append(callback)
+
+    def entry(self, name):
+        return self.files[name]
+
+    def get(self, name):
+        return self.files[name].value
+
+    def reload(self, force=False):
+        for name, entry in self.files.items():
+            if entry.reload(force):
+                for callback in self._listeners[name]:
+                    callback(entry.value)
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(CONFIG_WATCH_INTERVAL)
+            try:
+                self.reload()
+            except Exception as e:
+                print(f"[CONFIG] Watcher error: {e}")
+
+    def start(self):
+        """Loads every file and starts the hot-reload watcher (call from the app's startup)."""
+        self.reload(force=True)
+        if self._watcher is None and CONFIG_WATCH_INTERVAL > 0:
+            self._watcher = asyncio.get_running_loop().create_task(self._watch())
+
+    async def stop(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            try:
+                await self._watcher
+            except asyncio.CancelledError:
+                pass
+            self._watcher = None
+
+    def stats(self):
+        return {name: {"etag": e.etag, "loads": e.loads} for name, e in self.files.items()}
+
+config_registry = ConfigRegistry()
+config_registry.register("friendly_names", FRIENDLY_NAMES_FILE, {"attributes": {}, "keys": {}})
+config_registry.register("ignored_users", IGNORED_USERS_FILE, {"ignored_prefixes": [], "ignored_usernames": []})
+config_registry.register("asset_template", ASSET_TEMPLATE_FILE, {})
+# Loaded eagerly so modules and scripts that never run the app's startup still see the files
+config_registry.reload(force=True)
+
+def get_friendly_names():
+    return config_registry.get("friendly_names")
+
+def get_ignored_users():
+    return config_registry.get("ignored_users")
+
+def get_asset_template():
+    return config_registry.get("asset_template")
@@ -0,0 +1,66 @@
+import asyncio
+from core.asset_patch import patch_asset, PatchConflict
+from core.config import BULK_CONTROL_CONCURRENCY
+
+bulk_stats = {"requests": 0, "commands": 0, "asset_writes": 0, "failed_assets": 0}
+
+def group_commands(commands):
+    """
+    {asset_id: {relay: state}} from [{"assetId", "key", "state"}]; a later command
+    for the same relay wins, and one without "state" only names its asset.
+    Returns (grouped, [(index, error)] for invalid commands).
+    """
+    grouped = {}
+    invalid = []
+    for index, cmd in enumerate(commands):
+        if not isinstance(cmd, dict) or not cmd.get("assetId") or not cmd.get("key"):
+            invalid.append((index, "assetId and key are required"))
+            continue
+        changes = grouped.setdefault(str(cmd["assetId"]), {})
+        if "state" in cmd:
+            changes[str(cmd["key"])] = cmd["state"]
+    return grouped, invalid
+
+async def set_relays(realm, user_id, access_token, commands, force=False):
+    """
+    Applies many relay commands with one RelayData write per asset, at most
+    BULK_CONTROL_CONCURRENCY assets at a time. Changes are merged key by key into
+    the manager's current RelayData. A command without "state" keeps the relay as
+    the manager has it, so with `force` it re-sends the current value (keep-alive)
+    without clients pushing back state they read earlier. Returns one result per
+    command, in request order: {"assetId", "key", "status", "message"?}.
+    """
+    bulk_stats["requests"] += 1
+    bulk_stats["commands"] += len(commands)
+    grouped, invalid = group_commands(commands)
+    semaphore = asyncio.Semaphore(BULK_CONTROL_CONCURRENCY)
+
+    async def write(asset_id, changes):
+        async with semaphore:
+            try:
+                await patch_asset(realm, asset_id, user_id, access_token,
+                                  attributes={"RelayData": {"set": changes}},
+                                  force=force)
+                bulk_stats["asset_writes"] += 1
+                return asset_id, None
+            except PatchConflict as e:
+                error = str(e)
+            except Exception as e:
+                error = str(e) or type(e).__name__
+            bulk_stats["failed_assets"] += 1
+            return asset_id, error
+
+    outcomes = dict(await asyncio.gather(*[write(aid, changes) for aid, changes in grouped.items()]))
+
+    errors = dict(invalid)
+    results = []
+    for index, cmd in enumerate(commands):
+        if index in errors:
+            results.append({"assetId": cmd.get("assetId") if isinstance(cmd, dict) else None, "status": "error", "message": errors[index]})
+            continue
+        result = {"assetId": cmd["assetId"], "key": cmd["key"], "status": "success"}
+        error = outcomes.get(str(cmd["assetId"]))
+        if error:
+            result.update(status="error", message=error)
+        results.append(result)
+    return results
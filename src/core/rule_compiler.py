@@ -0,0 +1,201 @@
+import asyncio
+import json
+from functools import lru_cache
+from string import Template
+from core import upstream
+from core.cache import UpstreamError
+from core.config import OR_MANAGER_URL, RULES_WRITE_DELAY
+
+RULE_TARGETS_ATTRIBUTE = "RuleTargets"
+SENSOR_GROUPS = ("EnvData", "MoistureData", "NPKData")
+# UI operator -> operator stored in RuleTargets (evaluated as Groovy on the manager)
+OPERATORS = {">": ">", "<": "<", "=": "==", "==": "==", "!=": "!="}
+
+class RuleDefinitionError(ValueError):
+    """A rule definition from the rules page that cannot be compiled."""
+
+def _format_number(value):
+    value = float(value)
+    # Match how the browser printed thresholds (30, not 30.0)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+def validate_rule(defn):
+    """
+    Normalises a rule as edited in rules.js ({id, name, sensor, operator, value,
+    relay, relayState}) or raises RuleDefinitionError.
+    """
+    if not isinstance(defn, dict):
+        raise RuleDefinitionError("Rule must be an object")
+    rule_id = str(defn.get("id") or "")
+    if not rule_id or ":" in rule_id:
+        raise RuleDefinitionError("Invalid rule id")
+
+    group, _, sensor_key = str(defn.get("sensor") or "").partition(".")
+    if group not in SENSOR_GROUPS or not sensor_key:
+        raise RuleDefinitionError(f"Invalid sensor for rule {rule_id}")
+
+    op = OPERATORS.get(str(defn.get("operator") or "").strip())
+    if op is None:
+        raise RuleDefinitionError(f"Invalid operator for rule {rule_id}")
+
+    try:
+        threshold = float(defn.get("value"))
+    except (TypeError, ValueError):
+        raise RuleDefinitionError(f"Invalid threshold for rule {rule_id}")
+    if threshold != threshold or threshold in (float("inf"), float("-inf")):
+        raise RuleDefinitionError(f"Invalid threshold for rule {rule_id}")
+
+    relay = str(defn.get("relay") or "")
+    if relay.startswith("RelayData."):
+        relay = relay[len("RelayData."):]
+    if not relay or ":" in relay:
+        raise RuleDefinitionError(f"Invalid relay for rule {rule_id}")
+
+    state = defn.get("relayState")
+    return {
+        "id": rule_id,
+        # ':' separates fields in the stored value, so it cannot appear in the name
+        "name": str(defn.get("name") or "").replace(":", " ").strip(),
+        "sensor_key": sensor_key,
+        "op": op,
+        "threshold": threshold,
+        "relay": relay,
+        "state": True if state is None else bool(state),
+    }
+
+@lru_cache(maxsize=1024)
+def _target_template(op, relay, state):
+    """One compiled template per rule shape; only the threshold and name vary."""
+    return Template(f"{op}:$threshold:{relay}:{'1' if state else '0'}:$name")
+
+def compile_target(rule):
+    """(RuleTargets key, value) for a validated rule."""
+    value = _target_template(rule["op"], rule["relay"], rule["state"]).substitute(
+        threshold=_format_number(rule["threshold"]), name=rule["name"]
+    )
+    return f"{rule['sensor_key']}_{rule['id']}", value
+
+def _shape(key, value):
+    """What a RuleTargets entry does, ignoring its rule id and display name."""
+    sensor_key = key.rsplit("_rule_", 1)[0]
+    return (sensor_key, ":".join(str(value).split(":")[:4]))
+
+def target_name(value):
+    """The display name stored at the end of a RuleTargets value."""
+    return str(value).split(":", 4)[-1]
+
+def apply_edits(targets, edits):
+    """
+    Applies `edits` in order and returns (new RuleTargets map, rejected). Each edit
+    is (rule_id, validated rule) to compile a rule in, or (rule_id, None) to drop it.
+    A rule that does exactly what another stored rule already does is not applied;
+    `rejected` maps its rule id to that rule's key. The rule's previous entry is
+    still dropped, so an update is never left running its old behaviour. Entries
+    are only ever removed by their own rule's edits.
+    """
+    result = dict(targets)
+    rejected = {}
+    for rule_id, rule in edits:
+        suffix = f"_{rule_id}"
+        # A rule's key changes with its sensor, so match on the id suffix
+        for stale in [k for k in result if k.endswith(suffix)]:
+            del result[stale]
+        if rule is None:
+            continue
+        key, value = compile_target(rule)
+        shape = _shape(key, value)
+        duplicate = next((k for k, v in result.items() if _shape(k, v) == shape), None)
+        if duplicate is not None:
+            rejected[rule_id] = duplicate
+            continue
+        result[key] = value
+    return result, rejected
+
+# -------------------------
+# RULESET SOURCES
+# -------------------------
+_RULESET_TEMPLATE = Template('''
+package rules
+import org.openremote.model.asset.*
+import org.openremote.model.rules.*
+
+rule "$name"
+when
+    Icon(assets: assets)
+then
+    System.out.println("User Rule Triggered");
+end
+''')
+
+def ruleset_source(full_name):
+    """Drools source for a user ruleset; the name is escaped so it cannot break out of the string."""
+    name = full_name.replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+    return _RULESET_TEMPLATE.substitute(name=name)
+
+# -------------------------
+# BATCHED RULETARGETS WRITES
+# -------------------------
+# (realm, asset_id, user_id) -> {"edits", "token", "future"}
+_batches = {}
+_writers = set()
+compiler_stats = {"edits": 0, "writes": 0, "rejected": 0, "errors": 0}
+
+def _read_targets(value):
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            value = {}
+    return dict(value) if isinstance(value, dict) else {}
+
+async def _write_batch(key):
+    batch = _batches.pop(key)
+    realm, asset_id, _ = key
+    headers = {"Authorization": f"Bearer {batch['token']}"}
+    try:
+        # Read the current map fresh: other rules on the asset must survive the write
+        res = await upstream.get(f"{OR_MANAGER_URL}/api/{realm}/asset/{asset_id}", headers=headers)
+        if res.status_code != 200:
+            raise UpstreamError(res.status_code)
+        attr = res.json().get("attributes", {}).get(RULE_TARGETS_ATTRIBUTE, {})
+        current = _read_targets(attr.get("value"))
+        targets, rejected = apply_edits(current, batch["edits"])
+        compiler_stats["rejected"] += len(rejected)
+        if targets != current:
+            res = await upstream.put(
+                f"{OR_MANAGER_URL}/api/{realm}/asset/{asset_id}/attribute/{RULE_TARGETS_ATTRIBUTE}",
+                json=targets, headers=headers
+            )
+            if res.status_code not in [200, 204]:
+                raise UpstreamError(res.status_code, res.text)
+            compiler_stats["writes"] += 1
+        batch["future"].set_result((targets, rejected))
+    except Exception as e:
+        compiler_stats["errors"] += 1
+        batch["future"].set_exception(e)
+        batch["future"].exception()
+
+def _start_write(key):
+    task = asyncio.ensure_future(_write_batch(key))
+    _writers.add(task)
+    task.add_done_callback(_writers.discard)
+
+async def submit_edits(realm, asset_id, user_id, access_token, edits):
+    """
+    Queues rule edits (see apply_edits) for an asset and waits for the write that
+    carries them. Edits arriving within RULES_WRITE_DELAY share one read and one
+    attribute write. Returns (RuleTargets map as written, rejected), where
+    rejected maps this call's duplicate rule ids to the existing rule's key.
+    """
+    key = (realm, asset_id, user_id)
+    batch = _batches.get(key)
+    if batch is None:
+        loop = asyncio.get_running_loop()
+        batch = _batches[key] = {"edits": [], "future": loop.create_future()}
+        loop.call_later(RULES_WRITE_DELAY, _start_write, key)
+    batch["token"] = access_token
+    batch["edits"].extend(edits)
+    compiler_stats["edits"] += len(edits)
+    targets, rejected = await asyncio.shield(batch["future"])
+    own = {rule_id for rule_id, _ in edits}
+    return targets, {rule_id: key for rule_id, key in rejected.items() if rule_id in own}
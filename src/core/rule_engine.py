@@ -0,0 +1,221 @@
+import asyncio
+import json
+import operator
+import time
+from itertools import compress
+from core import upstream
+from core.config import OR_MANAGER_URL, DEFAULT_REALM, RULES_LOCAL_EVAL, RULES_EVAL_INTERVAL, RULES_EVAL_POLL_INTERVAL, RULES_EVAL_RETRY
+from core.rule_compiler import RULE_TARGETS_ATTRIBUTE, SENSOR_GROUPS
+
+_NAN = float("nan")
+
+def _ne(value, threshold):
+    # NaN (missing or "--" readings) must never satisfy a rule
+    return value == value and value != threshold
+
+_OPS = {">": operator.gt, "<": operator.lt, "==": operator.eq, "!=": _ne}
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return _NAN
+
+def _to_bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "on")
+    return value is True or value == 1
+
+def _attr_value(attributes, name):
+    value = attributes.get(name, {}).get("value")
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return {}
+    return value if isinstance(value, dict) else {}
+
+def parse_targets(targets):
+    """[(op, threshold, sensor_key, relay, state)] from a RuleTargets map, skipping malformed entries."""
+    rules = []
+    for key in sorted(targets):
+        parts = str(targets[key]).split(":")
+        if len(parts) < 4 or parts[0] not in _OPS:
+            continue
+        threshold = _to_float(parts[1])
+        if threshold != threshold or not parts[2]:
+            continue
+        rules.append((parts[0], threshold, key.rsplit("_rule_", 1)[0], parts[2], parts[3] == "1"))
+    return rules
+
+class RuleEngine:
+    """
+    Evaluates every asset's RuleTargets in one columnar pass.
+
+    Rules are compiled into one column set per operator (sensor slot, threshold,
+    relay target), so a pass is a gather of current sensor values followed by a
+    single map() of the operator over two flat lists, with no per-rule branching.
+    """
+    def __init__(self):
+        self.sensors = {}  # (realm, asset_id) -> {sensor_key: float}
+        self.relays = {}   # (realm, asset_id) -> {relay: raw value}
+        self.rules = {}    # (realm, asset_id) -> parsed rules
+        self._columns = None
+        self._in_flight = {}  # (asset key, relay) -> (state, sent_at)
+        self.stats = {"assets": 0, "rules": 0, "passes": 0, "checks": 0, "fired": 0, "writes": 0, "write_errors": 0}
+
+    def ingest(self, realm, asset):
+        """Takes a manager asset representation from any snapshot fetch."""
+        attributes = asset.get("attributes") or {}
+        key = (realm, asset["id"])
+        sensors = {}
+        # Same lookup order as the rules page: EnvData, then MoistureData, then NPKData
+        for group in reversed(SENSOR_GROUPS):
+            for name, value in _attr_value(attributes, group).items():
+                sensors[name] = _to_float(value)
+        self.sensors[key] = sensors
+        relays = _attr_value(attributes, "RelayData")
+        self.relays[key] = relays
+        for relay, value in relays.items():
+            pending = self._in_flight.get((key, relay))
+            if pending and pending[0] == _to_bool(value):
+                del self._in_flight[(key, relay)]
+
+        rules = parse_targets(_attr_value(attributes, RULE_TARGETS_ATTRIBUTE))
+        if rules:
+            if self.rules.get(key) != rules:
+                self.rules[key] = rules
+                self._columns = None
+        elif self.rules.pop(key, None) is not None:
+            self._columns = None
+
+    def forget(self, realm, asset_id):
+        key = (realm, asset_id)
+        self.sensors.pop(key, None)
+        self.relays.pop(key, None)
+        if self.rules.pop(key, None) is not None:
+            self._columns = None
+
+    def _compile(self):
+        columns = {op: ([], [], []) for op in _OPS}  # op -> (slots, thresholds, targets)
+        count = 0
+        for key, rules in self.rules.items():
+            for op, threshold, sensor_key, relay, state in rules:
+                slots, thresholds, targets = columns[op]
+                slots.append((key, sensor_key))
+                thresholds.append(threshold)
+                targets.append((key, relay, state))
+                count += 1
+        self._columns = [(_OPS[op], cols) for op, cols in columns.items() if cols[0]]
+        self.stats["assets"] = len(self.rules)
+        self.stats["rules"] = count
+
+    def evaluate(self, now=None):
+        """
+        One pass over all rules. Returns {(realm, asset_id): {relay: state}} for
+        relays whose rule fired and which are not already in that state.
+        """
+        if self._columns is None:
+            self._compile()
+        now = time.monotonic() if now is None else now
+        sensors = self.sensors
+        fired = []
+        for op, (slots, thresholds, targets) in self._columns:
+            values = [sensors[key].get(sensor_key, _NAN) for key, sensor_key in slots]
+            fired.extend(compress(targets, map(op, values, thresholds)))
+            self.stats["checks"] += len(slots)
+        self.stats["passes"] += 1
+        self.stats["fired"] += len(fired)
+
+        commands = {}
+        for key, relay, state in fired:
+            current = self.relays[key].get(relay)
+            if current is not None and _to_bool(current) == state:
+                continue
+            pending = self._in_flight.get((key, relay))
+            if pending and pending[0] == state and now - pending[1] < RULES_EVAL_RETRY:
+                continue
+            commands.setdefault(key, {})[relay] = state
+        return commands
+
+    def mark_sent(self, key, changes, now=None):
+        now = time.monotonic() if now is None else now
+        for relay, state in changes.items():
+            self._in_flight[(key, relay)] = (state, now)
+
+rule_engine = RuleEngine()
+
+def ingest_assets(realm, assets):
+    """Feeds snapshot results to the local evaluator when it is enabled."""
+    if RULES_LOCAL_EVAL:
+        for asset in assets:
+            if isinstance(asset, dict) and "id" in asset:
+                rule_engine.ingest(realm, asset)
+
+async def _write_relays(realm, asset_id, changes):
+    # Imported here: asset_patch imports snapshots, which imports this module
+    from core.asset_patch import patch_asset
+    from core.auth import with_admin_token
+    key = (realm, asset_id)
+    try:
+        # Only the changed keys are sent, merged into the manager's current
+        # RelayData, so relays toggled since the last load keep their state.
+        # patch_asset also drops the cached snapshots of the asset.
+        written = await with_admin_token(realm, lambda admin_token: patch_asset(
+            realm, asset_id, None, admin_token, attributes={"RelayData": {"set": changes}}
+        ))
+        rule_engine.stats["writes"] += 1
+        rule_engine.relays[key] = written.get("RelayData") or dict(rule_engine.relays.get(key, {}), **changes)
+        return
+    except Exception as e:
+        print(f"[RULES] RelayData write for {asset_id} failed: {e}")
+    rule_engine.stats["write_errors"] += 1
+
+async def _load_realm(realm, admin_token):
+    """Every asset in the realm that has a RuleTargets attribute."""
+    query = {
+        "realm": {"name": realm},
+        "attributes": {"items": [{"name": {"predicateType": "string", "value": RULE_TARGETS_ATTRIBUTE}}]}
+    }
+    res = await upstream.post(
+        f"{OR_MANAGER_URL}/api/{realm}/asset/query",
+        json=query, headers={"Authorization": f"Bearer {admin_token}"}
+    )
+    if res.status_code != 200:
+        print(f"[RULES] Asset query for {realm} failed: {res.status_code}")
+        if res.status_code == 401:
+            # Revoked admin token: the next round requests a new one
+            from core.auth import invalidate_admin_token
+            invalidate_admin_token(admin_token)
+        return
+    assets = res.json()
+    seen = {a["id"] for a in assets}
+    for key in [k for k in rule_engine.rules if k[0] == realm and k[1] not in seen]:
+        rule_engine.forget(*key)
+    for asset in assets:
+        rule_engine.ingest(realm, asset)
+
+async def run(realm=DEFAULT_REALM):
+    """Evaluation loop; started from the app's startup when RULES_LOCAL_EVAL is set."""
+    from core.auth import get_admin_token
+    last_load = 0
+    while True:
+        try:
+            admin_token = await get_admin_token(realm)
+            if admin_token and time.monotonic() - last_load >= RULES_EVAL_POLL_INTERVAL:
+                last_load = time.monotonic()
+                await _load_realm(realm, admin_token)
+            commands = rule_engine.evaluate()
+            commands = {key: changes for key, changes in commands.items() if key[0] == realm}
+            if commands and admin_token:
+                for key, changes in commands.items():
+                    rule_engine.mark_sent(key, changes)
+                await asyncio.gather(*[
+                    _write_relays(key[0], key[1], changes)
+                    for key, changes in commands.items()
+                ])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[RULES] Evaluation error: {e}")
+        await asyncio.sleep(RULES_EVAL_INTERVAL)
@@ -0,0 +1,76 @@
+from core import upstream
+from core.cache import TTLCache, UpstreamError
+from core.config import OR_MANAGER_URL, RULES_INDEX_REFRESH
+
+def user_prefix(user_id):
+    return f"u:{user_id}:"
+
+def rule_meta(rule, prefix):
+    """The metadata the rules page lists; rule content is never kept."""
+    return {
+        "id": rule["id"],
+        "name": rule["name"][len(prefix):],
+        "desc": rule.get("description", "User Rule"),
+        "active": rule.get("status") == "ACTIVE"
+    }
+
+class RuleIndex:
+    """A realm's user rules grouped by owner prefix (`u:{user_id}:`)."""
+    def __init__(self):
+        self.by_prefix = {}  # prefix -> {rule_id: meta}
+
+    def add(self, rule):
+        name = rule.get("name") or ""
+        if not name.startswith("u:") or rule.get("id") is None:
+            return
+        # Names look like "u:{user_id}:{rule name}"; user ids never contain ':'
+        end = name.find(":", 2)
+        if end < 0:
+            return
+        prefix = name[:end + 1]
+        self.by_prefix.setdefault(prefix, {})[rule["id"]] = rule_meta(rule, prefix)
+
+    def remove(self, rule_id):
+        for rules in self.by_prefix.values():
+            for key in [k for k in rules if str(k) == str(rule_id)]:
+                del rules[key]
+
+    def rules_for(self, user_id):
+        return list(self.by_prefix.get(user_prefix(user_id), {}).values())
+
+# realm -> RuleIndex. The realm's rule list is downloaded at most once per
+# RULES_INDEX_REFRESH seconds (served stale while the reload runs).
+rules_index_cache = TTLCache("rules_index", RULES_INDEX_REFRESH, stale_ttl=RULES_INDEX_REFRESH * 10, max_entries=100)
+
+async def _load_index(realm, admin_token):
+    res = await upstream.get(
+        f"{OR_MANAGER_URL}/api/{realm}/rules",
+        # Ask the manager to leave out rule sources where it supports it
+        params={"fullyPopulate": "false"},
+        headers={"Authorization": f"Bearer {admin_token}"}
+    )
+    if res.status_code != 200:
+        raise UpstreamError(res.status_code)
+    index = RuleIndex()
+    for rule in res.json():
+        index.add(rule)
+    return index
+
+async def get_user_rules(realm, user_id, admin_token):
+    index = await rules_index_cache.get(realm, lambda: _load_index(realm, admin_token))
+    return index.rules_for(user_id)
+
+def record_rule(realm, rule):
+    """Adds a rule just created upstream; without an id the realm is reloaded on next read."""
+    index = rules_index_cache.peek(realm)
+    if index is None:
+        return
+    if rule.get("id") is None:
+        rules_index_cache.invalidate(realm)
+    else:
+        index.add(rule)
+
+def record_rule_deleted(realm, rule_id):
+    index = rules_index_cache.peek(realm)
+    if index is not None:
+        index.remove(rule_id)
@@ -0,0 +1,227 @@
+import asyncio
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import SimpleCookie
+from core.config import (
+    SESSION_BACKEND, SESSION_DB_FILE, SESSION_COOKIE, SESSION_MAX_AGE,
+    SESSION_HTTPS_ONLY, SESSION_MAX_ENTRIES, SESSION_GC_INTERVAL
+)
+
+# Expiry is pushed forward on use, but at most once per this many seconds, so
+# polling requests that do not change the session never write it.
+_TOUCH_INTERVAL = 300
+session_stats = {"loads": 0, "misses": 0, "saves": 0, "deletes": 0, "rotations": 0, "expired": 0, "evicted": 0}
+
+# Backends that do blocking I/O run here, one statement at a time, so a busy or
+# locked database file never stalls the event loop
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sessions")
+
+class MemorySessionBackend:
+    """Sessions in a process-local LRU; enough for a single uvicorn worker."""
+    blocking = False
+
+    def __init__(self, max_entries=SESSION_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data = OrderedDict()  # session_id -> (expires_at, json)
+
+    def load(self, session_id):
+        entry = self._data.get(session_id)
+        if entry is None:
+            return None
+        if entry[0] < time.time():
+            del self._data[session_id]
+            session_stats["expired"] += 1
+            return None
+        self._data.move_to_end(session_id)
+        return entry
+
+    def save(self, session_id, data_json, expires_at):
+        self._data[session_id] = (expires_at, data_json)
+        self._data.move_to_end(session_id)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            session_stats["evicted"] += 1
+
+    def touch(self, session_id, expires_at):
+        entry = self._data.get(session_id)
+        if entry is not None:
+            self._data[session_id] = (expires_at, entry[1])
+
+    def delete(self, session_id):
+        self._data.pop(session_id, None)
+
+    def gc(self):
+        now = time.time()
+        expired = [sid for sid, (exp, _) in self._data.items() if exp < now]
+        for sid in expired:
+            del self._data[sid]
+        session_stats["expired"] += len(expired)
+
+class SqliteSessionBackend:
+    """Sessions in SQLite (WAL), shared by every worker on the host."""
+    blocking = True
+
+    def __init__(self, path=SESSION_DB_FILE):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            with self._lock:
+                if self._conn is None:
+                    os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                    conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False, timeout=10)
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.execute("PRAGMA synchronous=NORMAL")
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)"
+                    )
+                    conn.execute("CREATE INDEX IF NOT EXISTS sessions_expires ON sessions (expires_at)")
+                    self._conn = conn
+        return self._conn
+
+    def load(self, session_id):
+        row = self._connect().execute(
+            "SELECT expires_at, data FROM sessions WHERE id = ? AND expires_at >= ?", (session_id, time.time())
+        ).fetchone()
+        return tuple(row) if row else None
+
+    def save(self, session_id, data_json, expires_at):
+        self._connect().execute(
+            "INSERT INTO sessions (id, data, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET data = excluded.data, expires_at = excluded.expires_at",
+            (session_id, data_json, expires_at)
+        )
+
+    def touch(self, session_id, expires_at):
+        self._connect().execute("UPDATE sessions SET expires_at = ? WHERE id = ?", (expires_at, session_id))
+
+    def delete(self, session_id):
+        self._connect().execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def gc(self):
+        cur = self._connect().execute("DELETE FROM sessions WHERE expires_at < ?", (time.time(),))
+        session_stats["expired"] += cur.rowcount
+
+def create_backend(name=SESSION_BACKEND):
+    if name == "memory":
+        # Each worker would keep its own sessions, logging users out whenever a
+        # request lands on another one. Only WEB_CONCURRENCY is visible here, so
+        # a --workers flag on the command line is not caught.
+        workers = int(os.getenv("WEB_CONCURRENCY", "1") or 1)
+        if workers > 1:
+            raise RuntimeError(f"SESSION_BACKEND=memory cannot be shared by {workers} workers; use sqlite")
+        return MemorySessionBackend()
+    if name != "sqlite":
+        print(f"[SESSION] Unknown SESSION_BACKEND {name!r}, using sqlite")
+    return SqliteSessionBackend()
+
+def _identity(session):
+    return session.get("realm"), session.get("username"), session.get("user_id")
+
+def rotate_session(request):
+    """Gives the session a new id when the response is sent; call on login."""
+    scope = getattr(request, "scope", None)
+    if scope is not None:
+        scope["session_rotate"] = True
+
+class ServerSessionMiddleware:
+    """
+    Drop-in replacement for Starlette's SessionMiddleware: `request.session` is
+    the same dict, but its contents stay on the server and the cookie carries
+    only a random session id.
+    """
+    def __init__(self, app, backend=None, cookie_name=SESSION_COOKIE, max_age=SESSION_MAX_AGE, https_only=SESSION_HTTPS_ONLY):
+        self.app = app
+        self.backend = backend or create_backend()
+        self.cookie_name = cookie_name
+        self.max_age = max_age
+        self.https_only = https_only
+        self._last_gc = time.monotonic()
+
+    def _session_id(self, scope):
+        for name, value in scope.get("headers", []):
+            if name == b"cookie":
+                cookie = SimpleCookie()
+                try:
+                    cookie.load(value.decode("latin-1"))
+                except Exception:
+                    continue
+                if self.cookie_name in cookie:
+                    return cookie[self.cookie_name].value
+        return None
+
+    async def _call(self, fn, *args):
+        if self.backend.blocking:
+            return await asyncio.get_running_loop().run_in_executor(_executor, fn, *args)
+        return fn(*args)
+
+    def _cookie_header(self, value, max_age):
+        parts = [f"{self.cookie_name}={value}", "path=/", f"Max-Age={max_age}", "HttpOnly", "SameSite=lax"]
+        if self.https_only:
+            parts.append("Secure")
+        return (b"set-cookie", "; ".join(parts).encode("latin-1"))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        if time.monotonic() - self._last_gc > SESSION_GC_INTERVAL:
+            self._last_gc = time.monotonic()
+            try:
+                await self._call(self.backend.gc)
+            except Exception as e:
+                print(f"[SESSION] GC error: {e}")
+
+        session_id = self._session_id(scope)
+        entry = None
+        if session_id:
+            session_stats["loads"] += 1
+            entry = await self._call(self.backend.load, session_id)
+            if entry is None:
+                session_stats["misses"] += 1
+        loaded_json = entry[1] if entry else None
+        scope["session"] = json.loads(loaded_json) if loaded_json else {}
+        loaded_identity = _identity(scope["session"])
+
+        async def send_wrapper(message):
+            nonlocal session_id
+            if message["type"] == "http.response.start":
+                session = scope["session"]
+                now = time.time()
+                expires_at = now + self.max_age
+                headers = list(message.get("headers", []))
+                if session:
+                    data_json = json.dumps(session, separators=(",", ":"), sort_keys=True)
+                    rotate = entry and (scope.get("session_rotate") or _identity(session) != loaded_identity)
+                    if rotate:
+                        # A login never reuses the id the browser came with: it may
+                        # have been planted by someone else (session fixation)
+                        await self._call(self.backend.delete, session_id)
+                        session_stats["rotations"] += 1
+                    if data_json != loaded_json or rotate:
+                        if not entry or rotate:
+                            # Never adopt an id the client chose or one that has expired
+                            session_id = secrets.token_urlsafe(32)
+                        await self._call(self.backend.save, session_id, data_json, expires_at)
+                        session_stats["saves"] += 1
+                        headers.append(self._cookie_header(session_id, self.max_age))
+                    elif expires_at - entry[0] > _TOUCH_INTERVAL:
+                        await self._call(self.backend.touch, session_id, expires_at)
+                        headers.append(self._cookie_header(session_id, self.max_age))
+                elif entry:
+                    await self._call(self.backend.delete, session_id)
+                    session_stats["deletes"] += 1
+                    headers.append(self._cookie_header("null", 0))
+                message["headers"] = headers
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
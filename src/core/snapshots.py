@@ -0,0 +1,108 @@
+import json
+from core import upstream
+from core.cache import TTLCache, UpstreamError
+from core.config import OR_MANAGER_URL, ASSET_CACHE_TTL, ASSET_CACHE_STALE_TTL
+from core import rule_engine, timers
+
+# Raw manager responses, shared by every tab and endpoint polling the same data.
+# Keys include the user id because visibility is decided per user by the manager.
+user_assets_cache = TTLCache("user_assets", ASSET_CACHE_TTL, ASSET_CACHE_STALE_TTL)  # (realm, user_id) -> [asset]
+asset_cache = TTLCache("asset", ASSET_CACHE_TTL, ASSET_CACHE_STALE_TTL)  # (realm, asset_id, user_id) -> asset
+
+def flatten_asset(a):
+    """Flattens a manager asset into {attribute: value} plus the latest MoistureData timestamp."""
+    flat_attrs = {}
+    last_activity_ts = None
+    if "attributes" in a:
+        for k, v in a["attributes"].items():
+            if isinstance(v, dict) and "value" in v:
+                val = v["value"]
+                ts = v.get("timestamp")
+                
+                # Inject timestamp for Rules and Timers
+                if k == "RuleTargets" or k.startswith("Timer"):
+                    if isinstance(val, str):
+                        try:
+                            parsed = json.loads(val)
+                            if isinstance(parsed, dict):
+                                val = parsed
+                        except:
+                            pass
+                    
+                    # Copy so the cached snapshot is never modified
+                    if isinstance(val, dict) and ts:
+                        val = dict(val, _timestamp=ts)
+
+                flat_attrs[k] = val
+                
+                # MoistureData for Activity Detection
+                if ts and k == "MoistureData":
+                    if last_activity_ts is None or ts > last_activity_ts:
+                        last_activity_ts = ts
+            else:
+                flat_attrs[k] = v
+    return flat_attrs, last_activity_ts
+
+def to_user_asset(a):
+    """Shapes a manager asset the way `/api/user/assets` returns it."""
+    flat_attrs, last_activity_ts = flatten_asset(a)
+    loc = None
+    if "location" in flat_attrs and isinstance(flat_attrs["location"], dict):
+        coords = flat_attrs["location"].get("coordinates")
+        if coords: loc = [coords[1], coords[0]]
+
+    return {
+        "id": a["id"],
+        "name": a.get("name", "Unnamed"),
+        "type": a.get("type", "Asset"),
+        "attributes": flat_attrs,
+        "location": loc,
+        "lastActivityTimestamp": last_activity_ts
+    }
+
+def _ingest(realm, assets):
+    # Fresh manager data also feeds the local rule evaluator and timer scheduler
+    rule_engine.ingest_assets(realm, assets)
+    timers.ingest_assets(realm, assets)
+
+async def get_user_assets_snapshot(realm, user_id, access_token):
+    """Assets linked to the user (`/asset/user/current`). Raises UpstreamError on failure."""
+    async def fetch():
+        res = await upstream.get(
+            f"{OR_MANAGER_URL}/api/{realm}/asset/user/current",
+            headers={"Authorization": f"Bearer {access_token}"}
+        )
+        if res.status_code != 200:
+            raise UpstreamError(res.status_code)
+        assets = res.json()
+        _ingest(realm, assets)
+        return assets
+    return await user_assets_cache.get((realm, user_id), fetch)
+
+async def get_asset_snapshot(realm, asset_id, user_id, access_token):
+    """A single asset (`/asset/{id}`). Raises UpstreamError on failure."""
+    async def fetch():
+        res = await upstream.get(
+            f"{OR_MANAGER_URL}/api/{realm}/asset/{asset_id}",
+            headers={"Authorization": f"Bearer {access_token}"}
+        )
+        if res.status_code != 200:
+            raise UpstreamError(res.status_code)
+        asset = res.json()
+        _ingest(realm, [asset])
+        return asset
+    return await asset_cache.get((realm, asset_id, user_id), fetch)
+
+def invalidate_asset(realm, asset_id):
+    """Drops every cached snapshot that contains `asset_id`, for all users."""
+    asset_cache.invalidate_where(lambda key, _: key[0] == realm and key[1] == asset_id)
+    user_assets_cache.invalidate_where(
+        lambda key, assets: key[0] == realm and (assets is None or any(a.get("id") == asset_id for a in assets))
+    )
+
+def invalidate_user(realm, user_id):
+    """Drops the user's linked-asset list, e.g. after a link/unlink."""
+    user_assets_cache.invalidate((realm, user_id))
+
+def cache_stats():
+    return {"user_assets": user_assets_cache.stats, "asset": asset_cache.stats}
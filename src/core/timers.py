@@ -0,0 +1,276 @@
+import asyncio
+import heapq
+import json
+import time
+from datetime import datetime, timedelta, timezone
+from core import upstream
+from core.config import OR_MANAGER_URL, DEFAULT_REALM, TIMER_SCHEDULER, TIMER_TIMEZONE, TIMER_POLL_INTERVAL
+
+try:
+    from zoneinfo import ZoneInfo
+    _TZ = ZoneInfo(TIMER_TIMEZONE)
+except Exception:
+    _TZ = timezone.utc
+
+DAYS = ["MON", "TUE", "WED", "THU", "FRI", "SAT", "SUN"]  # datetime.weekday() order
+
+def _int(value, limit):
+    try:
+        value = int(str(value).strip())
+    except ValueError:
+        return None
+    return value if 0 <= value <= limit else None
+
+def _outputs(value):
+    """'OUT 01,OUT 03' or 'r1,r3' -> ['r1', 'r3']"""
+    relays = []
+    for part in str(value or "").split(","):
+        part = part.strip().upper()
+        if part.startswith("OUT"):
+            num = _int(part[3:], 99)
+            if num:
+                relays.append(f"r{num}")
+        elif part.startswith("R") and _int(part[1:], 99):
+            relays.append(part.lower())
+    return sorted(set(relays))
+
+def parse_timer(value):
+    """
+    A Timer* attribute value as edited on the timers page, or None if it never
+    fires (status off, no days, no outputs or invalid times).
+    Returns (weekdays, (on_hour, on_minute), (off_hour, off_minute), relays).
+    """
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return None
+    if not isinstance(value, dict):
+        return None
+    if str(value.get("Status", "OFF")).upper() not in ("ON", "ACTIVE"):
+        return None
+    days = str(value.get("Days") or "").upper()
+    weekdays = frozenset(range(7)) if days == "EVERYDAY" else frozenset(
+        DAYS.index(d.strip()) for d in days.split(",") if d.strip() in DAYS
+    )
+    on = (_int(value.get("OnHour", 0), 23), _int(value.get("OnMinute", 0), 59))
+    off = (_int(value.get("OffHour", 0), 23), _int(value.get("OffMinute", 0), 59))
+    relays = tuple(_outputs(value.get("Outputs")))
+    if not weekdays or not relays or None in on or None in off or on == off:
+        return None
+    return weekdays, on, off, relays
+
+def next_transition(schedule, after):
+    """
+    (timestamp, state) of the first ON/OFF time strictly after the epoch second
+    `after`. The OFF time belongs to the day the period started, so a 22:00-06:00
+    timer switches off on the following morning.
+    """
+    weekdays, on, off, _ = schedule
+    start = datetime.fromtimestamp(after, _TZ).replace(hour=0, minute=0, second=0, microsecond=0)
+    best = None
+    # Yesterday's period may still end today; a week ahead always finds a day
+    for offset in range(-1, 8):
+        day = start + timedelta(days=offset)
+        if best is not None and day.timestamp() > best[0]:
+            break
+        if day.weekday() not in weekdays:
+            continue
+        on_at = day.replace(hour=on[0], minute=on[1])
+        off_at = day.replace(hour=off[0], minute=off[1])
+        if off_at <= on_at:
+            off_at += timedelta(days=1)
+        for at, state in ((on_at, True), (off_at, False)):
+            ts = at.timestamp()
+            if ts > after and (best is None or ts < best[0]):
+                best = (ts, state)
+    return best
+
+class TimerScheduler:
+    """
+    Every known Timer* schedule in one min-heap keyed by next fire time.
+
+    Changing or removing a timer bumps its version instead of searching the heap;
+    outdated heap entries are skipped when they surface (and the heap is rebuilt
+    once they outnumber the live ones), so every operation is O(log n).
+    """
+    def __init__(self):
+        self._heap = []       # (fire_at, seq, key, version, state)
+        self._timers = {}     # (realm, asset_id, attr) -> (schedule, version)
+        self._seq = 0
+        self.relays = {}      # (realm, asset_id) -> RelayData map last seen
+        self.changed = None   # asyncio.Event set when the earliest fire time may have moved
+        self.stats = {"timers": 0, "fired": 0, "writes": 0, "write_errors": 0, "reschedules": 0, "compactions": 0}
+
+    def _push(self, key, version, schedule, after):
+        nxt = next_transition(schedule, after)
+        if nxt is None:
+            return
+        self._seq += 1
+        heapq.heappush(self._heap, (nxt[0], self._seq, key, version, nxt[1]))
+        if self.changed is not None and self._heap[0][2] == key:
+            self.changed.set()
+
+    def set_timer(self, realm, asset_id, attr, value, now=None):
+        """(Re)indexes one timer; unchanged schedules keep their heap entry."""
+        key = (realm, asset_id, attr)
+        schedule = parse_timer(value)
+        current = self._timers.get(key)
+        if current is not None and current[0] == schedule:
+            return
+        if schedule is None:
+            if current is not None:
+                del self._timers[key]
+                self._maybe_compact()
+            self.stats["timers"] = len(self._timers)
+            return
+        version = current[1] + 1 if current else 0
+        self._timers[key] = (schedule, version)
+        self.stats["timers"] = len(self._timers)
+        self.stats["reschedules"] += 1
+        self._push(key, version, schedule, time.time() if now is None else now)
+        self._maybe_compact()
+
+    def ingest(self, realm, asset, now=None):
+        attributes = asset.get("attributes") or {}
+        asset_id = asset["id"]
+        seen = set()
+        for name, attr in attributes.items():
+            if name.startswith("Timer"):
+                seen.add(name)
+                self.set_timer(realm, asset_id, name, attr.get("value") if isinstance(attr, dict) else attr, now)
+        relays = attributes.get("RelayData")
+        if isinstance(relays, dict) and isinstance(relays.get("value"), dict):
+            self.relays[(realm, asset_id)] = relays["value"]
+        return seen
+
+    def forget_missing(self, realm, asset_id, seen):
+        for key in [k for k in self._timers if k[0] == realm and k[1] == asset_id and k[2] not in seen]:
+            self.set_timer(*key, None)
+
+    def _maybe_compact(self):
+        if len(self._heap) > 64 and len(self._heap) > 2 * len(self._timers):
+            self._heap = [e for e in self._heap if self._timers.get(e[2], (None, -1))[1] == e[3]]
+            heapq.heapify(self._heap)
+            self.stats["compactions"] += 1
+
+    def next_fire_at(self):
+        while self._heap:
+            _, _, key, version, _ = self._heap[0]
+            if self._timers.get(key, (None, -1))[1] == version:
+                return self._heap[0][0]
+            heapq.heappop(self._heap)
+        return None
+
+    def pop_due(self, now=None):
+        """
+        Removes every timer event due at `now`, schedules each timer's following
+        event and returns {(realm, asset_id): {relay: state}} in firing order.
+        """
+        now = time.time() if now is None else now
+        commands = {}
+        while self._heap and self._heap[0][0] <= now:
+            fire_at, _, key, version, state = heapq.heappop(self._heap)
+            current = self._timers.get(key)
+            if current is None or current[1] != version:
+                continue
+            schedule = current[0]
+            self.stats["fired"] += 1
+            relays = commands.setdefault(key[:2], {})
+            for relay in schedule[3]:
+                relays[relay] = state
+            self._push(key, version, schedule, fire_at)
+        return commands
+
+timer_scheduler = TimerScheduler()
+
+def ingest_assets(realm, assets):
+    """Feeds snapshot results to the scheduler when it is enabled."""
+    if TIMER_SCHEDULER:
+        for asset in assets:
+            if isinstance(asset, dict) and "id" in asset:
+                seen = timer_scheduler.ingest(realm, asset)
+                timer_scheduler.forget_missing(realm, asset["id"], seen)
+
+def update_timer(realm, asset_id, attr, value):
+    """Applies a Timer* write made through this app without waiting for a reload."""
+    if TIMER_SCHEDULER and attr.startswith("Timer"):
+        timer_scheduler.set_timer(realm, asset_id, attr, value)
+
+async def _write_relays(realm, asset_id, changes):
+    # Imported here: asset_patch imports snapshots, which imports this module
+    from core.asset_patch import patch_asset
+    from core.auth import with_admin_token
+    key = (realm, asset_id)
+    try:
+        # Only the changed keys are sent, merged into the manager's current
+        # RelayData, so relays toggled since the last load keep their state.
+        # patch_asset also drops the cached snapshots of the asset.
+        written = await with_admin_token(realm, lambda admin_token: patch_asset(
+            realm, asset_id, None, admin_token, attributes={"RelayData": {"set": changes}}
+        ))
+        timer_scheduler.stats["writes"] += 1
+        timer_scheduler.relays[key] = written.get("RelayData") or dict(timer_scheduler.relays.get(key, {}), **changes)
+        return
+    except Exception as e:
+        print(f"[TIMERS] RelayData write for {asset_id} failed: {e}")
+    timer_scheduler.stats["write_errors"] += 1
+
+async def _load_realm(realm, admin_token):
+    """Every asset in the realm that has a Timer* attribute."""
+    query = {
+        "realm": {"name": realm},
+        "attributes": {"items": [{"name": {"predicateType": "string", "match": "BEGIN", "value": "Timer"}}]}
+    }
+    res = await upstream.post(
+        f"{OR_MANAGER_URL}/api/{realm}/asset/query",
+        json=query, headers={"Authorization": f"Bearer {admin_token}"}
+    )
+    if res.status_code != 200:
+        print(f"[TIMERS] Asset query for {realm} failed: {res.status_code}")
+        if res.status_code == 401:
+            # Revoked admin token: the next round requests a new one
+            from core.auth import invalidate_admin_token
+            invalidate_admin_token(admin_token)
+        return
+    assets = res.json()
+    known = {a["id"] for a in assets}
+    for key in [k for k in timer_scheduler._timers if k[0] == realm and k[1] not in known]:
+        timer_scheduler.set_timer(*key, None)
+    ingest_assets(realm, assets)
+
+async def run(realm=DEFAULT_REALM):
+    """Scheduler loop; started from the app's startup when TIMER_SCHEDULER is set."""
+    from core.auth import get_admin_token
+    timer_scheduler.changed = asyncio.Event()
+    next_load = 0
+    while True:
+        try:
+            if time.monotonic() >= next_load:
+                next_load = time.monotonic() + TIMER_POLL_INTERVAL
+                admin_token = await get_admin_token(realm)
+                if admin_token:
+                    await _load_realm(realm, admin_token)
+
+            commands = timer_scheduler.pop_due()
+            commands = {key: changes for key, changes in commands.items() if key[0] == realm}
+            if commands:
+                await asyncio.gather(*[
+                    _write_relays(key[0], key[1], changes)
+                    for key, changes in commands.items()
+                ])
+
+            fire_at = timer_scheduler.next_fire_at()
+            wait = next_load - time.monotonic()
+            if fire_at is not None:
+                wait = min(wait, fire_at - time.time())
+            timer_scheduler.changed.clear()
+            try:
+                await asyncio.wait_for(timer_scheduler.changed.wait(), max(wait, 0))
+            except asyncio.TimeoutError:
+                pass
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[TIMERS] Scheduler error: {e}")
+            await asyncio.sleep(1)
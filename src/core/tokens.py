@@ -0,0 +1,119 @@
+import base64
+import hashlib
+import hmac
+import json
+import time
+from collections import OrderedDict
+from core import upstream
+from core.cache import TTLCache, UpstreamError
+from core.config import KEYCLOAK_URL, JWT_VERIFY, JWKS_TTL, TOKEN_CLAIMS_CACHE_SIZE
+
+# DER prefixes of the DigestInfo structure for RSASSA-PKCS1-v1_5 (RFC 8017, 9.2)
+_DIGEST_INFO = {
+    "RS256": (hashlib.sha256, bytes.fromhex("3031300d060960864801650304020105000420")),
+    "RS384": (hashlib.sha384, bytes.fromhex("3041300d060960864801650304020205000430")),
+    "RS512": (hashlib.sha512, bytes.fromhex("3051300d060960864801650304020305000440")),
+}
+# Minimum seconds between JWKS reloads triggered by an unknown key id
+_KID_RELOAD_INTERVAL = 30
+
+# realm -> {kid: (n, e)}. Keys rotate rarely, so an old set may be served for a
+# long while if Keycloak is unreachable.
+jwks_cache = TTLCache("jwks", JWKS_TTL, stale_ttl=JWKS_TTL * 24, max_entries=100)
+_claims = OrderedDict()  # (realm, sha256(token)) -> claims
+_last_kid_reload = {}
+token_stats = {"hits": 0, "verified": 0, "rejected": 0, "jwks_reloads": 0}
+
+class InvalidToken(Exception):
+    """The token is malformed or its signature does not verify."""
+
+def _b64decode(segment):
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+def _b64int(segment):
+    return int.from_bytes(_b64decode(segment), "big")
+
+def rsa_verify(alg, n, e, signing_input, signature):
+    """RSASSA-PKCS1-v1_5 signature check, enough for Keycloak's RS* tokens."""
+    hash_fn, prefix = _DIGEST_INFO[alg]
+    k = (n.bit_length() + 7) // 8
+    if len(signature) != k:
+        return False
+    em = pow(int.from_bytes(signature, "big"), e, n).to_bytes(k, "big")
+    t = prefix + hash_fn(signing_input).digest()
+    expected = b"\x00\x01" + b"\xff" * (k - len(t) - 3) + b"\x00" + t
+    return hmac.compare_digest(em, expected)
+
+async def _load_jwks(realm):
+    res = await upstream.get(f"{KEYCLOAK_URL}/realms/{realm}/protocol/openid-connect/certs")
+    if res.status_code != 200:
+        raise UpstreamError(res.status_code)
+    keys = {}
+    for jwk in res.json().get("keys", []):
+        if jwk.get("kty") == "RSA" and jwk.get("use", "sig") == "sig" and "n" in jwk and "e" in jwk:
+            keys[jwk.get("kid")] = (_b64int(jwk["n"]), _b64int(jwk["e"]))
+    token_stats["jwks_reloads"] += 1
+    return keys
+
+async def _signing_key(realm, kid):
+    keys = await jwks_cache.get(realm, lambda: _load_jwks(realm))
+    if kid not in keys and time.monotonic() - _last_kid_reload.get(realm, 0) > _KID_RELOAD_INTERVAL:
+        # Possibly a rotated key: reload once, rate limited so garbage kids cannot hammer Keycloak
+        _last_kid_reload[realm] = time.monotonic()
+        jwks_cache.invalidate(realm)
+        keys = await jwks_cache.get(realm, lambda: _load_jwks(realm))
+    return keys.get(kid)
+
+def _remember(key, claims):
+    _claims[key] = claims
+    if len(_claims) > TOKEN_CLAIMS_CACHE_SIZE:
+        _claims.popitem(last=False)
+
+async def verify_token(realm, token):
+    """
+    Verified claims of an access token issued by `realm`, memoised per realm and
+    token hash (a token verified for one realm is never accepted for another).
+    Expiry is left to the caller (a nearly expired token is still refreshed).
+    Raises InvalidToken for forged or malformed tokens and UpstreamError when the
+    realm keys cannot be loaded.
+    """
+    key = (realm, hashlib.sha256(token.encode()).digest())
+    claims = _claims.get(key)
+    if claims is not None:
+        _claims.move_to_end(key)
+        token_stats["hits"] += 1
+        return claims
+
+    try:
+        header_b64, payload_b64, signature_b64 = token.split(".")
+        header = json.loads(_b64decode(header_b64))
+        claims = json.loads(_b64decode(payload_b64))
+    except (ValueError, TypeError):
+        token_stats["rejected"] += 1
+        raise InvalidToken("Malformed token")
+    if not isinstance(claims, dict):
+        token_stats["rejected"] += 1
+        raise InvalidToken("Malformed token")
+
+    if JWT_VERIFY:
+        alg = header.get("alg")
+        if alg not in _DIGEST_INFO:
+            token_stats["rejected"] += 1
+            raise InvalidToken(f"Unsupported algorithm: {alg}")
+        if not str(claims.get("iss", "")).endswith(f"/realms/{realm}"):
+            token_stats["rejected"] += 1
+            raise InvalidToken("Token issued by another realm")
+        public_key = await _signing_key(realm, header.get("kid"))
+        try:
+            valid = public_key is not None and rsa_verify(
+                alg, public_key[0], public_key[1], f"{header_b64}.{payload_b64}".encode(), _b64decode(signature_b64)
+            )
+        except ValueError:
+            valid = False
+        if not valid:
+            token_stats["rejected"] += 1
+            raise InvalidToken("Bad signature")
+
+    token_stats["verified"] += 1
+    _remember(key, claims)
+    return claims
@@ -0,0 +1,70 @@
+import httpx
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from urllib.parse import urlsplit
+from core.config import (
+    UPSTREAM_TIMEOUT, UPSTREAM_CONNECT_TIMEOUT, UPSTREAM_MAX_CONNECTIONS_PER_HOST,
+    UPSTREAM_MAX_KEEPALIVE_PER_HOST, UPSTREAM_KEEPALIVE_EXPIRY
+)
+
+# One pooled client per upstream host (manager, keycloak, ...), so each host
+# gets its own connection limit and a slow host cannot starve the others.
+_clients = {}
+
+def _new_client(cookies=None):
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(UPSTREAM_TIMEOUT, connect=UPSTREAM_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=UPSTREAM_MAX_CONNECTIONS_PER_HOST,
+            max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE_PER_HOST,
+            keepalive_expiry=UPSTREAM_KEEPALIVE_EXPIRY,
+        ),
+        cookies=cookies,
+        follow_redirects=True,
+        verify=False,
+    )
+
+def get_client(url):
+    """Returns the pooled client for the host of `url`."""
+    parts = urlsplit(url)
+    key = (parts.scheme, parts.netloc)
+    client = _clients.get(key)
+    if client is None or client.is_closed:
+        # Upstream calls carry per-user bearer tokens; a shared client must never
+        # keep cookies from one user's response and replay them for another.
+        no_cookies = CookieJar(policy=DefaultCookiePolicy(allowed_domains=[]))
+        client = _new_client(httpx.Cookies(no_cookies))
+        _clients[key] = client
+    return client
+
+def session():
+    """Returns a private, cookie-keeping client for flows that need a browser-like
+    session (e.g. the Keycloak login form). Use it as `async with upstream.session()`."""
+    return _new_client()
+
+async def request(method, url, **kwargs):
+    return await get_client(url).request(method, url, **kwargs)
+
+async def open_stream(method, url, **kwargs):
+    """Sends a request and returns the response with its body still unread.
+    The caller must iterate it (e.g. `aiter_raw()`) and then `await res.aclose()`."""
+    client = get_client(url)
+    return await client.send(client.build_request(method, url, **kwargs), stream=True)
+
+async def get(url, **kwargs):
+    return await request("GET", url, **kwargs)
+
+async def post(url, **kwargs):
+    return await request("POST", url, **kwargs)
+
+async def put(url, **kwargs):
+    return await request("PUT", url, **kwargs)
+
+async def delete(url, **kwargs):
+    return await request("DELETE", url, **kwargs)
+
+async def close_clients():
+    """Closes every pooled client. Called on application shutdown."""
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        await client.aclose()
@@ -1,15 +1,20 @@
+import asyncio
 from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
-from starlette.middleware.sessions import SessionMiddleware
 from routes import auth as auth_routes, dashboard as dashboard_routes
-from api import assets as assets_api, rules as rules_api, user as user_api, debug as debug_api
+from api import assets as assets_api, rules as rules_api, user as user_api, debug as debug_api, stream as stream_api, history as history_api
+from core import upstream, preferences
+from core.sessions import ServerSessionMiddleware
+from core.registry import config_registry
+from core import rule_engine, timers
+from core.config import RULES_LOCAL_EVAL, TIMER_SCHEDULER
 
 app = FastAPI(title="DIBL IoT Custom UI") # Reload trigger v3
 
 # Session Middleware
 from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
 app.add_middleware(ProxyHeadersMiddleware, trusted_hosts=["*"])
-app.add_middleware(SessionMiddleware, secret_key="supersecretkey")
+app.add_middleware(ServerSessionMiddleware)
 
 # Static Files
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -19,11 +24,31 @@ app.include_router(assets_api.router)
 app.include_router(rules_api.router)
 app.include_router(user_api.router)
 app.include_router(debug_api.router)
+app.include_router(stream_api.router)
+app.include_router(history_api.router)
 
 # HTML Page Routers
 app.include_router(auth_routes.router)
 app.include_router(dashboard_routes.router)
 
+@app.on_event("startup")
+async def startup():
+    config_registry.start()
+    if RULES_LOCAL_EVAL:
+        app.state.rule_engine_task = asyncio.ensure_future(rule_engine.run())
+    if TIMER_SCHEDULER:
+        app.state.timer_task = asyncio.ensure_future(timers.run())
+
+@app.on_event("shutdown")
+async def shutdown():
+    await config_registry.stop()
+    for name in ("rule_engine_task", "timer_task"):
+        task = getattr(app.state, name, None)
+        if task is not None:
+            task.cancel()
+    await preferences.flush()
+    await upstream.close_clients()
+
 from fastapi.responses import FileResponse
 @app.get("/favicon.ico", include_in_schema=False)
 async def favicon():
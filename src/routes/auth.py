@@ -1,9 +1,8 @@
-import requests
 from fastapi import APIRouter, Request, Form
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
 from core.config import DEFAULT_REALM, KEYCLOAK_URL, OR_HOSTNAME, OR_ADMIN_PASSWORD
-from core.auth import get_admin_token, assign_roles_to_user, perform_auto_login_logic
+from core.auth import get_admin_token, admin_request, assign_roles_to_user, get_user_id_by_username, perform_auto_login_logic
 
 router = APIRouter(tags=["auth"])
 templates = Jinja2Templates(directory="templates")
@@ -20,7 +19,7 @@ async def login_get(request: Request):
 
 @router.post("/login", response_class=HTMLResponse)
 async def login_post(request: Request, username: str = Form(...), password: str = Form(...)):
-    success, result = perform_auto_login_logic(request, DEFAULT_REALM, username, password)
+    success, result = await perform_auto_login_logic(request, DEFAULT_REALM, username, password)
     if success:
         return RedirectResponse("/dashboard", status_code=303)
     return templates.TemplateResponse("login.html", {"request": request, "error": result})
@@ -37,10 +36,6 @@ async def signup_post(request: Request, username: str = Form(...), email: str =
     if terms == "on":
         print(f"User {username} accepted Terms and Conditions")
         
-    admin_token = get_admin_token(realm)
-    if not admin_token:
-        return templates.TemplateResponse("signup.html", {"request": request, "error": "Could not connect to auth server"})
-
     user_data = {
         "username": username,
         "email": email,
@@ -48,16 +43,20 @@ async def signup_post(request: Request, username: str = Form(...), email: str =
         "credentials": [{"type": "password", "value": password, "temporary": False}]
     }
     
-    headers = {"Authorization": f"Bearer {admin_token}", "Content-Type": "application/json"}
     create_url = f"{KEYCLOAK_URL}/admin/realms/{realm}/users"
     
     try:
-        res = requests.post(create_url, json=user_data, headers=headers)
+        res = await admin_request(realm, "POST", create_url, json=user_data)
+        if res is None:
+            return templates.TemplateResponse("signup.html", {"request": request, "error": "Could not connect to auth server"})
         if res.status_code == 201:
-            from core.auth import get_user_id_by_username
-            user_id = get_user_id_by_username(realm, username, admin_token)
+            admin_token = await get_admin_token(realm)
+            # Keycloak answers with Location: .../users/{id}; only look the user up if it is missing
+            user_id = res.headers.get("Location", "").rstrip("/").rsplit("/", 1)[-1] or None
+            if not user_id:
+                user_id = await get_user_id_by_username(realm, username, admin_token)
             if user_id:
-                assign_roles_to_user(realm, user_id, admin_token)
+                await assign_roles_to_user(realm, user_id, admin_token)
             return templates.TemplateResponse("signup.html", {"request": request, "success": "Account created! You can now login."})
         else:
             error_msg = res.json().get("errorMessage", "Registration failed")
@@ -1,4 +1,5 @@
 let pinnedAttributes = [];
+let currentAsset = null;
 const openGroups = new Set();
 
 function shouldShowPin(key, itemKey) {
@@ -21,6 +22,8 @@ async function loadDetail() {
         const res = await fetch(`/api/asset/${ASSET_ID}`);
         const asset = await res.json();
 
+        currentAsset = asset;
+
         if (!asset || !asset.id) {
             document.getElementById('detailCard').innerHTML = '<div style="padding:2rem; text-align:center; color:var(--danger)">IoT Device not found or access denied.</div>';
             return;
@@ -421,51 +424,41 @@ async function toggleAttribute(attrName, newValue) {
     }
 }
 
-async function toggleNestedAttribute(attrName, nestedKey, newValue) {
-    try {
-        const res = await fetch(`/api/asset/${ASSET_ID}`);
-        const asset = await res.json();
-
-        if (asset && asset.attributes && asset.attributes[attrName] !== undefined) {
-            let currentVal = asset.attributes[attrName];
-
-            // If value is a JSON
-            if (typeof currentVal === 'string') {
-                try {
-                    currentVal = JSON.parse(currentVal);
-                } catch (e) {
-                    console.error('Failed to parse attribute as JSON:', e);
-                    toast('Failed to update: invalid data format');
-                    return;
-                }
-            }
+function currentObjectAttribute(attrName) {
+    let val = currentAsset && currentAsset.attributes ? currentAsset.attributes[attrName] : undefined;
+    if (typeof val === 'string') {
+        try { val = JSON.parse(val); } catch (e) { return null; }
+    }
+    return (typeof val === 'object' && val !== null) ? val : null;
+}
 
-            if (typeof currentVal === 'object' && currentVal !== null) {
-                // Convert bool/string to "ON"/"OFF"
-                if (nestedKey === 'Status') {
-                    currentVal[nestedKey] = newValue ? 'ON' : 'OFF';
-                } else {
-                    currentVal[nestedKey] = newValue;
-                }
+async function applyNestedChange(attrName, changes, successMsg, withExpect = false) {
+    const current = currentObjectAttribute(attrName);
+    if (!current) {
+        toast('Attribute not found');
+        return false;
+    }
+    const expect = withExpect && current._timestamp ? { [attrName]: current._timestamp } : null;
+    const data = await patchAsset(ASSET_ID, { [attrName]: { set: changes } }, expect);
+    if (data.status === 'success') {
+        toast(successMsg);
+        return true;
+    }
+    if (data.status === 'conflict') {
+        toast('This setting was changed elsewhere. Reloaded, please try again.');
+    } else {
+        toast(`Failed to update ${attrName}: ${data.message || 'Unknown error'}`);
+    }
+    loadDetail();
+    return false;
+}
 
-                const updateRes = await fetch(`/api/asset/${ASSET_ID}/attribute/${attrName}`, {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ value: currentVal })
-                });
-                const updateData = await updateRes.json();
-                if (updateData.status === 'success') {
-                    toast(`${nestedKey} turned ${newValue ? 'ON' : 'OFF'}`);
-                    loadDetail();
-                } else {
-                    toast(`Failed to update ${nestedKey}: ${updateData.message || 'Unknown error'}`);
-                    loadDetail();
-                }
-            } else {
-                toast('Failed to update: attribute is not an object');
-            }
-        } else {
-            toast('Attribute not found');
+async function toggleNestedAttribute(attrName, nestedKey, newValue) {
+    try {
+        // Convert bool/string to "ON"/"OFF"
+        const value = nestedKey === 'Status' ? (newValue ? 'ON' : 'OFF') : newValue;
+        if (await applyNestedChange(attrName, { [nestedKey]: value }, `${nestedKey} turned ${newValue ? 'ON' : 'OFF'}`)) {
+            loadDetail();
         }
     } catch (e) {
         console.error('Toggle nested attribute error:', e);
@@ -477,43 +470,7 @@ async function toggleNestedAttribute(attrName, nestedKey, newValue) {
 async function updateNestedValue(attrName, nestedKey, newValue) {
     // Timer OnHour, OnMinute
     try {
-        const res = await fetch(`/api/asset/${ASSET_ID}`);
-        const asset = await res.json();
-
-        if (asset && asset.attributes && asset.attributes[attrName] !== undefined) {
-            let currentVal = asset.attributes[attrName];
-
-            if (typeof currentVal === 'string') {
-                try {
-                    currentVal = JSON.parse(currentVal);
-                } catch (e) {
-                    console.error('Failed to parse attribute as JSON:', e);
-                    toast('Failed to update: invalid data format');
-                    return;
-                }
-            }
-
-            if (typeof currentVal === 'object' && currentVal !== null) {
-                currentVal[nestedKey] = String(newValue);
-
-                const updateRes = await fetch(`/api/asset/${ASSET_ID}/attribute/${attrName}`, {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ value: currentVal })
-                });
-                const updateData = await updateRes.json();
-                if (updateData.status === 'success') {
-                    toast(`${nestedKey} updated to ${newValue}`);
-                } else {
-                    toast(`Failed to update ${nestedKey}: ${updateData.message || 'Unknown error'}`);
-                    loadDetail();
-                }
-            } else {
-                toast('Failed to update: attribute is not an object');
-            }
-        } else {
-            toast('Attribute not found');
-        }
+        await applyNestedChange(attrName, { [nestedKey]: String(newValue) }, `${nestedKey} updated to ${newValue}`);
     } catch (e) {
         console.error('Update nested value error:', e);
         toast('Failed to update value');
@@ -523,117 +480,23 @@ async function updateNestedValue(attrName, nestedKey, newValue) {
 
 async function toggleDay(attrName, nestedKey, day) {
     try {
-        const res = await fetch(`/api/asset/${ASSET_ID}`);
-        const asset = await res.json();
-
-        if (asset && asset.attributes && asset.attributes[attrName] !== undefined) {
-            let currentObj = asset.attributes[attrName];
-
-            if (typeof currentObj === 'string') {
-                try { currentObj = JSON.parse(currentObj); } catch (e) { return; }
-            }
-
-            if (typeof currentObj !== 'object' || currentObj === null) return;
-
-            let currentDaysStr = (currentObj[nestedKey] || '').toUpperCase();
-            const daysOrder = ['SUN', 'MON', 'TUE', 'WED', 'THU', 'FRI', 'SAT'];
-            let activeDays = [];
-
-            if (currentDaysStr === 'EVERYDAY') {
-                activeDays = [...daysOrder];
-            } else {
-                activeDays = currentDaysStr.split(',').map(d => d.trim()).filter(d => daysOrder.includes(d));
-            }
-
-            if (activeDays.includes(day)) {
-                activeDays = activeDays.filter(d => d !== day);
-            } else {
-                activeDays.push(day);
-            }
-
-            activeDays.sort((a, b) => daysOrder.indexOf(a) - daysOrder.indexOf(b));
-
-            let newValue = activeDays.join(',');
-            if (activeDays.length === 7) newValue = 'EVERYDAY';
-            if (activeDays.length === 0) newValue = 'NONE';
-
-            currentObj[nestedKey] = newValue;
-
-            const updateRes = await fetch(`/api/asset/${ASSET_ID}/attribute/${attrName}`, {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ value: currentObj })
-            });
-
-            if ((await updateRes.json()).status === 'success') {
-                toast(`Schedule updated: ${newValue}`);
-                loadDetail();
-            }
+        const current = currentObjectAttribute(attrName);
+        if (!current) return;
+        // Computed from the value on screen, so the write is checked against its timestamp
+        const newValue = nextTimerDays(current[nestedKey], day);
+        if (await applyNestedChange(attrName, { [nestedKey]: newValue }, `Schedule updated: ${newValue}`, true)) {
+            loadDetail();
         }
     } catch (e) { console.error(e); }
 }
 
 async function toggleTimerOutput(attrName, nestedKey, relay) {
     try {
-        const res = await fetch(`/api/asset/${ASSET_ID}`);
-        const asset = await res.json();
-
-        if (asset && asset.attributes && asset.attributes[attrName] !== undefined) {
-            let currentObj = asset.attributes[attrName];
-
-            if (typeof currentObj === 'string') {
-                try { currentObj = JSON.parse(currentObj); } catch (e) { return; }
-            }
-
-            if (typeof currentObj !== 'object' || currentObj === null) return;
-
-            let currentOutputsStr = (currentObj[nestedKey] || '').toUpperCase(); // "OUT 01,OUT 04" or "r1,r4"
-            // Normalize to internal r1, r2 format for processing
-            let activeOutputs = [];
-
-            // Map "OUT 01" -> "r1" ... ...
-            const mapOutToR = (str) => {
-                const parts = str.split(',').map(s => s.trim());
-                return parts.map(p => {
-                    if (p.startsWith('OUT')) {
-                        const num = parseInt(p.replace('OUT', '').trim());
-                        return `r${num}`;
-                    }
-                    return p.toLowerCase(); // fallback for existing r1 format
-                }).filter(p => p.startsWith('r'));
-            };
-
-            activeOutputs = mapOutToR(currentOutputsStr);
-
-            if (activeOutputs.includes(relay)) {
-                activeOutputs = activeOutputs.filter(r => r !== relay);
-            } else {
-                activeOutputs.push(relay);
-            }
-
-            // Sort numerically (r1, r2, r3, r4) and Convert back to "OUT 0X" format
-            const sorted = activeOutputs.sort();
-
-            const mapRToOut = (rFormatList) => {
-                return rFormatList.map(r => {
-                    const num = parseInt(r.replace('r', ''));
-                    return `OUT ${String(num).padStart(2, '0')}`;
-                });
-            };
-
-            let newValue = mapRToOut(sorted).join(',');
-            currentObj[nestedKey] = newValue;
-
-            const updateRes = await fetch(`/api/asset/${ASSET_ID}/attribute/${attrName}`, {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ value: currentObj })
-            });
-
-            if ((await updateRes.json()).status === 'success') {
-                toast(`Outputs updated: ${newValue || 'NONE'}`);
-                loadDetail();
-            }
+        const current = currentObjectAttribute(attrName);
+        if (!current) return;
+        const newValue = nextTimerOutputs(current[nestedKey], relay);
+        if (await applyNestedChange(attrName, { [nestedKey]: newValue }, `Outputs updated: ${newValue || 'NONE'}`, true)) {
+            loadDetail();
         }
     } catch (e) {
         console.error(e);
@@ -1,46 +1,111 @@
+// Live dashboard state, kept current by the /api/stream/assets SSE feed
+let dashboardAssets = {};
+let dashboardWidgets = [];
+
 async function loadDashboard() {
     try {
         const res = await fetch(`/api/user/assets?t=${Date.now()}`);
         const data = await res.json();
-        const assets = Array.isArray(data) ? data : (data.assets || []);
+        setDashboardAssets(Array.isArray(data) ? data : (data.assets || []));
+        renderDashboard();
+        loadWidgets();
+    } catch (e) {
+        console.error('Failed to load dashboard:', e);
+    }
+}
 
-        document.getElementById('totalAssets').textContent = assets.length;
+function setDashboardAssets(assets) {
+    dashboardAssets = {};
+    assets.forEach(a => { dashboardAssets[a.id] = a; });
+}
 
-        let online = 0;
-        let offline = 0;
-        // eslint-disable-next-line
-        const now = Date.now();
+function renderDashboard() {
+    const assets = Object.values(dashboardAssets);
+    updateStats(assets);
+    loadSwitches(assets);
+}
 
-        assets.forEach(a => {
-            const status = getAssetStatus(a.lastActivityTimestamp);
-            if (status.isOffline) {
-                offline++;
-            } else {
-                online++;
-            }
-        });
+function updateStats(assets) {
+    document.getElementById('totalAssets').textContent = assets.length;
 
-        document.getElementById('onlineDevices').textContent = online;
-        document.getElementById('offlineDevices').textContent = offline;
+    let online = 0;
+    let offline = 0;
 
-        let totalRules = 0;
-        assets.forEach(a => {
-            const storedRules = localStorage.getItem(`rules_${a.id}`);
-            if (storedRules) {
-                try {
-                    totalRules += JSON.parse(storedRules).length;
-                } catch (e) { }
-            }
-        });
-        document.getElementById('activeRules').textContent = totalRules;
+    assets.forEach(a => {
+        const status = getAssetStatus(a.lastActivityTimestamp);
+        if (status.isOffline) {
+            offline++;
+        } else {
+            online++;
+        }
+    });
 
-        loadSwitches(assets);
-        loadWidgets(assets);
-        keepAlive(assets);
+    document.getElementById('onlineDevices').textContent = online;
+    document.getElementById('offlineDevices').textContent = offline;
 
-    } catch (e) {
-        console.error('Failed to load dashboard:', e);
+    let totalRules = 0;
+    assets.forEach(a => {
+        const storedRules = localStorage.getItem(`rules_${a.id}`);
+        if (storedRules) {
+            try {
+                totalRules += JSON.parse(storedRules).length;
+            } catch (e) { }
+        }
+    });
+    document.getElementById('activeRules').textContent = totalRules;
+}
+
+function startLiveUpdates() {
+    if (!window.EventSource) {
+        loadDashboard();
+        setInterval(loadDashboard, 1000);
+        return;
     }
+
+    const stream = new EventSource('/api/stream/assets');
+
+    stream.addEventListener('snapshot', e => {
+        setDashboardAssets(JSON.parse(e.data).assets || []);
+        renderDashboard();
+        loadWidgets();
+    });
+
+    stream.addEventListener('delta', e => applyDelta(JSON.parse(e.data)));
+
+    stream.onerror = () => {
+        // EventSource reconnects on its own; a closed stream means the session is gone
+        if (stream.readyState === EventSource.CLOSED) window.location.href = '/';
+    };
+}
+
+function applyDelta(delta) {
+    // Linking/unlinking changes which cards exist, so redraw everything
+    if (delta.added.length || delta.removed.length) {
+        delta.added.forEach(a => { dashboardAssets[a.id] = a; });
+        delta.removed.forEach(id => { delete dashboardAssets[id]; });
+        renderDashboard();
+        loadWidgets();
+        return;
+    }
+
+    Object.entries(delta.changed).forEach(([id, change]) => {
+        const asset = dashboardAssets[id];
+        if (!asset) return;
+        const before = asset.lastActivityTimestamp;
+
+        Object.assign(asset.attributes, change.attributes || {});
+        (change.removedAttributes || []).forEach(k => { delete asset.attributes[k]; });
+        ['name', 'type', 'location', 'lastActivityTimestamp'].forEach(f => {
+            if (f in change) asset[f] = change[f];
+        });
+
+        if ((change.attributes && 'RelayData' in change.attributes) || 'name' in change || before !== asset.lastActivityTimestamp) {
+            replaceSwitchCard(asset);
+        }
+        refreshAssetWidgets(id);
+    });
+
+    updateStats(Object.values(dashboardAssets));
 }
 
 async function loadSwitches(assets) {
@@ -64,6 +129,17 @@ async function loadSwitches(assets) {
     }
 }
 
+function replaceSwitchCard(asset) {
+    const relayData = asset.attributes?.RelayData;
+    const card = document.querySelector(`[data-switch-asset="${CSS.escape(asset.id)}"]`);
+    if (!card || !relayData || typeof relayData !== 'object') {
+        loadSwitches(Object.values(dashboardAssets));
+        return;
+    }
+    const status = getAssetStatus(asset.lastActivityTimestamp);
+    card.outerHTML = renderSwitchCard(asset.name, asset.id, relayData, status.isOffline);
+}
+
 function renderSwitchCard(assetName, assetId, relayData, isIdle = false) {
     const keys = Object.keys(relayData).sort();
     let switchesHtml = '<div class="switch-grid">';
@@ -93,47 +169,34 @@ function renderSwitchCard(assetName, assetId, relayData, isIdle = false) {
     switchesHtml += '</div>';
 
     return `
-        <div class="widget-card" style="width:100%;">
+        <div class="widget-card" style="width:100%;" data-switch-asset="${assetId}">
              <div class="widget-card-header" style="font-size:1rem; border-bottom:1px solid #f0f0f0; margin-bottom:1rem; padding-bottom:0.5rem;">${assetName}</div>
             ${switchesHtml}
         </div>
     `;
 }
 
+// assetId -> time of the last toggle; keep-alive leaves these assets alone for a while,
+// so its re-write of the manager's value cannot race the toggle's own write
+const recentToggles = {};
+const TOGGLE_KEEPALIVE_HOLD_MS = 5000;
+
 async function toggleSwitch(assetId, key, newValue) {
     console.log(`[Dashboard] Toggling switch: ${assetId} / ${key} -> ${newValue}`);
+    recentToggles[assetId] = Infinity; // held until the write finishes
     try {
-        const res = await fetch(`/api/asset/${assetId}`);
-        if (!res.ok) throw new Error(`Failed to fetch asset: ${res.status}`);
-
-        const asset = await res.json();
-        let relayData = asset.attributes?.RelayData || {};
-
-        if (typeof relayData === 'string') {
-            try {
-                relayData = JSON.parse(relayData);
-            } catch (e) {
-                console.error('[Dashboard] Error parsing RelayData string:', e);
-                relayData = {};
-            }
-        }
-
-        relayData[key] = newValue;
-
-        console.log('[Dashboard] Sending updated RelayData:', relayData);
-
-        const updateRes = await fetch(`/api/asset/${assetId}/attribute/RelayData`, {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ value: relayData })
-        });
-
-        if (!updateRes.ok) throw new Error(`Failed to update attribute: ${updateRes.status}`);
+        // Only this relay key is written; other relays on the asset are left as they are
+        const data = await patchAsset(assetId, { RelayData: { set: { [key]: newValue } } });
+        if (data.status !== 'success') throw new Error(data.message || 'Failed to update attribute');
 
+        const relayData = dashboardAssets[assetId]?.attributes?.RelayData;
+        if (relayData && typeof relayData === 'object') relayData[key] = newValue;
         toast(`${key} turned ${newValue ? 'ON' : 'OFF'}`);
     } catch (e) {
         toast('Failed to toggle switch');
         console.error('[Dashboard] Toggle error:', e);
+    } finally {
+        recentToggles[assetId] = Date.now();
     }
 }
 
@@ -143,72 +206,115 @@ function renameSwitch(assetId, key) {
     if (newName && newName.trim()) {
         localStorage.setItem(`switch_name_${assetId}_${key}`, newName.trim());
         toast('Switch renamed');
-        loadDashboard();
+        renderDashboard();
     }
 }
 
-async function loadWidgets(assets = []) {
-    const sensorsContainer = document.getElementById('sensorsContainer');
-    const timersContainer = document.getElementById('timersContainer');
-    const rulesContainer = document.getElementById('rulesContainer');
-
+async function loadWidgets() {
     try {
         const res = await fetch(`/api/user/dashboard/widgets?t=${Date.now()}`);
-        let widgets = await res.json();
+        dashboardWidgets = await res.json();
 
-        widgets.forEach(w => {
+        dashboardWidgets.forEach(w => {
             if (!w.id) w.id = `${w.assetId}_${w.attributeName}_${w.key || ''}`;
         });
 
-        widgets = widgets.map(w => {
-            const localName = localStorage.getItem(`widget_name_${w.id}`);
-            if (localName) w.displayName = localName;
-            return w;
-        });
+        renderWidgets();
+    } catch (e) {
+        console.error('Failed to load widgets:', e);
+        const sensorsContainer = document.getElementById('sensorsContainer');
+        const timersContainer = document.getElementById('timersContainer');
+        const rulesContainer = document.getElementById('rulesContainer');
+        if (sensorsContainer) sensorsContainer.innerHTML = '<div class="empty-placeholder">Failed to load sensors.</div>';
+        if (timersContainer) timersContainer.innerHTML = '<div class="empty-placeholder">Failed to load timers.</div>';
+        if (rulesContainer) rulesContainer.innerHTML = '<div class="empty-placeholder">Failed to load rules.</div>';
+    }
+}
 
-        widgets = widgets.filter(w =>
-            !w.attributeName.toLowerCase().includes('threshold') &&
-            !w.attributeName.toLowerCase().includes('relaydata') &&
-            !(w.displayName && w.displayName.toLowerCase().includes('threshold'))
-        );
+// Resolves a pinned widget against the live asset state (falls back to the value
+// the widgets endpoint returned if the asset is not in the live state)
+function resolveWidget(def) {
+    const w = { ...def };
+    const localName = localStorage.getItem(`widget_name_${w.id}`);
+    if (localName) w.displayName = localName;
+
+    const asset = dashboardAssets[w.assetId];
+    if (asset) {
+        w.assetName = asset.name;
+        const raw = asset.attributes ? asset.attributes[w.attributeName] : undefined;
+        if (raw !== undefined) {
+            w.value = w.key && raw && typeof raw === 'object' ? (raw[w.key] ?? 'N/A') : raw;
+        }
+    }
+    return w;
+}
 
-        const sensors = widgets.filter(w => {
-            const attr = w.attributeName.toLowerCase();
-            return attr === 'envdata' || attr === 'moisturedata' || attr === 'npkdata';
-        });
+function isHiddenWidget(w) {
+    return w.attributeName.toLowerCase().includes('threshold') ||
+        w.attributeName.toLowerCase().includes('relaydata') ||
+        (w.displayName && w.displayName.toLowerCase().includes('threshold'));
+}
 
-        const timers = widgets.filter(w => w.attributeName.toLowerCase().startsWith('timer'));
-        const rules = widgets.filter(w => w.attributeName.toLowerCase() === 'ruletargets');
+function widgetSection(w) {
+    const attr = w.attributeName.toLowerCase();
+    if (attr === 'envdata' || attr === 'moisturedata' || attr === 'npkdata') return 'sensors';
+    if (attr.startsWith('timer')) return 'timers';
+    if (attr === 'ruletargets') return 'rules';
+    return null;
+}
 
-        if (sensors.length === 0) {
-            sensorsContainer.innerHTML = '<div class="empty-placeholder">No sensors pinned. Go to Device Details to pin some!</div>';
-        } else {
-            sensorsContainer.innerHTML = sensors.map(w => renderSensorCard(w)).join('');
-        }
+function renderWidget(w) {
+    const section = widgetSection(w);
+    let html;
+    if (section === 'timers') {
+        html = renderTimerCard(w);
+    } else if (section === 'rules') {
+        const asset = dashboardAssets[w.assetId];
+        html = renderRuleCard(w, asset ? asset.attributes : null);
+    } else {
+        html = renderSensorCard(w);
+    }
+    return `<div class="widget-slot" data-widget-id="${w.id}" style="display:contents;">${html}</div>`;
+}
 
-        if (timers.length === 0) {
-            timersContainer.innerHTML = '<div class="empty-placeholder">No timers pinned. Go to Device Details to pin some!</div>';
-        } else {
-            timersContainer.innerHTML = timers.map(w => renderTimerCard(w)).join('');
-        }
+function renderWidgets() {
+    const sensorsContainer = document.getElementById('sensorsContainer');
+    const timersContainer = document.getElementById('timersContainer');
+    const rulesContainer = document.getElementById('rulesContainer');
 
-        if (rulesContainer) {
-            if (rules.length === 0) {
-                rulesContainer.innerHTML = '<div class="empty-placeholder">No rules pinned. Go to Device Details to pin some!</div>';
-            } else {
-                rulesContainer.innerHTML = rules.map(w => {
-                    const asset = assets.find(a => a.id === w.assetId);
-                    return renderRuleCard(w, asset ? asset.attributes : null);
-                }).join('');
-            }
-        }
+    const widgets = dashboardWidgets.map(resolveWidget).filter(w => !isHiddenWidget(w));
+    const sensors = widgets.filter(w => widgetSection(w) === 'sensors');
+    const timers = widgets.filter(w => widgetSection(w) === 'timers');
+    const rules = widgets.filter(w => widgetSection(w) === 'rules');
 
-    } catch (e) {
-        console.error('Failed to load widgets:', e);
-        if (sensorsContainer) sensorsContainer.innerHTML = '<div class="empty-placeholder">Failed to load sensors.</div>';
-        if (timersContainer) timersContainer.innerHTML = '<div class="empty-placeholder">Failed to load timers.</div>';
-        if (rulesContainer) rulesContainer.innerHTML = '<div class="empty-placeholder">Failed to load rules.</div>';
+    if (sensors.length === 0) {
+        sensorsContainer.innerHTML = '<div class="empty-placeholder">No sensors pinned. Go to Device Details to pin some!</div>';
+    } else {
+        sensorsContainer.innerHTML = sensors.map(renderWidget).join('');
+    }
+
+    if (timers.length === 0) {
+        timersContainer.innerHTML = '<div class="empty-placeholder">No timers pinned. Go to Device Details to pin some!</div>';
+    } else {
+        timersContainer.innerHTML = timers.map(renderWidget).join('');
     }
+
+    if (rulesContainer) {
+        if (rules.length === 0) {
+            rulesContainer.innerHTML = '<div class="empty-placeholder">No rules pinned. Go to Device Details to pin some!</div>';
+        } else {
+            rulesContainer.innerHTML = rules.map(renderWidget).join('');
+        }
+    }
+}
+
+// Re-renders only the widget cards that belong to one asset
+function refreshAssetWidgets(assetId) {
+    dashboardWidgets.filter(def => def.assetId === assetId).forEach(def => {
+        const w = resolveWidget(def);
+        const slot = document.querySelector(`[data-widget-id="${CSS.escape(w.id)}"]`);
+        if (slot && !isHiddenWidget(w)) slot.outerHTML = renderWidget(w);
+    });
 }
 
 function renderSensorCard(w) {
@@ -547,7 +653,7 @@ async function renameWidget(widgetId, currentName) {
             localStorage.setItem(`widget_name_${widgetId}`, newName.trim());
 
             toast('Widget renamed');
-            loadWidgets();
+            renderWidgets();
         } catch (e) {
             console.error(e);
         }
@@ -594,22 +700,47 @@ function toast(msg) {
 }
 
 document.addEventListener('DOMContentLoaded', () => {
-    loadDashboard();
-    setInterval(loadDashboard, 1000);
+    startLiveUpdates();
+    setInterval(() => keepAlive(Object.values(dashboardAssets)), 1000);
 });
 
+// Switches many relays in one request; returns one result per command
+async function setRelays(commands, force = false) {
+    const res = await fetch('/api/relays/bulk', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ commands, force })
+    });
+    return res.json();
+}
+
+let keepAliveInFlight = false;
+
 async function keepAlive(assets) {
+    // Re-send every relay's current state, all assets in one round trip. Commands
+    // carry no state: the server re-writes what the manager holds, so a stale
+    // dashboardAssets cannot undo toggles made in another tab or device
+    if (keepAliveInFlight) return;
+    const commands = [];
+    const now = Date.now();
     for (const asset of assets) {
-        if (asset.attributes?.RelayData) {
-            try {
-                await fetch(`/api/asset/${asset.id}/attribute/RelayData`, {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ value: asset.attributes.RelayData })
-                });
-            } catch (e) {
-                console.error('[Dashboard] Keep-alive failed for', asset.id, e);
-            }
+        // Skip assets toggled just now, so a tick cannot push the old state back
+        if (now - (recentToggles[asset.id] || 0) < TOGGLE_KEEPALIVE_HOLD_MS) continue;
+        const relayData = asset.attributes?.RelayData;
+        if (relayData && typeof relayData === 'object') {
+            Object.keys(relayData).forEach(key => commands.push({ assetId: asset.id, key }));
         }
     }
-}
\ No newline at end of file
+    if (commands.length === 0) return;
+
+    keepAliveInFlight = true;
+    try {
+        const data = await setRelays(commands, true);
+        (data.results || []).filter(r => r.status !== 'success').forEach(r =>
+            console.error('[Dashboard] Keep-alive failed for', r.assetId, r.key, r.message));
+    } catch (e) {
+        console.error('[Dashboard] Keep-alive failed', e);
+    } finally {
+        keepAliveInFlight = false;
+    }
+}
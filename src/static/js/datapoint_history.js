@@ -216,9 +216,26 @@ function getTimeRange() {
 }
 
 // Visualization State
-let currentData = null;
+let currentData = null;    // raw datapoints for table/JSON views
+let currentSeries = null;  // downsampled {t, v} columns for the chart
+let lastQuery = null;
 let chartInstance = null;
 
+// Switching view mode fetches whatever the new view needs for the last query
+async function switchView() {
+    if (lastQuery) await loadForMode();
+    updateView();
+}
+
+async function loadForMode() {
+    const mode = document.querySelector('input[name="viewMode"]:checked').value;
+    if (mode === 'graph') {
+        if (!currentSeries) currentSeries = await fetchSeries(lastQuery);
+    } else if (!currentData) {
+        currentData = await fetchRawDatapoints(lastQuery);
+    }
+}
+
 function updateView() {
     // Hide all
     document.getElementById('initialMessage').style.display = 'none';
@@ -229,11 +246,18 @@ function updateView() {
     // Show Selected
     const mode = document.querySelector('input[name="viewMode"]:checked').value;
 
-    if (!currentData || (Array.isArray(currentData) && currentData.length === 0)) {
+    const shown = mode === 'graph' ? currentSeries : currentData;
+    const isEmpty = mode === 'graph'
+        ? (!currentSeries || typeof currentSeries === 'string' || currentSeries.t.length === 0)
+        : (!currentData || (Array.isArray(currentData) && currentData.length === 0));
+
+    if (isEmpty) {
         const msg = document.getElementById('initialMessage');
         msg.style.display = 'block';
-        if (typeof currentData === 'string') {
-            msg.textContent = currentData;
+        if (typeof shown === 'string') {
+            msg.textContent = shown;
+        } else if (shown) {
+            msg.textContent = 'No data in the selected range.';
         } else {
             msg.innerHTML = 'Choose a device and group above, then click <strong>Fetch Data</strong> to see the history.';
         }
@@ -251,7 +275,7 @@ function updateView() {
         renderTable(currentData);
     } else if (mode === 'graph') {
         document.getElementById('graphOutput').style.display = 'block';
-        renderGraph(currentData);
+        renderGraph(currentSeries);
     }
 }
 
@@ -331,30 +355,17 @@ function renderTable(data) {
     container.innerHTML = html;
 }
 
-function renderGraph(data) {
+function renderGraph(series) {
     const ctx = document.getElementById('datapointChart').getContext('2d');
 
     if (chartInstance) {
         chartInstance.destroy();
     }
 
-    if (!Array.isArray(data)) return;
+    if (!series || !Array.isArray(series.t)) return;
 
-    // Sort by timestamp asc for graph
-    const sorted = [...data].sort((a, b) => a.x - b.x);
-
-    const labels = sorted.map(pt => new Date(pt.x).toLocaleString());
-    const values = sorted.map(pt => {
-        let val = pt.y;
-
-        // Handle boolean strings or actual booleans
-        if (val === 'true' || val === true) return 1;
-        if (val === 'false' || val === false) return 0;
-
-        // Attempt to convert to number
-        const v = Number(val);
-        return isNaN(v) ? 0 : v;
-    });
+    const labels = series.t.map(ts => new Date(ts).toLocaleString());
+    const values = series.v;
 
     chartInstance = new Chart(ctx, {
         type: 'line',
@@ -415,7 +426,7 @@ function renderGraph(data) {
 
 async function fetchDatapoints() {
     if (!currentAssetId || !currentAttribute) {
-        currentData = "Please select a device and group.";
+        currentData = currentSeries = "Please select a device and group.";
         updateView();
         return;
     }
@@ -428,12 +439,51 @@ async function fetchDatapoints() {
     document.getElementById('graphOutput').style.display = 'none';
 
     const { start, end } = getTimeRange();
+    lastQuery = {
+        assetId: currentAssetId,
+        attribute: currentAttribute,
+        subAttribute: currentSubAttribute,
+        start,
+        end
+    };
+    currentData = null;
+    currentSeries = null;
+
+    await loadForMode();
+    updateView();
+}
+
+// Chart data: downsampled server-side to roughly one point per pixel
+async function fetchSeries(q) {
+    const canvas = document.getElementById('datapointChart');
+    const params = new URLSearchParams({
+        assetId: q.assetId,
+        attributeName: q.attribute,
+        fromTimestamp: q.start,
+        toTimestamp: q.end,
+        width: Math.max(100, Math.round((canvas.parentElement || canvas).clientWidth || 1000)),
+        method: 'lttb'
+    });
+    if (q.subAttribute) params.set('key', q.subAttribute);
+
+    try {
+        const res = await fetch(`/api/history?${params.toString()}`);
+        const data = await res.json();
+        if (!res.ok) return data.error || "Error fetching data";
+        return data;
+    } catch (e) {
+        return 'Request failed: ' + e.message;
+    }
+}
+
+// Table/JSON data: every raw datapoint in the range
+async function fetchRawDatapoints(q) {
     // Official API: POST /api/{realm}/asset/datapoint/{assetId}/{attributeName}
-    const endpoint = `/api/${realm}/asset/datapoint/${currentAssetId}/${currentAttribute}`;
+    const endpoint = `/api/${realm}/asset/datapoint/${q.assetId}/${q.attribute}`;
 
     const body = {
-        fromTimestamp: start,
-        toTimestamp: end,
+        fromTimestamp: q.start,
+        toTimestamp: q.end,
         type: "json"
     };
 
@@ -451,47 +501,42 @@ async function fetchDatapoints() {
 
         // Check for error in proxy envelope
         if (data.status >= 400) {
-            currentData = data.data || "Error fetching data";
-        } else {
-            // Success
-            // API usually returns plain array: [{"x": ts, "y": val}, ...]
-            // Or sometimes wrapped. Let's assume array or data property.
-            let rawData = data.data || data;
-
-            // If proxy returns {status: 200, data: [...]}
-            // rawData should be the array.
-            if (data.status === 200 && Array.isArray(data.data)) {
-                rawData = data.data;
-            }
+            return data.data || "Error fetching data";
+        }
 
-            // Process Data if Sub-Attribute is selected
-            if (Array.isArray(rawData) && currentSubAttribute) {
-                currentData = rawData.map(pt => {
-                    let val = pt.y;
-                    try {
-                        // Parse if string
-                        if (typeof val === 'string') val = JSON.parse(val);
-                        // Extract sub-key
-                        if (val && typeof val === 'object') {
-                            return { x: pt.x, y: val[currentSubAttribute] };
-                        }
-                    } catch (e) { console.log('Parse error', e); }
-                    return { x: pt.x, y: null }; // Invalid or missing
-                }).filter(pt => pt.y !== null && pt.y !== undefined);
-            } else {
-                currentData = rawData;
-            }
+        // Success
+        // API usually returns plain array: [{"x": ts, "y": val}, ...]
+        // Or sometimes wrapped. Let's assume array or data property.
+        let rawData = data.data || data;
+
+        // If proxy returns {status: 200, data: [...]}
+        // rawData should be the array.
+        if (data.status === 200 && Array.isArray(data.data)) {
+            rawData = data.data;
         }
 
+        // Process Data if Sub-Attribute is selected
+        if (Array.isArray(rawData) && q.subAttribute) {
+            return rawData.map(pt => {
+                let val = pt.y;
+                try {
+                    // Parse if string
+                    if (typeof val === 'string') val = JSON.parse(val);
+                    // Extract sub-key
+                    if (val && typeof val === 'object') {
+                        return { x: pt.x, y: val[q.subAttribute] };
+                    }
+                } catch (e) { console.log('Parse error', e); }
+                return { x: pt.x, y: null }; // Invalid or missing
+            }).filter(pt => pt.y !== null && pt.y !== undefined);
+        }
+        return rawData;
     } catch (e) {
-        currentData = 'Request failed: ' + e.message;
+        return 'Request failed: ' + e.message;
     }
-
-
-    updateView();
 }
 
-async function exportDatapoints() {
+function exportDatapoints() {
     if (!currentAssetId || !currentAttribute) {
         alert("Please select a device and group first.");
         return;
@@ -499,64 +544,21 @@ async function exportDatapoints() {
 
     const { start, end } = getTimeRange();
 
-    // Construct attributeRefs JSON
-    const refs = JSON.stringify([{ id: currentAssetId, name: currentAttribute }]);
-    const encodedRefs = encodeURIComponent(refs);
-
-    // API params: fromTimestamp, toTimestamp, attributeRefs
-    const endpoint = `/api/${realm}/asset/datapoint/export?attributeRefs=${encodedRefs}&fromTimestamp=${start}&toTimestamp=${end}`;
-
-    // Show feedback
-    const btn = document.querySelector('button[onclick="exportDatapoints()"]');
-    const originalText = btn.textContent;
-    btn.textContent = "Exporting...";
-    btn.disabled = true;
-
-    try {
-        const res = await fetch('/api/debug/proxy', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({
-                method: 'GET',
-                endpoint: endpoint
-            })
-        });
+    // The export endpoint streams the ZIP straight from the manager; letting the
+    // browser download it directly keeps it out of page memory and allows resume
+    const params = new URLSearchParams({
+        assetId: currentAssetId,
+        attributeName: currentAttribute,
+        fromTimestamp: start,
+        toTimestamp: end
+    });
 
-        if (res.ok) {
-            // Check if it returned a file (blob) or JSON error
-            const contentType = res.headers.get("Content-Type");
-            if (contentType && contentType.includes("application/json")) {
-                const data = await res.json();
-                if (data.status >= 400) {
-                    alert("Export failed: " + JSON.stringify(data.data));
-                } else {
-                    // Unexpected JSON success?
-                    console.log("Unexpected JSON", data);
-                }
-            } else {
-                // Should be a blob
-                const blob = await res.blob();
-                const url = window.URL.createObjectURL(blob);
-                const a = document.createElement('a');
-                a.href = url;
-                // Try to get filename from header or default
-                // The proxy sets Content-Disposition
-                a.download = `${currentAttribute}_export.zip`;
-                document.body.appendChild(a);
-                a.click();
-                a.remove();
-                window.URL.revokeObjectURL(url);
-            }
-        } else {
-            alert("Export request failed.");
-        }
-    } catch (e) {
-        console.error(e);
-        alert("Export error: " + e.message);
-    } finally {
-        btn.textContent = originalText;
-        btn.disabled = false;
-    }
+    const a = document.createElement('a');
+    a.href = `/api/history/export?${params.toString()}`;
+    a.download = `${currentAttribute}_export.zip`;
+    document.body.appendChild(a);
+    a.click();
+    a.remove();
 }
 
 function copyToClipboard() {
@@ -103,6 +103,48 @@ function toast(msg) {
 
 fetchFriendlyNames().catch(() => { });
 
+// Partial asset update: only the given attributes/keys are written. `expect` maps
+// attribute names to the timestamp the page read; a mismatch returns status 'conflict'.
+async function patchAsset(assetId, attributes, expect) {
+    const body = { attributes };
+    if (expect) body.expect = expect;
+    const res = await fetch(`/api/asset/${assetId}`, {
+        method: 'PATCH',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(body)
+    });
+    return res.json();
+}
+
+function nextTimerDays(currentDays, day) {
+    const daysOrder = ['SUN', 'MON', 'TUE', 'WED', 'THU', 'FRI', 'SAT'];
+    const current = (currentDays || '').toUpperCase();
+    let activeDays = current === 'EVERYDAY'
+        ? [...daysOrder]
+        : current.split(',').map(d => d.trim()).filter(d => daysOrder.includes(d));
+
+    if (activeDays.includes(day)) activeDays = activeDays.filter(d => d !== day);
+    else activeDays.push(day);
+
+    activeDays.sort((a, b) => daysOrder.indexOf(a) - daysOrder.indexOf(b));
+    if (activeDays.length === 7) return 'EVERYDAY';
+    if (activeDays.length === 0) return 'NONE';
+    return activeDays.join(',');
+}
+
+function nextTimerOutputs(currentOutputs, relay) {
+    // "OUT 01,OUT 04" (or legacy "r1,r4") -> toggled relay -> "OUT 0X" list
+    let active = (currentOutputs || '').toUpperCase().split(',').map(s => s.trim()).map(p => {
+        if (p.startsWith('OUT')) return `r${parseInt(p.replace('OUT', '').trim())}`;
+        return p.toLowerCase();
+    }).filter(p => p.startsWith('r'));
+
+    if (active.includes(relay)) active = active.filter(r => r !== relay);
+    else active.push(relay);
+
+    return active.sort().map(r => `OUT ${String(parseInt(r.replace('r', ''))).padStart(2, '0')}`).join(',');
+}
+
 function clearDiblCache() {
     sessionStorage.removeItem(FRIENDLY_NAMES_CACHE_KEY);
 }
@@ -375,72 +375,43 @@ function getOperatorCode(op) {
     return 0;
 }
 
+async function syncRuleTargets(payload) {
+    const res = await fetch(`/api/user/rules/targets/${currentAssetId}`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(payload)
+    });
+    const data = await res.json();
+    if (data.status !== 'success') throw new Error(data.message || 'Failed to update rule targets');
+    return data.targets;
+}
+
 async function updateRuleTargets(sensorPath, targetRelay, targetState, operator, threshold, ruleId, ruleName) {
-    const attrName = "RuleTargets";
     const { key: sensorKey } = parseThresholdAttribute(sensorPath);
     if (!sensorKey) return;
 
-    const uniqueKey = `${sensorKey}_${ruleId}`;
-
-    console.log(`[Rules] Syncing targets...`);
-
-    const asset = await fetch(`/api/asset/${currentAssetId}`).then(r => r.json());
-    let targets = asset.attributes[attrName] || {};
-
-    if (typeof targets === 'string') {
-        try { targets = JSON.parse(targets); } catch (e) { targets = {}; }
-    }
-
-    if (!targets) targets = {};
-
-    targets = { ...targets };
-    let rVal = targetRelay;
-    if (rVal.includes('.')) rVal = rVal.split('.')[1];
-
-    let groovyOp = operator;
-    if (operator === '=') groovyOp = '==';
-
-    const valToStore = `${groovyOp}:${threshold}:${rVal}:${targetState ? '1' : '0'}:${ruleName || ''}`;
-
-    targets[uniqueKey] = valToStore;
-
-    console.log(`[Rules] Setting ${attrName}.${uniqueKey} = ${valToStore}`);
-
-    await fetch(`/api/asset/${currentAssetId}/attribute/${attrName}`, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ value: targets })
+    console.log(`[Rules] Syncing ${ruleId}...`);
+
+    await syncRuleTargets({
+        rules: [{
+            id: ruleId,
+            name: ruleName || '',
+            sensor: sensorPath,
+            operator: operator,
+            value: threshold,
+            relay: targetRelay,
+            relayState: targetState
+        }]
     });
 }
 
 async function clearRuleTarget(sensorPath, ruleId) {
-    const attrName = "RuleTargets";
     const { key: sensorKey } = parseThresholdAttribute(sensorPath);
     if (!sensorKey) return;
 
-    const uniqueKey = `${sensorKey}_${ruleId}`;
-
-    console.log(`[Rules] Clearing target for ${uniqueKey}...`);
-
-    const asset = await fetch(`/api/asset/${currentAssetId}`).then(r => r.json());
-    let targets = asset.attributes[attrName] || {};
-
-    if (typeof targets === 'string') {
-        try { targets = JSON.parse(targets); } catch (e) { targets = {}; }
-    }
-
-    if (!targets) targets = {};
-
-    targets = { ...targets };
-    delete targets[uniqueKey];
-
-    console.log(`[Rules] Removed ${uniqueKey} from ${attrName}`);
+    console.log(`[Rules] Clearing target for ${ruleId}...`);
 
-    await fetch(`/api/asset/${currentAssetId}/attribute/${attrName}`, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ value: targets })
-    });
+    await syncRuleTargets({ remove: [ruleId] });
 }
 
 async function checkPinStatus() {
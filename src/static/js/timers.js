@@ -1,10 +1,13 @@
 const openGroups = new Set();
+let timerAssets = {};
 
 async function loadTimers() {
     try {
         const res = await fetch('/api/user/assets');
         const data = await res.json();
         const assets = Array.isArray(data) ? data : (data.assets || []);
+        timerAssets = {};
+        assets.forEach(a => { timerAssets[a.id] = a; });
 
         const container = document.getElementById('assetsList');
         const loading = document.getElementById('loadingText');
@@ -247,24 +250,33 @@ function toggleAssetGroup(id) {
     }
 }
 
-async function toggleNestedAttribute(assetId, attrName, nestedKey, newValue) {
-    try {
-        const res = await fetch(`/api/asset/${assetId}`);
-        const asset = await res.json();
+function currentTimer(assetId, attrName) {
+    const asset = timerAssets[assetId];
+    let val = asset && asset.attributes ? asset.attributes[attrName] : undefined;
+    if (typeof val === 'string') {
+        try { val = JSON.parse(val); } catch (e) { return null; }
+    }
+    return (typeof val === 'object' && val !== null) ? val : null;
+}
 
-        let currentVal = asset.attributes[attrName]?.value || asset.attributes[attrName];
-        if (typeof currentVal === 'string') {
-            try { currentVal = JSON.parse(currentVal); } catch (e) { }
-        }
+async function saveTimerKeys(assetId, attrName, changes, withExpect = false) {
+    const current = currentTimer(assetId, attrName);
+    const expect = withExpect && current && current._timestamp ? { [attrName]: current._timestamp } : null;
+    const data = await patchAsset(assetId, { [attrName]: { set: changes } }, expect);
+    if (data.status === 'success') {
+        toast('Updated');
+    } else if (data.status === 'conflict') {
+        toast('Timer was changed elsewhere. Reloaded, please try again.');
+    } else {
+        toast('Failed to update');
+    }
+    loadTimers();
+}
 
-        if (typeof currentVal === 'object') {
-            if (nestedKey === 'Status') {
-                currentVal[nestedKey] = newValue ? 'ON' : 'OFF';
-            } else {
-                currentVal[nestedKey] = newValue;
-            }
-            await saveAttribute(assetId, attrName, currentVal);
-        }
+async function toggleNestedAttribute(assetId, attrName, nestedKey, newValue) {
+    try {
+        const value = nestedKey === 'Status' ? (newValue ? 'ON' : 'OFF') : newValue;
+        await saveTimerKeys(assetId, attrName, { [nestedKey]: value });
     } catch (e) {
         console.error(e);
         toast('Error updating');
@@ -273,17 +285,7 @@ async function toggleNestedAttribute(assetId, attrName, nestedKey, newValue) {
 
 async function updateNestedValue(assetId, attrName, nestedKey, newValue) {
     try {
-        const res = await fetch(`/api/asset/${assetId}`);
-        const asset = await res.json();
-        let currentVal = asset.attributes[attrName]?.value || asset.attributes[attrName];
-        if (typeof currentVal === 'string') {
-            try { currentVal = JSON.parse(currentVal); } catch (e) { }
-        }
-
-        if (typeof currentVal === 'object') {
-            currentVal[nestedKey] = String(newValue);
-            await saveAttribute(assetId, attrName, currentVal);
-        }
+        await saveTimerKeys(assetId, attrName, { [nestedKey]: String(newValue) });
     } catch (e) {
         console.error(e);
     }
@@ -292,92 +294,21 @@ async function updateNestedValue(assetId, attrName, nestedKey, newValue) {
 
 async function toggleDay(assetId, attrName, nestedKey, day) {
     try {
-        const res = await fetch(`/api/asset/${assetId}`);
-        const asset = await res.json();
-        let currentVal = asset.attributes[attrName]?.value || asset.attributes[attrName];
-        if (typeof currentVal === 'string') {
-            try { currentVal = JSON.parse(currentVal); } catch (e) { }
-        }
-
-        if (typeof currentVal === 'object') {
-            let currentDaysStr = (currentVal[nestedKey] || '').toUpperCase();
-            const daysOrder = ['SUN', 'MON', 'TUE', 'WED', 'THU', 'FRI', 'SAT'];
-            let activeDays = [];
-            if (currentDaysStr === 'EVERYDAY') activeDays = [...daysOrder];
-            else activeDays = currentDaysStr.split(',').map(d => d.trim()).filter(d => daysOrder.includes(d));
-
-            if (activeDays.includes(day)) activeDays = activeDays.filter(d => d !== day);
-            else activeDays.push(day);
-
-            activeDays.sort((a, b) => daysOrder.indexOf(a) - daysOrder.indexOf(b));
-            let newValue = activeDays.join(',');
-            if (activeDays.length === 7) newValue = 'EVERYDAY';
-            if (activeDays.length === 0) newValue = 'NONE';
-
-            currentVal[nestedKey] = newValue;
-            await saveAttribute(assetId, attrName, currentVal);
-        }
+        const current = currentTimer(assetId, attrName);
+        if (!current) return;
+        await saveTimerKeys(assetId, attrName, { [nestedKey]: nextTimerDays(current[nestedKey], day) }, true);
     } catch (e) { console.error(e); }
 }
 
 async function toggleTimerOutput(assetId, attrName, nestedKey, relay) {
     try {
-        const res = await fetch(`/api/asset/${assetId}`);
-        const asset = await res.json();
-        let currentVal = asset.attributes[attrName]?.value || asset.attributes[attrName];
-        if (typeof currentVal === 'string') {
-            try { currentVal = JSON.parse(currentVal); } catch (e) { }
-        }
-
-        if (typeof currentVal === 'object') {
-            let currentOutputsStr = (currentVal[nestedKey] || '').toUpperCase();
-
-            const mapOutToR = (str) => {
-                const parts = str.split(',').map(s => s.trim());
-                return parts.map(p => {
-                    if (p.startsWith('OUT')) {
-                        const num = parseInt(p.replace('OUT', '').trim());
-                        return `r\${num}`;
-                    }
-                    return p.toLowerCase();
-                }).filter(p => p.startsWith('r'));
-            };
-
-            let activeOutputs = mapOutToR(currentOutputsStr);
-            if (activeOutputs.includes(relay)) activeOutputs = activeOutputs.filter(r => r !== relay);
-            else activeOutputs.push(relay);
-
-            const sorted = activeOutputs.sort();
-            const mapRToOut = (rFormatList) => {
-                return rFormatList.map(r => {
-                    const num = parseInt(r.replace('r', ''));
-                    return `OUT \${String(num).padStart(2, '0')}`;
-                });
-            };
-
-            currentVal[nestedKey] = mapRToOut(sorted).join(',');
-            await saveAttribute(assetId, attrName, currentVal);
-        }
+        const current = currentTimer(assetId, attrName);
+        if (!current) return;
+        await saveTimerKeys(assetId, attrName, { [nestedKey]: nextTimerOutputs(current[nestedKey], relay) }, true);
     } catch (e) { console.error(e); }
 }
 
 
-async function saveAttribute(assetId, attrName, value) {
-    const res = await fetch(`/api/asset/${assetId}/attribute/${attrName}`, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ value: value })
-    });
-    const data = await res.json();
-    if (data.status === 'success') {
-        toast('Updated');
-        loadTimers();
-    } else {
-        toast('Failed to update');
-    }
-}
-
-
 let currentPickerTarget = null;
 function openWheelPicker(e, assetId, attrName, nestedKey, currentVal, maxVal) {
     e.stopPropagation();